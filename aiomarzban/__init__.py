@@ -1,13 +1,111 @@
-from .api import MarzbanAPI
-from .enums import UserStatus, UserDataLimitResetStrategy, NodeStatus, ProxyHostALPN, ProxyTypes, ProxyHostSecurity, \
-    ProxyHostFingerprint
-from .models import Admin, CoreStats, NextPlanModel, NodeResponse, NodeSettings, UserResponse, ProxyHost, ProxyInbound, \
-    SubscriptionUserResponse, SystemStats, UserTemplateResponse, UserUsageResponse, UserUsagesResponse, UsersResponse, \
-    UsersUsagesResponse, UserStatusCreate, UserStatusModify
+import importlib
+
+# Same as typing.TYPE_CHECKING (recognized by type checkers), without importing typing
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from .api import MarzbanAPI
+    from .buffer import UserWriteBuffer
+    from .cache import SubscriptionCache
+    from .cluster import MarzbanCluster, ClusterResult
+    from .enums import UserStatus, UserDataLimitResetStrategy, NodeStatus, ProxyHostALPN, ProxyTypes, ProxyHostSecurity, \
+        ProxyHostFingerprint
+    from .exceptions import MarzbanException, MarzbanNotFoundException, MarzbanClusterException
+    from .journal import BulkJob, JobJournal, JobProgress
+    from .links import LinkGenerator
+    from .locks import KeyedLock
+    from .metrics import MetricsRegistry, RouteMetrics
+    from .middleware import Middleware
+    from .models import Admin, CoreStats, NextPlanModel, NodeResponse, NodeSettings, UserResponse, ProxyHost, ProxyInbound, \
+        SubscriptionUserResponse, SubscriptionContent, SystemStats, UserTemplateResponse, UserUsageResponse, UserUsagesResponse, UsersResponse, \
+        UsersUsagesResponse, UserStatusCreate, UserStatusModify
+    from .profiling import Profiler
+    from .reconcile import Reconciler, ReconcilePlan, UserSpec
+    from .recording import RecordingMiddleware, ReplayReport, replay
+    from .sharding import ShardedMarzbanAPI, HashRing, UserMove
+    from .snapshot import Snapshot, SnapshotWriter, take_snapshot
+    from .supervisor import NodeSupervisor, NodeStateEvent, NodeRecoveryStats
+    from .sync import SyncMarzbanAPI
+    from .timeseries import NodeTrafficCollector, TrafficSeries, TrafficRingBuffer
+    from .transport import Request, Response, Transport, AiohttpTransport, HttpxTransport
+    from .watcher import QuotaWatcher, QuotaAlert
+
+# Public name -> module. Modules are imported on first access, so that `import aiomarzban` doesn't import
+# aiohttp and pydantic (see benchmarks/imports.py).
+_LAZY = {
+    "MarzbanAPI": "api",
+    "UserWriteBuffer": "buffer",
+    "SubscriptionCache": "cache",
+    "MarzbanCluster": "cluster",
+    "ClusterResult": "cluster",
+    "UserStatus": "enums",
+    "UserDataLimitResetStrategy": "enums",
+    "NodeStatus": "enums",
+    "ProxyHostALPN": "enums",
+    "ProxyTypes": "enums",
+    "ProxyHostSecurity": "enums",
+    "ProxyHostFingerprint": "enums",
+    "UserStatusCreate": "enums",
+    "UserStatusModify": "enums",
+    "MarzbanException": "exceptions",
+    "MarzbanNotFoundException": "exceptions",
+    "MarzbanClusterException": "exceptions",
+    "BulkJob": "journal",
+    "JobJournal": "journal",
+    "JobProgress": "journal",
+    "LinkGenerator": "links",
+    "KeyedLock": "locks",
+    "MetricsRegistry": "metrics",
+    "RouteMetrics": "metrics",
+    "Middleware": "middleware",
+    "Admin": "models",
+    "CoreStats": "models",
+    "NextPlanModel": "models",
+    "NodeResponse": "models",
+    "NodeSettings": "models",
+    "UserResponse": "models",
+    "ProxyHost": "models",
+    "ProxyInbound": "models",
+    "SubscriptionUserResponse": "models",
+    "SubscriptionContent": "models",
+    "SystemStats": "models",
+    "UserTemplateResponse": "models",
+    "UserUsageResponse": "models",
+    "UserUsagesResponse": "models",
+    "UsersResponse": "models",
+    "UsersUsagesResponse": "models",
+    "Profiler": "profiling",
+    "Reconciler": "reconcile",
+    "ReconcilePlan": "reconcile",
+    "UserSpec": "reconcile",
+    "RecordingMiddleware": "recording",
+    "ReplayReport": "recording",
+    "replay": "recording",
+    "ShardedMarzbanAPI": "sharding",
+    "HashRing": "sharding",
+    "UserMove": "sharding",
+    "Snapshot": "snapshot",
+    "SnapshotWriter": "snapshot",
+    "take_snapshot": "snapshot",
+    "NodeSupervisor": "supervisor",
+    "NodeStateEvent": "supervisor",
+    "NodeRecoveryStats": "supervisor",
+    "SyncMarzbanAPI": "sync",
+    "NodeTrafficCollector": "timeseries",
+    "TrafficSeries": "timeseries",
+    "TrafficRingBuffer": "timeseries",
+    "Request": "transport",
+    "Response": "transport",
+    "Transport": "transport",
+    "AiohttpTransport": "transport",
+    "HttpxTransport": "transport",
+    "QuotaWatcher": "watcher",
+    "QuotaAlert": "watcher",
+}
 
 __all__ = (
     "__version__",
     "MarzbanAPI",
+    "SyncMarzbanAPI",
     "Admin",
     "CoreStats",
     "NextPlanModel",
@@ -17,6 +115,7 @@ __all__ = (
     "ProxyHost",
     "ProxyInbound",
     "SubscriptionUserResponse",
+    "SubscriptionContent",
     "SystemStats",
     "UserTemplateResponse",
     "UserUsageResponse",
@@ -32,6 +131,60 @@ __all__ = (
     "ProxyHostFingerprint",
     "UserStatusCreate",
     "UserStatusModify",
+    "NodeTrafficCollector",
+    "TrafficSeries",
+    "TrafficRingBuffer",
+    "NodeSupervisor",
+    "NodeStateEvent",
+    "NodeRecoveryStats",
+    "MarzbanCluster",
+    "ClusterResult",
+    "MarzbanException",
+    "MarzbanNotFoundException",
+    "MarzbanClusterException",
+    "ShardedMarzbanAPI",
+    "HashRing",
+    "UserMove",
+    "SubscriptionCache",
+    "UserWriteBuffer",
+    "KeyedLock",
+    "BulkJob",
+    "JobJournal",
+    "JobProgress",
+    "LinkGenerator",
+    "MetricsRegistry",
+    "RouteMetrics",
+    "Middleware",
+    "Request",
+    "Response",
+    "Transport",
+    "AiohttpTransport",
+    "HttpxTransport",
+    "Profiler",
+    "RecordingMiddleware",
+    "ReplayReport",
+    "replay",
+    "Snapshot",
+    "SnapshotWriter",
+    "take_snapshot",
+    "Reconciler",
+    "ReconcilePlan",
+    "UserSpec",
+    "QuotaWatcher",
+    "QuotaAlert",
 )
 
 __version__ = "1.0.3"
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
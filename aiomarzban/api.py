@@ -1,22 +1,58 @@
+import asyncio
 import copy
 import datetime
+import inspect
+import json
+import secrets
+import time
 from asyncio.exceptions import TimeoutError
+from functools import partial
 from http import HTTPStatus
-from typing import Optional, List, Any, Dict, Union
+from urllib.parse import urlencode
+from typing import Optional, List, Any, Dict, Union, Callable, Awaitable, Iterable
 
 import aiohttp
 from aiohttp.client_exceptions import ClientConnectorError
 
+from .cache import SubscriptionCache
 from .enums import UserDataLimitResetStrategy, Methods
 from .exceptions import MarzbanException, MarzbanNotFoundException
+from .locks import KeyedLock
+from .metrics import MetricsRegistry, route_template
+from .middleware import Middleware, build_chain
 from .models import Admin, AdminCreate, AdminModify, CoreStats, NodeCreate, NodeModify, NodeResponse, NodeSettings, \
     NodeStatus, NodesUsageResponse, SubscriptionUserResponse, SystemStats, ProxyInbound, ProxyHost, \
     UserTemplateResponse, UserTemplateCreate, UserTemplateModify, NextPlanModel, UserStatusCreate, UserCreate, \
     UserModify, UserResponse, UserStatusModify, UserStatus, UsersResponse, UserUsageResponse, UsersUsagesResponse, \
     SetOwner, OffsetLimitUsernameParams, StartEndParams, GetUsersParams, ExpiredBeforeAfterParams, StartEndAdminParams, \
-    AdminTokenPost, AdminTokenAnswer
+    AdminTokenPost, AdminTokenAnswer, SubscriptionContent
+from .profiling import Profiler
+from .transport import Request, Response, Transport, TransportConnectError, aiohttp_send
 from .utils import future_unix_time, gb_to_bytes, current_unix_utc_time, unix_time_delta
 
+# Response headers of subscription routes which clients rely on.
+SUBSCRIPTION_HEADERS = (
+    "content-type",
+    "content-disposition",
+    "profile-title",
+    "profile-update-interval",
+    "profile-web-page-url",
+    "subscription-userinfo",
+    "support-url",
+    "announce",
+    "routing",
+)
+
+
+class _StreamInterrupted(Exception):
+    """
+    Carries an error raised after a streamed body started, so that `_request` doesn't repeat the request.
+    """
+
+    def __init__(self, error: BaseException):
+        super().__init__(error)
+        self.error = error
+
 
 class MarzbanAPI:
     def __init__(
@@ -49,6 +85,12 @@ class MarzbanAPI:
         timeout: Optional[int] = 10,
         retries: Optional[int] = 1,
         use_single_session: Optional[bool] = False,
+        session: Optional[aiohttp.ClientSession] = None,
+        subscription_cache: Optional[SubscriptionCache] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        middlewares: Optional[List[Middleware]] = None,
+        profiler: Optional[Profiler] = None,
+        transport: Optional[Transport] = None,
     ):
         """
         Provide password, username and password to create api client.
@@ -75,9 +117,19 @@ class MarzbanAPI:
         :param timeout: Default timeout in seconds.
         :param retries: Default number of retries (after first unsuccessful request).
         :param use_single_session: If true, don't forget to close the session before stopping program with .close().
+        :param session: External `aiohttp.ClientSession` to send requests with (e.g. shared between clients).
+        It is not closed by .close().
+        :param subscription_cache: Cache for subscription responses. Cached responses of a user are dropped
+        when the user is modified, revoked or removed through this client.
+        :param metrics: Registry to record per-route request metrics in. Metrics are not collected if not specified.
+        :param middlewares: Middlewares wrapping every HTTP request, in order. See `Middleware`.
+        :param profiler: Profiler attributing time of every call to network, decoding and validation phases.
+        :param transport: Backend sending requests, e.g. `HttpxTransport` for HTTP/2. If not specified,
+        aiohttp sessions are used according to `session` and `use_single_session`. It is not closed by .close().
         """
         self.address = address
         self.api_url = address + "api"
+        self.sub_url = address.rstrip("/")
         self.username = str(username)
         self.password = str(password)
         self.sub_path = sub_path
@@ -109,6 +161,60 @@ class MarzbanAPI:
         # Request settings
         self.timeout = timeout
         self.retries = retries
+        self.use_single_session = use_single_session
+        self.session = session
+        self._own_session = session is None
+        self.subscription_cache = subscription_cache
+        self.metrics = metrics
+        self.middlewares: List[Middleware] = list(middlewares or [])
+        self.profiler = profiler
+        self.transport = transport
+        # Serialises read-modify-write helpers (update_user, user_add_days, ...) per username
+        self.user_locks = KeyedLock()
+        # Concurrent requests without a valid token share one login (created on first use, on the running loop)
+        self._login_lock: Optional[asyncio.Lock] = None
+        # Templates resolved by add_users_from_template, by id and by name
+        self._templates: Dict[Any, UserTemplateResponse] = {}
+        if profiler is not None:
+            profiler.instrument(self)
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        if self.profiler is not None:
+            return aiohttp.ClientSession(trace_configs=[self.profiler.trace_config])
+        return aiohttp.ClientSession()
+
+    def _get_session(self) -> Optional[aiohttp.ClientSession]:
+        if self.session is None and self.use_single_session:
+            self.session = self._new_session()
+        return self.session
+
+    def add_middleware(self, middleware: Middleware) -> None:
+        """
+        Append middleware to the end of the chain (closest to the network).
+        """
+        self.middlewares.append(middleware)
+
+    def _route(self, path: str, api_url: Optional[str]) -> str:
+        return route_template(path, self.sub_path if api_url == self.sub_url else None)
+
+    @staticmethod
+    def _body_size(data: Optional[dict], not_json_data: Optional[dict]) -> int:
+        if data is not None:
+            return len(json.dumps(data).encode())
+        if not_json_data is not None:
+            return len(urlencode(not_json_data).encode())
+        return 0
+
+    def _observe_request(self, request: Request, response: Optional[Response], started: float) -> None:
+        self.metrics.observe_request(
+            request.method,
+            request.route,
+            str(response.status) if response is not None else "error",
+            time.perf_counter() - started,
+            bytes_sent=self._body_size(request.json, request.data) if response is None or response.sent is None
+            else response.sent,
+            bytes_received=response.size if response is not None else 0,
+        )
 
     async def _async_request(
         self,
@@ -121,41 +227,112 @@ class MarzbanAPI:
         api_url: Optional[str] = None,
         timeout: Optional[int] = None,
         allow_empty_headers: Optional[bool] = False,
-    ) -> Union[dict, int, list, None]:
+        handler: Optional[Callable[[Response], Awaitable[Any]]] = None,
+    ) -> Any:
         """Async requests to server via HTTP."""
 
         if headers is None and self.headers is None and not allow_empty_headers:
             await self.refresh_credentials()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.request(
-                method,
-                url=(api_url or self.api_url) + path,
-                json=data,
-                data=not_json_data,
-                headers=headers or self.headers,
-                params=params,
-                ssl=False,
-                timeout=timeout or self.timeout,
-            ) as resp:
-                ans = await resp.json()
-                if HTTPStatus.OK <= resp.status <= HTTPStatus.IM_USED:
-                    return ans
-
-                elif resp.status == HTTPStatus.UNAUTHORIZED:
-                    error = ans.get("detail")
-                    if error == "Could not validate credentials":
-                        await self.refresh_credentials()
-                        return await self._async_request(method, path, data=data)
-                    elif error == "Incorrect username or password":
-                        raise MarzbanException(error)
-                    raise MarzbanException(f"Auth error: {error}")
-
-                elif resp.status == HTTPStatus.NOT_FOUND:
-                    raise MarzbanNotFoundException(await resp.text())
+        if self.transport is not None:
+            return await self._send_request(
+                self.transport.send, method, path, data, not_json_data, params, headers, api_url, timeout, handler,
+            )
+        session = self._get_session()
+        if session is None:
+            async with self._new_session() as session:
+                return await self._send_request(
+                    partial(aiohttp_send, session),
+                    method, path, data, not_json_data, params, headers, api_url, timeout, handler,
+                )
+        return await self._send_request(
+            partial(aiohttp_send, session),
+            method, path, data, not_json_data, params, headers, api_url, timeout, handler,
+        )
 
-                else:
-                    raise Exception(f"Error: {resp.status}; Body: {await resp.text()}; Data: {data}")
+    async def _send_request(
+        self,
+        send: Callable[[Request], Awaitable[Response]],
+        method: str,
+        path: str,
+        data: Optional[dict] = None,
+        not_json_data: Optional[dict] = None,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        api_url: Optional[str] = None,
+        timeout: Optional[int] = None,
+        handler: Optional[Callable[[Response], Awaitable[Any]]] = None,
+    ) -> Any:
+        method = getattr(method, "value", method)
+        request = Request(
+            method,
+            url=(api_url or self.api_url) + path,
+            path=path,
+            json=data,
+            data=not_json_data,
+            params=params,
+            headers=dict(headers or self.headers or {}),
+            timeout=timeout or self.timeout,
+            handler=handler,
+            sub_path=self.sub_path if api_url == self.sub_url else None,
+        )
+        started = time.perf_counter() if self.metrics is not None else 0.0
+        trace = None
+        if self.profiler is not None:
+            trace = request.extensions["trace_request_ctx"] = self.profiler.start_request(method, request.route)
+        response = None
+        try:
+            if self.middlewares:
+                response = await build_chain(self.middlewares, send)(request)
+            else:
+                response = await send(request)
+        finally:
+            if self.metrics is not None:
+                self._observe_request(request, response, started)
+        if trace is not None:
+            self.profiler.end_request(trace)
+
+        if HTTPStatus.OK <= response.status <= HTTPStatus.IM_USED:
+            if handler is None:
+                if trace is None:
+                    return response.json()
+                decode_started = time.perf_counter()
+                ans = response.json()
+                self.profiler.add(trace.stack, "decode", time.perf_counter() - decode_started)
+                return ans
+            if response.handled:
+                return response.result
+            # Response was made by a middleware
+            return await handler(response)
+
+        elif response.status == HTTPStatus.UNAUTHORIZED:
+            error = response.json().get("detail")
+            if error == "Incorrect username or password":
+                raise MarzbanException(error)
+            elif error != "Could not validate credentials":
+                raise MarzbanException(f"Auth error: {error}")
+
+        elif response.status == HTTPStatus.NOT_FOUND:
+            raise MarzbanNotFoundException(response.text())
+
+        else:
+            raise Exception(f"Error: {response.status}; Body: {response.text()}; Data: {data}")
+
+        # Access token expired: log in again and repeat the request
+        if self.metrics is not None:
+            self.metrics.observe_retry(method, request.route, "unauthorized")
+        await self.refresh_credentials()
+        return await self._async_request(
+            method=method,
+            path=path,
+            data=data,
+            not_json_data=not_json_data,
+            params=params,
+            headers=headers,
+            api_url=api_url,
+            timeout=timeout,
+            handler=handler,
+        )
 
     async def _request(
         self,
@@ -168,36 +345,74 @@ class MarzbanAPI:
         api_url: Optional[str] = None,
         timeout: Optional[int] = None,
         allow_empty_headers: Optional[bool] = False,
+        handler: Optional[Callable[[Response], Awaitable[Any]]] = None,
     ):
-        """Send request with retries."""
-
-        for attempt in range(self.retries + 1):
-            try:
-                return await self._async_request(
-                    method=method,
-                    path=path,
-                    data=data,
-                    not_json_data=not_json_data,
-                    params=params,
-                    headers=headers,
-                    api_url=api_url,
-                    timeout=timeout,
-                    allow_empty_headers=allow_empty_headers,
-                )
-            except (ClientConnectorError, TimeoutError) as e:
-                if attempt < self.retries:
-                    continue
-                else:
-                    raise e
+        """
+        Send request with retries.
+        Successful responses are decoded from JSON, or passed to `handler` if it is provided.
+        """
+        counted = self.profiler.enter() if self.profiler is not None else False
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.retries + 1):
+                attempt_started = time.perf_counter()
+                try:
+                    return await self._async_request(
+                        method=method,
+                        path=path,
+                        data=data,
+                        not_json_data=not_json_data,
+                        params=params,
+                        headers=headers,
+                        api_url=api_url,
+                        timeout=timeout,
+                        allow_empty_headers=allow_empty_headers,
+                        handler=handler,
+                    )
+                except (ClientConnectorError, TransportConnectError, TimeoutError) as e:
+                    if attempt < self.retries:
+                        route = self._route(path, api_url)
+                        if self.metrics is not None:
+                            self.metrics.observe_retry(getattr(method, "value", method), route, type(e).__name__)
+                        if self.profiler is not None:
+                            self.profiler.add(
+                                self.profiler.current_stack() + (f"{getattr(method, 'value', method)} {route}",),
+                                "retry",
+                                time.perf_counter() - attempt_started,
+                            )
+                        continue
+                    else:
+                        raise e
+        finally:
+            if self.profiler is not None:
+                self.profiler.exit(None, counted, time.perf_counter() - started)
 
 # ADMIN
 
     async def refresh_credentials(self) -> None:
-        resp = await self._request(
-            Methods.POST, "/admin/token",
-            not_json_data=self.token_data.model_dump(exclude_none=True),
-            allow_empty_headers=True,
-        )
+        headers = self.headers
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            if self.headers is not headers:
+                # Logged in by another request while this one waited
+                return
+            await self._login()
+
+    async def _login(self) -> None:
+        started = time.perf_counter()
+        try:
+            resp = await self._request(
+                Methods.POST, "/admin/token",
+                not_json_data=self.token_data.model_dump(exclude_none=True),
+                allow_empty_headers=True,
+            )
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.observe_token_refresh(time.perf_counter() - started, error=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.observe_token_refresh(time.perf_counter() - started)
         resp = AdminTokenAnswer(**resp)
         self.headers = {
             "Accept": "application/json",
@@ -354,31 +569,154 @@ class MarzbanAPI:
         end: Optional[str] = "",
     ) -> NodesUsageResponse:
         params = StartEndParams(start=start, end=end)
-        resp = await self._request(Methods.GET, "nodes/usage", params=params.model_dump(exclude_none=True))
+        resp = await self._request(Methods.GET, "/nodes/usage", params=params.model_dump(exclude_none=True))
         return NodesUsageResponse(**resp)
 
 # SUBSCRIPTION
 
-    async def user_subscription(self, token: str, user_agent: Optional[str] = "") -> Any:
-        headers = {"user-agent": user_agent}
-        return await self._request(Methods.GET, f"/{self.sub_path}/{token}", headers=headers)
+    async def _cached_subscription(self, token: str, kind: str, user_agent: Optional[str], loader) -> Any:
+        if self.subscription_cache is None:
+            return await loader()
+        return await self.subscription_cache.get(token, kind, user_agent, loader)
+
+    def _invalidate_subscription(self, username: Any) -> None:
+        if self.subscription_cache is not None:
+            self.subscription_cache.invalidate_user(username)
+
+    @staticmethod
+    def _subscription_content(resp: Response, body: bytes = b"") -> SubscriptionContent:
+        return SubscriptionContent(
+            body=body,
+            headers={name: resp.headers[name] for name in SUBSCRIPTION_HEADERS if name in resp.headers},
+            status=resp.status,
+        )
+
+    async def _read_subscription(self, resp: Response) -> SubscriptionContent:
+        return self._subscription_content(resp, await resp.read())
+
+    def _subscription_path(self, token: str, kind: Optional[str] = "") -> str:
+        return f"/{self.sub_path}/{token}/{kind}" if kind else f"/{self.sub_path}/{token}"
+
+    async def _fetch_subscription(
+        self,
+        token: str,
+        kind: Optional[str] = "",
+        user_agent: Optional[str] = "",
+    ) -> SubscriptionContent:
+        """
+        Request subscription route as is: body bytes and subscription headers.
+
+        :param token: Subscription token.
+        :param kind: "" for the default subscription, "info" or client type.
+        :param user_agent: User agent of the subscription client.
+        """
+        return await self._request(
+            Methods.GET, self._subscription_path(token, kind),
+            headers={"user-agent": user_agent or ""},
+            api_url=self.sub_url,
+            handler=self._read_subscription,
+        )
+
+    async def user_subscription(
+        self,
+        token: str,
+        user_agent: Optional[str] = "",
+        raw: Optional[bool] = False,
+    ) -> Union[str, dict, SubscriptionContent]:
+        """
+        Returns subscription in the format chosen by the panel for the user agent.
+
+        :param token: Subscription token.
+        :param user_agent: User agent of the subscription client.
+        :param raw: Return `SubscriptionContent` with body bytes and subscription headers
+        instead of the decoded body (text, or dict for JSON configs).
+        """
+        content = await self._cached_subscription(
+            token, "", user_agent, lambda: self._fetch_subscription(token, "", user_agent),
+        )
+        return content if raw else content.decode()
 
     async def user_subscription_info(self, token: str) -> SubscriptionUserResponse:
-        resp = await self._request(Methods.GET, f"/{self.sub_path}/{token}/info")
-        return SubscriptionUserResponse(**resp)
+        content = await self._cached_subscription(
+            token, "info", "", lambda: self._fetch_subscription(token, "info"),
+        )
+        return SubscriptionUserResponse(**content.decode())
 
     async def user_get_usage(self, token: str, start: Optional[str] = "", end: Optional[str] = "") -> Any:
         params = StartEndParams(start=start, end=end)
-        return await self._request(Methods.GET, f"/{self.sub_path}/{token}/usage", params=params.model_dump(exclude_none=True))
+        return await self._request(
+            Methods.GET, f"/{self.sub_path}/{token}/usage",
+            params=params.model_dump(exclude_none=True),
+            api_url=self.sub_url,
+            allow_empty_headers=True,
+        )
 
     async def user_subscription_with_client_type(
         self,
         client_type: str,
         token: str,
         user_agent: Optional[str] = "",
-    ) -> Any:
-        headers = {"user-agent": user_agent}
-        return await self._request(Methods.GET, f"{self.sub_path}/{token}/{client_type}", headers=headers)
+        raw: Optional[bool] = False,
+    ) -> Union[str, dict, SubscriptionContent]:
+        """
+        Returns subscription for the client type (sing-box, clash-meta, clash, outline, v2ray, v2ray-json).
+
+        :param raw: Return `SubscriptionContent` instead of the decoded body.
+        """
+        content = await self._cached_subscription(
+            token, client_type, user_agent, lambda: self._fetch_subscription(token, client_type, user_agent),
+        )
+        return content if raw else content.decode()
+
+    async def stream_subscription(
+        self,
+        token: str,
+        writer: Any,
+        client_type: Optional[str] = "",
+        user_agent: Optional[str] = "",
+        on_headers: Optional[Callable[[SubscriptionContent], Any]] = None,
+        chunk_size: Optional[int] = 64 * 1024,
+        timeout: Optional[int] = None,
+    ) -> SubscriptionContent:
+        """
+        Writes subscription body into `writer` chunk by chunk without buffering the whole config.
+        The subscription cache is not used. The request is retried only until the response headers arrive:
+        errors after `on_headers` was called are raised, because part of the body may already be written.
+
+        :param token: Subscription token.
+        :param writer: Object with async `write(bytes)` method, e.g. `aiohttp.web.StreamResponse`.
+        :param client_type: Client type or "" for the default subscription.
+        :param user_agent: User agent of the subscription client.
+        :param on_headers: Sync or async callback called with status and headers (empty body)
+        before the first chunk is written. Use it to prepare the stream response.
+        :param chunk_size: Maximal chunk size in bytes.
+        :param timeout: Total timeout in seconds, including streaming of the body (so including slow writers).
+        Default: timeout of the client.
+        :return: `SubscriptionContent` with status and headers, body is empty.
+        """
+        async def handler(resp: Response) -> SubscriptionContent:
+            content = self._subscription_content(resp)
+            try:
+                if on_headers is not None:
+                    result = on_headers(content)
+                    if inspect.isawaitable(result):
+                        await result
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    await writer.write(chunk)
+            except (ClientConnectorError, TransportConnectError, TimeoutError) as e:
+                raise _StreamInterrupted(e) from e
+            return content
+
+        try:
+            return await self._request(
+                Methods.GET, self._subscription_path(token, client_type),
+                headers={"user-agent": user_agent or ""},
+                api_url=self.sub_url,
+                timeout=timeout,
+                handler=handler,
+            )
+        except _StreamInterrupted as e:
+            raise e.error from None
 
 # SYSTEM
 
@@ -415,6 +753,7 @@ class MarzbanAPI:
             inbounds=inbounds or {},
         )
         resp = await self._request(Methods.POST, "/user_template", data=data.model_dump())
+        self._templates.clear()
         return UserTemplateResponse(**resp)
 
     async def get_user_templates(self) -> List[UserTemplateResponse]:
@@ -444,11 +783,98 @@ class MarzbanAPI:
             inbounds=inbounds or dict(),
         )
         resp = await self._request(Methods.PUT, f"/user_template/{template_id}", data=data.model_dump(exclude_none=True))
+        self._templates.clear()
         return UserTemplateResponse(**resp)
 
     async def remove_user_template(self, template_id) -> None:
+        self._templates.clear()
         return await self._request(Methods.DELETE, f"/user_template/{template_id}")
 
+    async def resolve_user_template(self, template: Union[int, str], refresh: bool = False) -> UserTemplateResponse:
+        """
+        Returns the template by id or name. Templates are cached until they are added, modified or removed
+        through this client (or `refresh` is set).
+
+        :param template: Template id or name.
+        :param refresh: Fetch templates again.
+        :return: `UserTemplateResponse`
+        """
+        if refresh:
+            self._templates.clear()
+        cached = self._templates.get(template)
+        if cached is not None:
+            return cached
+        if isinstance(template, int):
+            resolved = await self.get_user_template(template)
+            self._templates[resolved.id] = self._templates[resolved.name] = resolved
+            return resolved
+        for resolved in await self.get_user_templates():
+            self._templates[resolved.id] = self._templates[resolved.name] = resolved
+        if template not in self._templates:
+            raise MarzbanNotFoundException(f"User template {template!r} not found")
+        return self._templates[template]
+
+    async def add_users_from_template(
+        self,
+        template: Union[int, str],
+        usernames: Union[int, Iterable[Any]],
+        proxies: Optional[Dict[str, Any]] = None,
+        note: Optional[str] = None,
+        on_hold: bool = False,
+        concurrency: int = 10,
+        return_exceptions: bool = False,
+    ) -> List[Union[UserResponse, Exception]]:
+        """
+        Creates users from a user template: usernames get the template prefix and suffix,
+        data limit and inbounds are taken from the template and expire is calculated from its expire duration.
+
+        :param template: Template id or name (resolved once and cached, see `resolve_user_template`).
+        :param usernames: Usernames without prefix and suffix, or number of users to create with random names.
+        :param proxies: Proxies of the users. By default, `default_proxies` plus protocols of the template inbounds.
+        :param note: Note of the users.
+        :param on_hold: Create users on hold: the expire duration starts on first connection.
+        :param concurrency: Maximum number of `add_user` requests in flight.
+        :param return_exceptions: Put exceptions of failed users in the result instead of raising the first one.
+        Users created before an error stay on the panel either way.
+        :return: List of `UserResponse` in the order of usernames.
+        """
+        resolved = await self.resolve_user_template(template)
+        if isinstance(usernames, int):
+            names = set()
+            while len(names) < usernames:
+                names.add(secrets.token_hex(4))
+            usernames = list(names)
+        prefix, suffix = resolved.username_prefix or "", resolved.username_suffix or ""
+        inbounds = resolved.inbounds or self.default_inbounds
+        if proxies is None:
+            proxies = {**{protocol: {} for protocol in inbounds}, **self.default_proxies}
+        expire_duration = resolved.expire_duration or None
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def add(username: Any) -> UserResponse:
+            async with semaphore:
+                data = UserCreate(
+                    username=f"{prefix}{username}{suffix}",
+                    proxies=proxies,
+                    data_limit=resolved.data_limit,
+                    inbounds=inbounds,
+                    note=note,
+                    data_limit_reset_strategy=self.default_data_limit_reset_strategy,
+                    # Calculated per user, so that late users of a long batch don't lose time
+                    expire=None if on_hold or not expire_duration else current_unix_utc_time() + expire_duration,
+                    on_hold_expire_duration=expire_duration if on_hold else None,
+                    status=UserStatusCreate.on_hold if on_hold else UserStatusCreate.active,
+                )
+                return await self._add_user(data)
+
+        results = await asyncio.gather(*(add(username) for username in usernames), return_exceptions=True)
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
 # USER
 
     async def add_user(
@@ -518,6 +944,9 @@ class MarzbanAPI:
             status=status or self.default_status,
         )
 
+        return await self._add_user(data)
+
+    async def _add_user(self, data: UserCreate) -> UserResponse:
         resp = await self._request(Methods.POST, "/user", data=data.model_dump())
         return UserResponse(**resp)
 
@@ -559,18 +988,26 @@ class MarzbanAPI:
             next_plan=next_plan,
             status=status,
         )
-        resp = await self._request(Methods.PUT, f"/user/{username}", data=data.model_dump(exclude_none=True))
+        return await self._modify_user(username, data.model_dump(exclude_none=True))
+
+    async def _modify_user(self, username: Any, data: dict) -> UserResponse:
+        resp = await self._request(Methods.PUT, f"/user/{username}", data=data)
+        self._invalidate_subscription(username)
         return UserResponse(**resp)
 
     async def remove_user(self, username: Any) -> None:
-        return await self._request(Methods.DELETE, f"/user/{username}")
+        resp = await self._request(Methods.DELETE, f"/user/{username}")
+        self._invalidate_subscription(username)
+        return resp
 
     async def reset_user_usage_data(self, username: Any) -> UserResponse:
         resp = await self._request(Methods.POST, f"/user/{username}/reset")
+        self._invalidate_subscription(username)
         return UserResponse(**resp)
 
     async def revoke_user_subscription(self, username: Any) -> UserResponse:
         resp = await self._request(Methods.POST, f"/user/{username}/revoke_sub")
+        self._invalidate_subscription(username)
         return UserResponse(**resp)
 
     async def get_users(
@@ -612,6 +1049,7 @@ class MarzbanAPI:
 
     async def active_next_plan(self, username: Any) -> UserResponse:
         resp = await self._request(Methods.POST, f"/user/{username}/active-next")
+        self._invalidate_subscription(username)
         return UserResponse(**resp)
 
     async def get_users_usage(
@@ -657,8 +1095,30 @@ class MarzbanAPI:
 
 # SESSION
 
+    def attach_session(self, session: aiohttp.ClientSession) -> None:
+        """
+        Send requests through an external session, e.g. one shared by several clients. It is not closed by .close().
+        """
+        self.session = session
+        self._own_session = False
+
+    def detach_session(self) -> Optional[aiohttp.ClientSession]:
+        """
+        Stop using the external session, the client creates its own session again when needed.
+
+        :return: The detached session, None if the client uses its own session.
+        """
+        if self._own_session:
+            return None
+        session = self.session
+        self.session = None
+        self._own_session = True
+        return session
+
     async def close(self) -> None:
-        return
+        if self.session is not None and self._own_session:
+            await self.session.close()
+            self.session = None
 
 # EXTRA (not default methods)
 
@@ -708,6 +1168,31 @@ class MarzbanAPI:
                 status=status,
             )
 
+    async def update_user(
+        self,
+        username: Any,
+        fn: Callable[[UserResponse], Union[Optional[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]],
+    ) -> UserResponse:
+        """
+        Read-modify-write of a user. Updates of the same user through this client run one at a time,
+        so concurrent updates are not lost; updates of different users run in parallel.
+        Don't call other update helpers for the same user from `fn`, locks are not reentrant.
+
+        :param username: User username.
+        :param fn: Sync or async function receiving the current user and returning keyword arguments
+        of `modify_user` (e.g. {"expire": ..., "data_limit": 10}), or None to leave the user unchanged.
+        :return: `UserResponse`
+        """
+        username = str(username)
+        async with self.user_locks(username):
+            user = await self.get_user(username)
+            changes = fn(user)
+            if inspect.isawaitable(changes):
+                changes = await changes
+            if not changes:
+                return user
+            return await self.modify_user(username, **changes)
+
     async def user_add_days(self, username: Any, days: int) -> UserResponse:
         """
         Adds days to users subscription. If the user's subscription has expired,
@@ -717,36 +1202,40 @@ class MarzbanAPI:
         :param days: Amount of days to add to subscription.
         :return: `UserResponse`
         """
-        old_user = await self.get_user(username)
-        if old_user.expire == 0 or old_user.expire is None:
-            return old_user
-        elif old_user.expire < current_unix_utc_time():
-            new_time = future_unix_time(days=days)
-        else:
-            new_time = old_user.expire + unix_time_delta(days=days)
-        return await self.modify_user(str(username), expire=new_time)
+        def add_days(old_user: UserResponse) -> Optional[dict]:
+            if old_user.expire == 0 or old_user.expire is None:
+                return None
+            elif old_user.expire < current_unix_utc_time():
+                new_time = future_unix_time(days=days)
+            else:
+                new_time = old_user.expire + unix_time_delta(days=days)
+            return {"expire": new_time}
+
+        return await self.update_user(username, add_days)
 
     async def user_set_all_inbounds(self, user: UserResponse) -> UserResponse:
         """
         Allows absolutely all inbounds to the user.
 
-        :param user: The user who needs to be given inbounds.
+        :param user: The user who needs to be given inbounds. Current inbounds are read from the panel.
         :return: `UserResponse`
         """
-        old_inbounds = user.inbounds
-        inbounds = copy.deepcopy(old_inbounds)
-        excluded_inbounds = user.excluded_inbounds
-
-        for inbound in excluded_inbounds:
-            if inbound in inbounds:
-                inbounds[inbound].extend(excluded_inbounds[inbound])
-            else:
-                inbounds[inbound] = excluded_inbounds[inbound]
+        def set_all_inbounds(current: UserResponse) -> Optional[dict]:
+            old_inbounds = current.inbounds
+            inbounds = copy.deepcopy(old_inbounds)
+            excluded_inbounds = current.excluded_inbounds
+
+            for inbound in excluded_inbounds:
+                if inbound in inbounds:
+                    inbounds[inbound].extend(excluded_inbounds[inbound])
+                else:
+                    inbounds[inbound] = excluded_inbounds[inbound]
 
-        if old_inbounds == inbounds:
-            return user
+            if old_inbounds == inbounds:
+                return None
+            return {"inbounds": inbounds}
 
-        return await self.modify_user(user.username, inbounds=inbounds)
+        return await self.update_user(user.username, set_all_inbounds)
 
     async def get_online_users(self) -> UsersResponse:
         """
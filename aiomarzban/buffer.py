@@ -0,0 +1,179 @@
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+from pydantic import BaseModel
+
+from .enums import UserDataLimitResetStrategy
+from .models import NextPlanModel, UserModify, UserResponse, UserStatusModify
+from .utils import gb_to_bytes
+
+
+class _PendingWrite:
+    __slots__ = ("patch", "futures", "timer")
+
+    def __init__(self):
+        self.patch: Dict[str, Any] = {}
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.Task] = None
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    return value
+
+
+class UserWriteBuffer:
+    """
+    Write-behind buffer for `modify_user`: changes of the same user made within `window` seconds
+    are merged into one `PUT /user/{username}` request (later values win).
+
+    Fields equal to the last known state of the user (from previous responses or `remember`) are not sent,
+    and if nothing is left no request is made. Every caller gets the `UserResponse` after the merged write.
+    Pending writes are sent when the window ends, on `flush` and on `close`.
+    """
+
+    def __init__(self, api: Any, window: float = 0.5, max_known: int = 10000):
+        """
+        :param api: `MarzbanAPI` to send writes with.
+        :param window: Seconds to wait for more changes of a user after the first one.
+        :param max_known: Number of users whose last known state is kept (least recently written are dropped).
+        """
+        self.api = api
+        self.window = window
+        self.max_known = max_known
+        self.requests = 0
+        self.merged = 0
+        self.dropped = 0
+        self._known: "OrderedDict[str, UserResponse]" = OrderedDict()
+        self._pending: Dict[str, _PendingWrite] = {}
+        # username -> [lock, number of flushes using it]
+        self._locks: Dict[str, list] = {}
+
+    def remember(self, user: UserResponse) -> None:
+        """
+        Store the last known state of the user, e.g. after `get_user`.
+        """
+        self._known[user.username] = user
+        self._known.move_to_end(user.username)
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    def forget(self, username: Any) -> None:
+        self._known.pop(str(username), None)
+
+    async def modify_user(
+        self,
+        username: Any,
+        proxies: Optional[Dict[str, Any]] = None,
+        expire: Optional[int] = None,
+        data_limit: Optional[int] = None,
+        data_limit_reset_strategy: Optional[UserDataLimitResetStrategy] = None,
+        inbounds: Optional[Dict[str, Any]] = None,
+        note: Optional[str] = None,
+        on_hold_expire_duration: Optional[int] = None,
+        on_hold_timeout: Optional[str] = None,
+        auto_delete_in_days: Optional[int] = None,
+        next_plan: Optional[NextPlanModel] = None,
+        status: Optional[UserStatusModify] = None,
+    ) -> UserResponse:
+        """
+        Same as `MarzbanAPI.modify_user`, but the write is merged with other writes of the user.
+        Returns the state of the user after the merged write.
+        """
+        data = UserModify(
+            proxies=proxies,
+            expire=expire,
+            data_limit=gb_to_bytes(data_limit),
+            data_limit_reset_strategy=data_limit_reset_strategy,
+            inbounds=inbounds,
+            note=note,
+            on_hold_expire_duration=on_hold_expire_duration,
+            on_hold_timeout=on_hold_timeout,
+            auto_delete_in_days=auto_delete_in_days,
+            next_plan=next_plan,
+            status=status,
+        )
+        username = str(username)
+        pending = self._pending.get(username)
+        if pending is None:
+            pending = self._pending[username] = _PendingWrite()
+            pending.timer = asyncio.create_task(self._flush_later(username, pending))
+        else:
+            self.merged += 1
+        # Empty proxies and inbounds mean "no change"
+        pending.patch.update({key: value for key, value in data.model_dump(exclude_none=True).items() if value != {}})
+        future = asyncio.get_running_loop().create_future()
+        pending.futures.append(future)
+        return await future
+
+    async def _flush_later(self, username: str, pending: _PendingWrite) -> None:
+        await asyncio.sleep(self.window)
+        if self._pending.get(username) is pending:
+            pending.timer = None
+            await self.flush(username)
+
+    def _changes(self, username: str, patch: Dict[str, Any]) -> Dict[str, Any]:
+        known = self._known.get(username)
+        if known is None:
+            return patch
+        changes = {}
+        for key, value in patch.items():
+            if _plain(getattr(known, key, None)) != _plain(value):
+                changes[key] = value
+            else:
+                self.dropped += 1
+        return changes
+
+    async def flush(self, username: Optional[Any] = None) -> None:
+        """
+        Send pending writes of the user, or of all users.
+        """
+        if username is None:
+            await asyncio.gather(*(self.flush(name) for name in list(self._pending)))
+            return
+        username = str(username)
+        pending = self._pending.pop(username, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+
+        entry = self._locks.setdefault(username, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # Writes of the previous batch of the user are sent first
+            async with entry[0]:
+                changes = self._changes(username, pending.patch)
+                if changes or username not in self._known:
+                    self.requests += 1
+                    user = await self.api._modify_user(username, changes)
+                    self.remember(user)
+                else:
+                    user = self._known[username]
+        except Exception as e:
+            self.forget(username)
+            for future in pending.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in pending.futures:
+                if not future.done():
+                    future.set_result(user)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[username]
+
+    async def close(self) -> None:
+        """
+        Send all pending writes.
+        """
+        await self.flush()
+
+    async def __aenter__(self) -> "UserWriteBuffer":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
@@ -0,0 +1,235 @@
+import asyncio
+import base64
+import binascii
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple, Set, List
+
+# Same order as the panel checks user agents when choosing the subscription format.
+USER_AGENT_CLASSES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"^([Cc]lash-verge|[Cc]lash[-.]?[Mm]eta|[Ff][Ll][Cc]lash|[Mm]ihomo)"), "clash-meta"),
+    (re.compile(r"^([Cc]lash|[Ss]tash)"), "clash"),
+    (re.compile(r"^(SFA|SFI|SFM|SFT|[Kk]aring|[Hh]iddify[Nn]ext)"), "sing-box"),
+    (re.compile(r"^(SS|SSR|SSD|SSS|Outline|Shadowsocks|SSconf)"), "outline"),
+    (re.compile(r"^v2rayN/"), "v2rayn"),
+    (re.compile(r"^v2rayNG/"), "v2rayng"),
+    (re.compile(r"^[Ss]treisand"), "streisand"),
+    (re.compile(r"^Happ/"), "happ"),
+]
+
+CacheKey = Tuple[str, str, str]
+
+
+def user_agent_class(user_agent: Optional[str]) -> str:
+    """
+    Return the family of the subscription client. Clients of the same family get the same config.
+    """
+    if user_agent:
+        for pattern, name in USER_AGENT_CLASSES:
+            if pattern.match(user_agent):
+                return name
+    return "default"
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4), altchars=b"-_", validate=True)
+
+
+def username_from_token(token: str) -> Optional[str]:
+    """
+    Extract username from subscription token without verifying its signature.
+    Supports both signed base64 tokens and legacy JWT tokens.
+    """
+    try:
+        if token.startswith("eyJ"):
+            payload = json.loads(_b64decode(token.split(".")[1]))
+            return payload.get("sub")
+        if len(token) < 15:
+            return None
+        return _b64decode(token[:-10]).decode().split(",")[0]
+    except (binascii.Error, ValueError, IndexError, UnicodeDecodeError, AttributeError):
+        return None
+
+
+class _CacheEntry:
+    __slots__ = ("value", "created", "username")
+
+    def __init__(self, value: Any, created: float, username: Optional[str]):
+        self.value = value
+        self.created = created
+        self.username = username
+
+
+class SubscriptionCache:
+    """
+    Size-bounded LRU cache of subscription responses keyed by token, client type and user agent class.
+
+    Fresh entries are returned as is. Entries older than `ttl` but younger than `ttl + stale_ttl` are returned
+    immediately while a background task refreshes them. Concurrent misses of the same key share one request.
+    Entries of a user are dropped when the user is modified, revoked or removed through the client.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 60,
+        stale_ttl: float = 300,
+        maxsize: int = 10000,
+    ):
+        """
+        :param ttl: Seconds during which a cached response is considered fresh.
+        :param stale_ttl: Seconds after `ttl` during which a stale response is served while being refreshed.
+        :param maxsize: Maximal number of cached responses.
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[CacheKey, _CacheEntry]" = OrderedDict()
+        self._users: Dict[str, Set[CacheKey]] = {}
+        self._pending: Dict[CacheKey, Tuple[asyncio.Task, Optional[str]]] = {}
+        self._invalidated: Set[CacheKey] = set()
+        # Incremented by `clear`, requests started before are not cached
+        self._generation = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refresh_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(token: str, kind: Optional[str] = "", user_agent: Optional[str] = "") -> CacheKey:
+        return token, kind or "", user_agent_class(user_agent)
+
+    def _store(self, key: CacheKey, value: Any, username: Optional[str]) -> None:
+        self._drop(key)
+        self._entries[key] = _CacheEntry(value, time.monotonic(), username)
+        if username is not None:
+            self._users.setdefault(username, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.username is not None:
+            keys = self._users.get(entry.username)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._users[entry.username]
+
+    async def _fetch(
+        self,
+        key: CacheKey,
+        loader: Callable[[], Awaitable[Any]],
+        username: Optional[str],
+        generation: int,
+    ) -> Any:
+        try:
+            value = await loader()
+            if generation == self._generation and key not in self._invalidated:
+                self._store(key, value, username if username is not None else getattr(value, "username", None))
+            return value
+        finally:
+            pending = self._pending.get(key)
+            if pending is not None and pending[0] is asyncio.current_task():
+                del self._pending[key]
+                self._invalidated.discard(key)
+
+    async def _load(
+        self,
+        key: CacheKey,
+        loader: Callable[[], Awaitable[Any]],
+        username: Optional[str],
+    ) -> Any:
+        pending = self._pending.get(key)
+        if pending is None:
+            # The request runs as its own task, so a cancelled caller doesn't cancel it for the others
+            task = asyncio.create_task(self._fetch(key, loader, username, self._generation))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            pending = self._pending[key] = (task, username)
+        return await asyncio.shield(pending[0])
+
+    async def _refresh(self, key: CacheKey, loader: Callable[[], Awaitable[Any]], username: Optional[str]) -> None:
+        try:
+            await self._load(key, loader, username)
+        except Exception:
+            self.refresh_errors += 1
+
+    async def get(
+        self,
+        token: str,
+        kind: Optional[str],
+        user_agent: Optional[str],
+        loader: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Return cached response or load it with `loader`.
+
+        :param token: Subscription token.
+        :param kind: Response kind: "" for the default subscription, "info" or client type.
+        :param user_agent: User agent of the subscription client.
+        :param loader: Coroutine function requesting the response from the panel.
+        """
+        key = self.key(token, kind, user_agent)
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.created
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._pending:
+                    task = asyncio.create_task(self._refresh(key, loader, entry.username))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                return entry.value
+
+        if key in self._pending:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        return await self._load(key, loader, username_from_token(token))
+
+    def invalidate_user(self, username: Any) -> None:
+        """
+        Drop all cached responses of the user, including requests which are in progress.
+        """
+        username = str(username)
+        for key, (_, pending_username) in self._pending.items():
+            if pending_username == username:
+                self._invalidated.add(key)
+        for key in list(self._users.get(username, ())):
+            self._drop(key)
+
+    def invalidate_token(self, token: str) -> None:
+        for key in self._pending:
+            if key[0] == token:
+                self._invalidated.add(key)
+        for key in [key for key in self._entries if key[0] == token]:
+            self._drop(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._users.clear()
+        self._pending.clear()
+        self._invalidated.clear()
+        self._generation += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Share of requests answered without a new upstream request.
+        """
+        served = self.hits + self.stale_hits + self.coalesced
+        total = served + self.misses
+        return served / total if total else 0.0
@@ -0,0 +1,214 @@
+"""
+Command line interface: export users of a panel to NDJSON and import them into another panel.
+
+    aiomarzban --address https://old.example.com/ --username admin --password secret export -o users.ndjson.gz
+    aiomarzban --address https://new.example.com/ --username admin --password secret import users.ndjson.gz
+
+Connection options default to MARZBAN_ADDRESS, MARZBAN_USERNAME and MARZBAN_PASSWORD environment variables.
+Files ending with .gz are gzip-compressed.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from typing import Optional, Dict, Any, Callable, Iterator, ContextManager, TextIO
+
+from pydantic import BaseModel
+
+from .api import MarzbanAPI
+from .enums import UserStatus
+from .journal import BulkJob, JobProgress
+from .models import UserCreate
+
+# Fields of exported users which are restored by import
+IMPORTED_FIELDS = (
+    "proxies",
+    "expire",
+    "data_limit",
+    "data_limit_reset_strategy",
+    "inbounds",
+    "note",
+    "on_hold_expire_duration",
+    "on_hold_timeout",
+    "auto_delete_in_days",
+    "next_plan",
+)
+
+
+class ExportStats(BaseModel):
+    users: int = 0
+    bytes: int = 0
+    elapsed: float = 0
+    rate: float = 0
+
+    def __str__(self) -> str:
+        return f"{self.users} users exported in {self.elapsed:.1f}s, {self.rate:.1f} users/s"
+
+
+def _open(path: str, mode: str) -> ContextManager[TextIO]:
+    if path == "-":
+        return nullcontext(sys.stdout if mode == "w" else sys.stdin)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+async def export_users(
+    api: MarzbanAPI,
+    path: str,
+    page_size: int = 500,
+    status: Optional[UserStatus] = None,
+    on_progress: Optional[Callable[[ExportStats], Any]] = None,
+) -> ExportStats:
+    """
+    Write users to an NDJSON file, one `UserResponse` per line. Only one page of users is kept in memory.
+
+    :param api: Client of the source panel.
+    :param path: Output file, "-" for stdout.
+    :param page_size: Users per `get_users` request.
+    :param status: Export only users with the status.
+    :param on_progress: Callback called with `ExportStats` after every page.
+    :return: `ExportStats`
+    """
+    stats = ExportStats()
+    started = time.monotonic()
+    with _open(path, "w") as f:
+        offset = 0
+        while True:
+            page = await api.get_users(offset=offset, limit=page_size, status=status, sort="created_at")
+            for user in page.users:
+                line = json.dumps(user.model_dump(mode="json"), ensure_ascii=False) + "\n"
+                f.write(line)
+                stats.bytes += len(line)
+            stats.users += len(page.users)
+            offset += page_size
+            stats.elapsed = time.monotonic() - started
+            stats.rate = stats.users / stats.elapsed if stats.elapsed > 0 else 0.0
+            if on_progress is not None:
+                on_progress(stats)
+            if len(page.users) < page_size or offset >= page.total:
+                break
+    return stats
+
+
+def read_users(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate users of an NDJSON export lazily.
+    """
+    with _open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def import_user(api: MarzbanAPI, user: Dict[str, Any], skip_existing: bool = False) -> None:
+    """
+    Create a user from an exported record, keeping proxy ids (so links stay valid), limits and status.
+    Expired users are created active, the panel sets their status again. Used traffic can't be transferred,
+    so limited users are created disabled instead of getting a fresh quota.
+    """
+    status = user.get("status")
+    data = UserCreate(
+        username=user["username"],
+        status="on_hold" if status == "on_hold" else "active",
+        **{field: user[field] for field in IMPORTED_FIELDS if user.get(field) is not None},
+    )
+    try:
+        await api._add_user(data)
+    except Exception as e:
+        if not (skip_existing and "User already exists" in str(e)):
+            raise
+    if status in ("disabled", "limited"):
+        await api._modify_user(data.username, {"status": "disabled"})
+
+
+async def import_users(
+    api: MarzbanAPI,
+    path: str,
+    concurrency: int = 10,
+    journal: Optional[str] = None,
+    skip_existing: bool = False,
+    on_progress: Optional[Callable[[JobProgress], Any]] = None,
+    progress_interval: float = 5.0,
+) -> BulkJob:
+    """
+    Create users of an NDJSON export with bounded concurrency, reading the file as a stream.
+
+    :param api: Client of the target panel.
+    :param path: Export file, "-" for stdin.
+    :param concurrency: Maximum number of `add_user` requests in flight.
+    :param journal: Journal file to make the import resumable (see `BulkJob`).
+    :param skip_existing: Treat users which already exist as imported.
+    :param on_progress: Callback called with `JobProgress` periodically and at the end.
+    :param progress_interval: Seconds between progress reports.
+    :return: Finished `BulkJob` with `progress` and `errors`.
+    """
+    job = BulkJob(journal, concurrency=concurrency, progress_interval=progress_interval)
+    await job.run(
+        read_users(path),
+        lambda user: import_user(api, user, skip_existing),
+        key=lambda user: user["username"],
+        on_progress=on_progress,
+    )
+    return job
+
+
+def _report(item: Any) -> None:
+    print(item, file=sys.stderr)
+
+
+async def _main(options: argparse.Namespace) -> int:
+    api = MarzbanAPI(options.address, options.username, options.password, use_single_session=True)
+    try:
+        if options.command == "export":
+            stats = await export_users(api, options.output, page_size=options.page_size, status=options.status)
+            _report(stats)
+            return 0
+
+        job = await import_users(
+            api,
+            options.input,
+            concurrency=options.concurrency,
+            journal=options.journal,
+            skip_existing=options.skip_existing,
+            on_progress=_report,
+        )
+        for username, error in list(job.errors.items())[:20]:
+            _report(f"{username}: {error}")
+        return 1 if job.errors else 0
+    finally:
+        await api.close()
+
+
+def main(args: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(prog="aiomarzban", description="Export and import Marzban users.")
+    parser.add_argument("--address", default=os.getenv("MARZBAN_ADDRESS"), help="Panel address, e.g. https://marzban.com/")
+    parser.add_argument("--username", default=os.getenv("MARZBAN_USERNAME"))
+    parser.add_argument("--password", default=os.getenv("MARZBAN_PASSWORD"))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Export users to NDJSON.")
+    export.add_argument("-o", "--output", default="users.ndjson.gz", help="Output file, .gz to compress, - for stdout.")
+    export.add_argument("--page-size", type=int, default=500)
+    export.add_argument("--status", choices=[status.value for status in UserStatus])
+
+    import_ = commands.add_parser("import", help="Create users from NDJSON export.")
+    import_.add_argument("input", help="Export file, - for stdin.")
+    import_.add_argument("--concurrency", type=int, default=10)
+    import_.add_argument(
+        "--journal",
+        help="Journal file to resume an interrupted import. Resume with --skip-existing: a user created just "
+             "before the interruption is not journaled, and may be left active if it had to be disabled.",
+    )
+    import_.add_argument("--skip-existing", action="store_true", help="Don't fail on users which already exist.")
+
+    options = parser.parse_args(args)
+    if not options.address or not options.username or not options.password:
+        parser.error("--address, --username and --password (or MARZBAN_* environment variables) are required")
+    if not options.address.endswith("/"):
+        options.address += "/"
+    sys.exit(asyncio.run(_main(options)))
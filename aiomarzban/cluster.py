@@ -0,0 +1,193 @@
+import asyncio
+from typing import Optional, List, Dict, Any, Callable, Generic, TypeVar, Tuple, Iterable, Union
+
+import aiohttp
+
+from .api import MarzbanAPI
+from .exceptions import MarzbanClusterException
+from .models import NodesUsageResponse, SystemStats, UsersResponse, NodeResponse, UserStatus
+
+T = TypeVar("T")
+
+
+class ClusterResult(Generic[T]):
+    """
+    Result of a call fanned out to all panels.
+    Successful responses are stored in `results`, failures (including timeouts) in `errors`.
+    """
+
+    def __init__(self):
+        self.results: Dict[str, T] = {}
+        self.errors: Dict[str, BaseException] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def raise_for_errors(self) -> None:
+        if self.errors:
+            raise MarzbanClusterException(self.errors)
+
+    def flatten(self, items: Callable[[T], Iterable[Any]]) -> List[Tuple[str, Any]]:
+        """
+        Merge iterable parts of all results, labelling each item with its panel name.
+
+        :param items: Function returning items of a single panel result, e.g. `lambda r: r.users`.
+        :return: List of (panel name, item).
+        """
+        return [(panel, item) for panel, result in self.results.items() for item in items(result)]
+
+    def sum(self, field: str) -> Union[int, float]:
+        """
+        Sum numeric field over all successful results.
+        """
+        return sum(getattr(result, field) for result in self.results.values())
+
+    def __repr__(self) -> str:
+        return f"ClusterResult(results={list(self.results)}, errors={list(self.errors)})"
+
+
+class MarzbanCluster:
+    """
+    Group of independent panels behind one connection pool.
+
+    Calls are sent to all panels concurrently with a per-panel timeout. A failing panel does not fail
+    the whole call: its exception is returned in `ClusterResult.errors`.
+    """
+
+    def __init__(
+        self,
+        panels: Dict[str, MarzbanAPI],
+        timeout: Optional[float] = 10,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+    ):
+        """
+        :param panels: Mapping of panel name (e.g. region) to `MarzbanAPI`.
+        :param timeout: Default per-panel timeout in seconds (including retries and token refresh).
+        :param connection_limit: Total connection limit of the shared pool.
+        :param connection_limit_per_host: Connection limit per panel, 0 for no limit.
+        """
+        self.panels: Dict[str, MarzbanAPI] = dict(panels)
+        self.timeout = timeout
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+            for api in self.panels.values():
+                self._attach(api)
+        return self.session
+
+    def _attach(self, api: MarzbanAPI) -> None:
+        if api.session is None:
+            api.attach_session(self.session)
+
+    def add_panel(self, name: str, api: MarzbanAPI) -> None:
+        self.panels[name] = api
+        if self.session is not None:
+            self._attach(api)
+
+    def remove_panel(self, name: str) -> MarzbanAPI:
+        api = self.panels.pop(name)
+        if self.session is not None and api.session is self.session:
+            api.detach_session()
+        return api
+
+    async def _call(self, api: MarzbanAPI, method: str, timeout: Optional[float], args, kwargs) -> Any:
+        coroutine = getattr(api, method)(*args, **kwargs)
+        if timeout is None:
+            return await coroutine
+        return await asyncio.wait_for(coroutine, timeout)
+
+    async def gather(
+        self,
+        method: str,
+        *args,
+        panels: Optional[Iterable[str]] = None,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> ClusterResult:
+        """
+        Call `MarzbanAPI` method on all (or selected) panels concurrently.
+
+        :param method: Name of `MarzbanAPI` method, e.g. "get_system_stats".
+        :param panels: Names of panels to call. All panels by default.
+        :param timeout: Per-panel timeout in seconds. Cluster default if not specified.
+        :return: `ClusterResult`
+        """
+        self._get_session()
+        names = list(self.panels) if panels is None else list(panels)
+        timeout = self.timeout if timeout is None else timeout
+        responses = await asyncio.gather(
+            *(self._call(self.panels[name], method, timeout, args, kwargs) for name in names),
+            return_exceptions=True,
+        )
+
+        result = ClusterResult()
+        for name, response in zip(names, responses):
+            if isinstance(response, asyncio.CancelledError):
+                raise response
+            if isinstance(response, BaseException):
+                result.errors[name] = response
+            else:
+                result.results[name] = response
+        return result
+
+    async def get_system_stats(self, timeout: Optional[float] = None) -> ClusterResult[SystemStats]:
+        return await self.gather("get_system_stats", timeout=timeout)
+
+    async def get_nodes(self, timeout: Optional[float] = None) -> ClusterResult[List[NodeResponse]]:
+        return await self.gather("get_nodes", timeout=timeout)
+
+    async def get_nodes_usage(
+        self,
+        start: Optional[str] = "",
+        end: Optional[str] = "",
+        timeout: Optional[float] = None,
+    ) -> ClusterResult[NodesUsageResponse]:
+        return await self.gather("get_nodes_usage", start=start, end=end, timeout=timeout)
+
+    async def get_users(
+        self,
+        offset: Optional[int] = None,
+        limit: Optional[int] = None,
+        username: Optional[List[str]] = None,
+        search: Optional[str] = None,
+        admin: Optional[List[str]] = None,
+        status: Optional[UserStatus] = None,
+        sort: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> ClusterResult[UsersResponse]:
+        return await self.gather(
+            "get_users",
+            offset=offset,
+            limit=limit,
+            username=username,
+            search=search,
+            admin=admin,
+            status=status,
+            sort=sort,
+            timeout=timeout,
+        )
+
+    async def close(self) -> None:
+        if self.session is not None:
+            for api in self.panels.values():
+                if api.session is self.session:
+                    api.detach_session()
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self) -> "MarzbanCluster":
+        self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
@@ -0,0 +1,175 @@
+"""
+Caching subscription edge server.
+
+Serves `/{sub_path}/{token}`, `/{sub_path}/{token}/info` and `/{sub_path}/{token}/{client_type}` from a local cache,
+so subscription clients refreshing every few minutes don't make the panel render configs again and again.
+
+Run: python -m aiomarzban.edge --address https://marzban.com/ --port 8080
+"""
+import argparse
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from aiohttp import web
+
+from .api import MarzbanAPI
+from .cache import SubscriptionCache
+from .exceptions import MarzbanNotFoundException
+from .models import SubscriptionContent
+
+CLIENT_TYPES = "info|sing-box|clash-meta|clash|outline|v2ray|v2ray-json"
+
+
+class TokenRateLimiter:
+    """
+    Token bucket per subscription token. Least recently used buckets are evicted above `max_tokens`.
+    """
+
+    def __init__(self, rate: float = 1, burst: int = 10, max_tokens: int = 100000):
+        """
+        :param rate: Allowed requests per second per token.
+        :param burst: Maximal amount of requests allowed at once.
+        :param max_tokens: Maximal amount of tracked tokens.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_tokens = max_tokens
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def allow(self, token: str, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            bucket = self._buckets[token] = [float(self.burst), now]
+            if len(self._buckets) > self.max_tokens:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(token)
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+
+class SubscriptionEdge:
+    """
+    aiohttp application serving subscriptions from `SubscriptionCache`.
+    Concurrent misses of the same subscription are coalesced into one upstream request.
+    """
+
+    def __init__(
+        self,
+        api: MarzbanAPI,
+        cache: Optional[SubscriptionCache] = None,
+        rate_limiter: Optional[TokenRateLimiter] = None,
+        sub_path: Optional[str] = None,
+    ):
+        """
+        :param api: Client of the panel (upstream).
+        :param cache: Cache for subscription responses. By default, 60 seconds TTL and 5 minutes stale TTL.
+        :param rate_limiter: Per-token rate limiter. Rate limiting is disabled if not specified.
+        :param sub_path: Path served by the edge. Same as `api.sub_path` by default.
+        """
+        self.api = api
+        self.cache = cache or SubscriptionCache()
+        self.rate_limiter = rate_limiter
+        self.sub_path = (sub_path or api.sub_path).strip("/")
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.not_found = 0
+        self.upstream_errors = 0
+        self.upstream_requests = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.router.add_get(f"/{self.sub_path}/{{token}}", self.handle_subscription)
+        app.router.add_get(f"/{self.sub_path}/{{token}}/{{kind:{CLIENT_TYPES}}}", self.handle_subscription)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        await self.api.close()
+
+    async def _fetch(self, token: str, kind: str, user_agent: str) -> SubscriptionContent:
+        self.upstream_requests += 1
+        return await self.api._fetch_subscription(token, kind, user_agent)
+
+    async def handle_subscription(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        token = request.match_info["token"]
+        kind = request.match_info.get("kind", "")
+        user_agent = request.headers.get("user-agent", "")
+
+        if self.rate_limiter is not None and not self.rate_limiter.allow(token):
+            self.rate_limited += 1
+            return web.json_response({"detail": "Too many requests"}, status=429)
+
+        try:
+            content = await self.cache.get(token, kind, user_agent, lambda: self._fetch(token, kind, user_agent))
+        except MarzbanNotFoundException:
+            self.not_found += 1
+            return web.json_response({"detail": "Not Found"}, status=404)
+        except Exception:
+            self.upstream_errors += 1
+            return web.json_response({"detail": "Bad Gateway"}, status=502)
+
+        headers = dict(content.headers)
+        content_type = headers.pop("content-type", None)
+        response = web.Response(body=content.body, status=content.status, headers=headers)
+        if content_type is not None:
+            response.headers["content-type"] = content_type
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hits": self.cache.hits,
+            "stale_hits": self.cache.stale_hits,
+            "misses": self.cache.misses,
+            "coalesced": self.cache.coalesced,
+            "hit_rate": self.cache.hit_rate,
+            "upstream_requests": self.upstream_requests,
+            "upstream_errors": self.upstream_errors,
+            "refresh_errors": self.cache.refresh_errors,
+            "rate_limited": self.rate_limited,
+            "not_found": self.not_found,
+            "cached": len(self.cache),
+        }
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+
+def main(args: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Caching subscription edge server for Marzban.")
+    parser.add_argument("--address", required=True, help="Panel address, e.g. https://marzban.com/")
+    parser.add_argument("--sub-path", default="sub", help="Subscription path of the panel.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ttl", type=float, default=60, help="Seconds a response is fresh.")
+    parser.add_argument("--stale-ttl", type=float, default=300, help="Seconds a stale response is served.")
+    parser.add_argument("--max-size", type=int, default=10000, help="Maximal number of cached responses.")
+    parser.add_argument("--rate", type=float, default=1, help="Requests per second per token, 0 to disable.")
+    parser.add_argument("--burst", type=int, default=10, help="Request burst per token.")
+    parser.add_argument("--timeout", type=int, default=10, help="Upstream timeout in seconds.")
+    options = parser.parse_args(args)
+
+    address = options.address if options.address.endswith("/") else options.address + "/"
+    # Subscription routes don't need credentials
+    api = MarzbanAPI(address, "", "", sub_path=options.sub_path, timeout=options.timeout, use_single_session=True)
+    edge = SubscriptionEdge(
+        api,
+        cache=SubscriptionCache(ttl=options.ttl, stale_ttl=options.stale_ttl, maxsize=options.max_size),
+        rate_limiter=TokenRateLimiter(options.rate, options.burst) if options.rate > 0 else None,
+    )
+    web.run_app(edge.create_app(), host=options.host, port=options.port)
+
+
+if __name__ == "__main__":
+    main()
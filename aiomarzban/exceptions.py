@@ -4,3 +4,10 @@ class MarzbanException(Exception):
 
 class MarzbanNotFoundException(MarzbanException):
     ...
+
+
+class MarzbanClusterException(MarzbanException):
+    def __init__(self, errors: dict):
+        self.errors = errors
+        details = "; ".join(f"{panel}: {error!r}" for panel, error in errors.items())
+        super().__init__(f"Request failed on {len(errors)} panel(s): {details}")
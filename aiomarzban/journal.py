@@ -0,0 +1,235 @@
+"""
+Resumable bulk jobs: an append-only journal of completed items, so that a restarted job skips finished work.
+
+Journal lines are JSON objects: {"key": "john", "ok": true} for completed items
+and {"key": "jane", "ok": false, "error": "..."} for failed ones (they are retried on the next run).
+Lines are written in batches and fsynced every `fsync_batch` items or `fsync_interval` seconds:
+after a crash at most the last unsynced batch is sent again, so job operations should tolerate repeats
+(e.g. treat "User already exists" of `add_user` as done).
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Optional, List, Dict, Any, Callable, Awaitable, Iterable, Set, TextIO
+
+from pydantic import BaseModel
+
+
+class JobJournal:
+    """
+    Append-only journal of a bulk job.
+    """
+
+    def __init__(self, path: str, fsync_batch: int = 1000, fsync_interval: float = 1.0):
+        """
+        :param path: Journal file. Created if it doesn't exist.
+        :param fsync_batch: Number of records after which the journal is written and fsynced.
+        :param fsync_interval: Maximum seconds between fsyncs while records are added.
+        """
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.completed: Set[str] = set()
+        self._buffer: List[str] = []
+        self._file: Optional[TextIO] = None
+        self._synced_at = 0.0
+        self._syncing: Optional[asyncio.Future] = None
+
+    def open(self) -> None:
+        """
+        Load completed items and open the journal for appending.
+        A partially written last line (crash during write) is ignored.
+        """
+        needs_newline = False
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            needs_newline = bool(data) and not data.endswith(b"\n")
+            for line in data.splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("ok"):
+                    self.completed.add(record["key"])
+        self._file = open(self.path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+        self._synced_at = time.monotonic()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.completed
+
+    def record(self, key: str, error: Optional[BaseException] = None) -> None:
+        """
+        Add result of an item. The record is durable after the next `sync`.
+        """
+        if error is None:
+            self.completed.add(key)
+            line = {"key": key, "ok": True}
+        else:
+            line = {"key": key, "ok": False, "error": f"{type(error).__name__}: {error}"}
+        self._buffer.append(json.dumps(line, ensure_ascii=False))
+
+    @property
+    def sync_due(self) -> bool:
+        return len(self._buffer) >= self.fsync_batch or (
+            bool(self._buffer) and time.monotonic() - self._synced_at >= self.fsync_interval
+        )
+
+    async def sync(self) -> None:
+        """
+        Write buffered records and fsync the journal. fsync runs in a thread, so workers keep going.
+        """
+        if self._syncing is not None:
+            await self._syncing
+        if not self._buffer or self._file is None:
+            return
+        self._file.write("\n".join(self._buffer) + "\n")
+        self._buffer.clear()
+        self._file.flush()
+        self._synced_at = time.monotonic()
+        syncing = self._syncing = asyncio.get_running_loop().run_in_executor(None, os.fsync, self._file.fileno())
+        try:
+            await syncing
+        finally:
+            if self._syncing is syncing:
+                self._syncing = None
+
+    async def close(self) -> None:
+        await self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class JobProgress(BaseModel):
+    total: Optional[int] = None
+    done: int = 0
+    skipped: int = 0
+    failed: int = 0
+    elapsed: float = 0
+    rate: float = 0
+    eta: Optional[float] = None
+
+    def __str__(self) -> str:
+        total = f"/{self.total}" if self.total is not None else ""
+        eta = f", eta {self.eta:.0f}s" if self.eta is not None else ""
+        return (
+            f"{self.done + self.skipped}{total} done ({self.skipped} skipped, {self.failed} failed), "
+            f"{self.rate:.1f} items/s{eta}"
+        )
+
+
+class BulkJob:
+    """
+    Runs an async operation for every item with bounded concurrency, journaling completed items.
+    Running the job again with the same journal skips items completed before.
+
+    Example:
+        job = BulkJob("migration.journal", concurrency=20)
+        progress = await job.run(users, lambda user: api.add_user(**user), key=lambda user: user["username"])
+    """
+
+    def __init__(
+        self,
+        journal: Optional[str] = None,
+        concurrency: int = 10,
+        fsync_batch: int = 1000,
+        fsync_interval: float = 1.0,
+        progress_interval: float = 5.0,
+    ):
+        """
+        :param journal: Path to the journal file. Without it the job is not resumable.
+        :param concurrency: Maximum number of items processed at once.
+        :param fsync_batch: Number of records after which the journal is fsynced.
+        :param fsync_interval: Maximum seconds between fsyncs.
+        :param progress_interval: Seconds between `on_progress` calls.
+        """
+        self.journal = JobJournal(journal, fsync_batch=fsync_batch, fsync_interval=fsync_interval) if journal else None
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.progress = JobProgress()
+        self.errors: Dict[str, BaseException] = {}
+
+    def _update_progress(self, started: float, processed: int) -> JobProgress:
+        progress = self.progress
+        progress.elapsed = time.monotonic() - started
+        progress.rate = processed / progress.elapsed if progress.elapsed > 0 else 0.0
+        if progress.total is not None and progress.rate > 0:
+            progress.eta = (progress.total - progress.done - progress.skipped - progress.failed) / progress.rate
+        return progress
+
+    async def run(
+        self,
+        items: Iterable[Any],
+        fn: Callable[[Any], Awaitable[Any]],
+        key: Callable[[Any], Any] = str,
+        on_progress: Optional[Callable[[JobProgress], Any]] = None,
+    ) -> JobProgress:
+        """
+        Process items not completed before.
+
+        :param items: Items of the job. Their keys must be unique and stable between runs.
+        :param fn: Async operation for an item. Exceptions are journaled as failures and counted,
+        the job continues.
+        :param key: Function returning the key of an item. Default: `str(item)`.
+        :param on_progress: Sync or async callback called with `JobProgress` periodically and at the end.
+        :return: `JobProgress`
+        """
+        journal = self.journal
+        if journal is not None:
+            journal.open()
+        self.progress = JobProgress(total=len(items) if hasattr(items, "__len__") else None)
+        self.errors = {}
+        started = last_report = time.monotonic()
+        processed = 0
+        iterator = iter(items)
+
+        async def report():
+            result = on_progress(self._update_progress(started, processed).model_copy())
+            if asyncio.iscoroutine(result):
+                await result
+
+        async def worker():
+            nonlocal processed, last_report
+            for item in iterator:
+                item_key = str(key(item))
+                if journal is not None and item_key in journal:
+                    self.progress.skipped += 1
+                    continue
+                try:
+                    await fn(item)
+                except Exception as e:
+                    self.errors[item_key] = e
+                    if journal is not None:
+                        journal.record(item_key, e)
+                    self.progress.failed += 1
+                else:
+                    if journal is not None:
+                        journal.record(item_key)
+                    self.progress.done += 1
+                processed += 1
+                if journal is not None and journal.sync_due:
+                    await journal.sync()
+                if on_progress is not None and time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    await report()
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            done, pending = await asyncio.wait(workers, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            # A crashed worker (or cancelled job) stops the others before the journal is closed
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if journal is not None:
+                await journal.close()
+        if on_progress is not None:
+            await report()
+        return self._update_progress(started, processed)
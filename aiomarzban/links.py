@@ -0,0 +1,489 @@
+"""
+Offline generation of share links and subscriptions.
+
+Links are built from the core config (`get_core_config`), hosts (`get_hosts`) and user proxies and inbounds
+(`UserResponse`) the same way Marzban 0.8.4 renders them, so subscriptions can be served without a panel request.
+"""
+import asyncio
+import base64
+import datetime
+import json
+import math
+import random
+import secrets
+from typing import Optional, List, Dict, Any, Union
+from urllib import parse as urlparse
+
+from .enums import UserStatus
+from .models import ProxyHost, SubscriptionContent, UserResponse
+
+STATUS_EMOJIS = {
+    UserStatus.active: "✅",
+    UserStatus.expired: "⌛️",
+    UserStatus.limited: "🪫",
+    UserStatus.disabled: "❌",
+    UserStatus.on_hold: "🔌",
+}
+
+PROTOCOLS = ("vmess", "vless", "trojan", "shadowsocks")
+
+
+def readable_size(size_bytes: Optional[int]) -> str:
+    if not size_bytes or size_bytes <= 0:
+        return "0 B"
+    size_name = ("B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB")
+    i = int(math.floor(math.log(size_bytes, 1024)))
+    s = round(size_bytes / math.pow(1024, i), 2)
+    return f"{s} {size_name[i]}"
+
+
+def format_time_left(seconds_left: Optional[int]) -> str:
+    if not seconds_left or seconds_left <= 0:
+        return "∞"
+    minutes, seconds = divmod(seconds_left, 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    months, days = divmod(days, 30)
+
+    result = []
+    if months:
+        result.append(f"{months}m")
+    if days:
+        result.append(f"{days}d")
+    if hours and days < 7:
+        result.append(f"{hours}h")
+    if minutes and not (months or days):
+        result.append(f"{minutes}m")
+    if seconds and not (months or days):
+        result.append(f"{seconds}s")
+    return " ".join(result)
+
+
+def x25519_public_key(private_key: str) -> str:
+    """
+    Return REALITY public key for the private key (both url-safe base64 without padding, as xray prints them).
+    """
+    key = bytearray(base64.urlsafe_b64decode(private_key + "=" * (-len(private_key) % 4)))
+    key[0] &= 248
+    key[31] &= 127
+    key[31] |= 64
+    scalar = int.from_bytes(key, "little")
+
+    # Montgomery ladder, RFC 7748
+    p = 2 ** 255 - 19
+    x1, x2, z2, x3, z3 = 9, 1, 0, 9, 1
+    swap = 0
+    for t in reversed(range(255)):
+        bit = (scalar >> t) & 1
+        swap ^= bit
+        if swap:
+            x2, x3, z2, z3 = x3, x2, z3, z2
+        swap = bit
+        a, b = x2 + z2, x2 - z2
+        aa, bb = a * a % p, b * b % p
+        e = aa - bb
+        c, d = x3 + z3, x3 - z3
+        da, cb = d * a % p, c * b % p
+        x3 = (da + cb) ** 2 % p
+        z3 = x1 * (da - cb) ** 2 % p
+        x2 = aa * bb % p
+        z2 = e * (aa + 121665 * e) % p
+    if swap:
+        x2, z2 = x3, z3
+
+    public = x2 * pow(z2, p - 2, p) % p
+    return base64.urlsafe_b64encode(public.to_bytes(32, "little")).decode().rstrip("=")
+
+
+class FormatVariables(dict):
+    def __missing__(self, key):
+        # Unknown variables are left as they are
+        return key.join("{}")
+
+
+def format_variables(user: UserResponse, server_ip: str = "", server_ipv6: str = "") -> FormatVariables:
+    """
+    Return variables available in host remarks, addresses and paths ({USERNAME}, {DATA_LEFT}, ...).
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    expire_date = time_left = days_left = "∞"
+    if user.status != UserStatus.on_hold:
+        if user.expire is not None and user.expire >= 0:
+            expire_datetime = datetime.datetime.fromtimestamp(user.expire, datetime.timezone.utc)
+            expire_date = str(expire_datetime.date())
+            if now.timestamp() < user.expire:
+                days_left = (expire_datetime - now).days + 1
+                time_left = format_time_left(user.expire - int(now.timestamp()))
+            else:
+                days_left = time_left = "0"
+    else:
+        on_hold_expire_duration = getattr(user, "on_hold_expire_duration", None)
+        if on_hold_expire_duration is not None and on_hold_expire_duration >= 0:
+            days_left = datetime.timedelta(seconds=on_hold_expire_duration).days
+            time_left = format_time_left(on_hold_expire_duration)
+            expire_date = "-"
+
+    if user.data_limit:
+        data_limit = readable_size(user.data_limit)
+        data_left = readable_size(max(user.data_limit - user.used_traffic, 0))
+    else:
+        data_limit = data_left = "∞"
+
+    return FormatVariables(
+        SERVER_IP=server_ip,
+        SERVER_IPV6=server_ipv6,
+        USERNAME=user.username,
+        DATA_USAGE=readable_size(user.used_traffic),
+        DATA_LIMIT=data_limit,
+        DATA_LEFT=data_left,
+        DAYS_LEFT=days_left,
+        EXPIRE_DATE=expire_date,
+        TIME_LEFT=time_left,
+        STATUS_EMOJI=STATUS_EMOJIS.get(user.status, ""),
+    )
+
+
+def parse_inbounds(core_config: dict) -> Dict[str, dict]:
+    """
+    Extract link settings of every proxy inbound from the core config, in config order.
+    Certificates of TLS inbounds are not read, so SNI must be set on hosts for TLS inbounds.
+    """
+    inbounds = {}
+    for inbound in core_config.get("inbounds", []):
+        if inbound.get("protocol") not in PROTOCOLS:
+            continue
+        settings = {
+            "tag": inbound["tag"],
+            "protocol": inbound["protocol"],
+            "port": inbound.get("port"),
+            "network": "tcp",
+            "tls": "none",
+            "sni": [],
+            "host": [],
+            "path": "",
+            "header_type": "",
+        }
+
+        stream = inbound.get("streamSettings")
+        if stream:
+            net = stream.get("network", "tcp")
+            net_settings = stream.get(f"{net}Settings", {})
+            security = stream.get("security")
+            tls_settings = stream.get(f"{security}Settings") or {}
+            settings["network"] = net
+
+            if security == "tls":
+                settings["tls"] = "tls"
+            elif security == "reality":
+                settings["fp"] = "chrome"
+                settings["tls"] = "reality"
+                settings["sni"] = tls_settings.get("serverNames", [])
+                settings["pbk"] = tls_settings.get("publicKey") or x25519_public_key(tls_settings["privateKey"])
+                settings["sids"] = tls_settings.get("shortIds") or [""]
+                settings["spx"] = tls_settings.get("SpiderX", "")
+
+            if net in ("tcp", "raw"):
+                header = net_settings.get("header", {})
+                request = header.get("request", {})
+                path = request.get("path")
+                host = request.get("headers", {}).get("Host")
+                settings["header_type"] = header.get("type", "")
+                if path:
+                    settings["path"] = path[0]
+                if host:
+                    settings["host"] = host
+            elif net == "ws":
+                host = net_settings.get("host", "") or net_settings.get("headers", {}).get("Host")
+                settings["path"] = net_settings.get("path", "")
+                if host:
+                    settings["host"] = [host]
+            elif net in ("grpc", "gun"):
+                settings["path"] = net_settings.get("serviceName", "")
+                settings["host"] = [net_settings.get("authority", "")]
+                settings["multiMode"] = net_settings.get("multiMode", False)
+            elif net == "quic":
+                settings["header_type"] = net_settings.get("header", {}).get("type", "")
+                settings["path"] = net_settings.get("key", "")
+                settings["host"] = [net_settings.get("security", "")]
+            elif net == "httpupgrade":
+                settings["path"] = net_settings.get("path", "")
+                settings["host"] = [net_settings.get("host", "")]
+            elif net == "kcp":
+                header = net_settings.get("header", {})
+                settings["header_type"] = header.get("type", "")
+                settings["host"] = header.get("domain", "")
+                settings["path"] = net_settings.get("seed", "")
+            elif net in ("http", "h2", "h3"):
+                net_settings = stream.get("httpSettings", {})
+                settings["host"] = net_settings.get("host") or net_settings.get("Host", "")
+                settings["path"] = net_settings.get("path", "")
+            else:
+                settings["path"] = net_settings.get("path", "")
+                host = net_settings.get("host") or net_settings.get("Host")
+                if isinstance(host, list):
+                    host = host[0]
+                if host:
+                    settings["host"] = [host]
+
+        inbounds[inbound["tag"]] = settings
+    return inbounds
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in value.split(",")] if value else []
+
+
+def _host_settings(host: Union[dict, ProxyHost]) -> dict:
+    if isinstance(host, ProxyHost):
+        host = host.model_dump()
+    security = str(host.get("security") or "inbound_default")
+    return {
+        "remark": host["remark"],
+        "address": _split(host.get("address")),
+        "port": host.get("port"),
+        "sni": _split(host.get("sni")),
+        "host": _split(host.get("host")),
+        "path": host.get("path"),
+        "tls": None if security == "inbound_default" else security,
+        "alpn": str(host.get("alpn") or ""),
+        "fingerprint": str(host.get("fingerprint") or ""),
+        "allowinsecure": host.get("allowinsecure", host.get("allow_insecure")),
+        "is_disabled": host.get("is_disabled"),
+        "fragment_setting": host.get("fragment_setting"),
+        "use_sni_as_host": host.get("use_sni_as_host"),
+    }
+
+
+def vmess_link(remark: str, address: str, port: int, id: str, inbound: dict) -> str:
+    tls = inbound["tls"]
+    payload = {
+        "add": address,
+        "aid": "0",
+        "host": inbound["host"],
+        "id": str(id),
+        "net": inbound["network"],
+        "path": inbound["path"],
+        "port": port,
+        "ps": remark,
+        "scy": "auto",
+        "tls": tls,
+        "type": inbound["header_type"],
+        "v": "2",
+    }
+    if tls == "tls":
+        payload["sni"] = inbound["sni"]
+        payload["fp"] = inbound["fp"]
+        if inbound["alpn"]:
+            payload["alpn"] = inbound["alpn"]
+        if inbound["fs"]:
+            payload["fragment"] = inbound["fs"]
+        if inbound["ais"]:
+            payload["allowInsecure"] = 1
+    elif tls == "reality":
+        payload["sni"] = inbound["sni"]
+        payload["fp"] = inbound["fp"]
+        payload["pbk"] = inbound.get("pbk", "")
+        payload["sid"] = inbound.get("sid", "")
+        if inbound.get("spx"):
+            payload["spx"] = inbound["spx"]
+
+    if inbound["network"] == "grpc":
+        payload["type"] = "multi" if inbound.get("multiMode") else "gun"
+
+    return "vmess://" + base64.b64encode(json.dumps(payload, sort_keys=True).encode()).decode()
+
+
+def _url_payload(inbound: dict, flow: str = "") -> dict:
+    tls, net, header_type = inbound["tls"], inbound["network"], inbound["header_type"]
+    payload = {"security": tls, "type": net, "headerType": header_type}
+    if flow and tls in ("tls", "reality") and net in ("tcp", "raw", "kcp") and header_type != "http":
+        payload["flow"] = flow
+
+    if net == "grpc":
+        payload["serviceName"] = inbound["path"]
+        payload["authority"] = inbound["host"]
+        payload["mode"] = "multi" if inbound.get("multiMode") else "gun"
+    elif net == "quic":
+        payload["key"] = inbound["path"]
+        payload["quicSecurity"] = inbound["host"]
+    else:
+        payload["path"] = inbound["path"]
+        payload["host"] = inbound["host"]
+
+    if tls == "tls":
+        payload["sni"] = inbound["sni"]
+        payload["fp"] = inbound["fp"]
+        if inbound["alpn"]:
+            payload["alpn"] = inbound["alpn"]
+        if inbound["fs"]:
+            payload["fragment"] = inbound["fs"]
+        if inbound["ais"]:
+            payload["allowInsecure"] = 1
+    elif tls == "reality":
+        payload["sni"] = inbound["sni"]
+        payload["fp"] = inbound["fp"]
+        payload["pbk"] = inbound.get("pbk", "")
+        payload["sid"] = inbound.get("sid", "")
+        if inbound.get("spx"):
+            payload["spx"] = inbound["spx"]
+    return payload
+
+
+def vless_link(remark: str, address: str, port: int, id: str, inbound: dict, flow: str = "") -> str:
+    return (
+        f"vless://{id}@{address}:{port}?"
+        + urlparse.urlencode(_url_payload(inbound, flow))
+        + f"#{urlparse.quote(remark)}"
+    )
+
+
+def trojan_link(remark: str, address: str, port: int, password: str, inbound: dict, flow: str = "") -> str:
+    return (
+        f"trojan://{urlparse.quote(password, safe=':')}@{address}:{port}?"
+        + urlparse.urlencode(_url_payload(inbound, flow))
+        + f"#{urlparse.quote(remark)}"
+    )
+
+
+def shadowsocks_link(remark: str, address: str, port: int, password: str, method: str) -> str:
+    return (
+        "ss://"
+        + base64.b64encode(f"{method}:{password}".encode()).decode()
+        + f"@{address}:{port}#{urlparse.quote(remark)}"
+    )
+
+
+class LinkGenerator:
+    """
+    Renders share links and v2ray (base64) subscriptions from cached core config and hosts.
+    """
+
+    def __init__(
+        self,
+        core_config: dict,
+        hosts: Dict[str, List[Union[dict, ProxyHost]]],
+        server_ip: str = "",
+        server_ipv6: str = "",
+        profile_update_interval: Optional[int] = 12,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        :param core_config: Xray config returned by `get_core_config`.
+        :param hosts: Hosts returned by `get_hosts`.
+        :param server_ip: Value of {SERVER_IP} variable.
+        :param server_ipv6: Value of {SERVER_IPV6} variable.
+        :param profile_update_interval: Value of profile-update-interval header in hours.
+        :param rng: Random generator used to pick SNI, host, address and short id from lists.
+        """
+        self.server_ip = server_ip
+        self.server_ipv6 = server_ipv6
+        self.profile_update_interval = profile_update_interval
+        self.rng = rng or random.Random()
+        self.update(core_config, hosts)
+
+    def update(self, core_config: dict, hosts: Dict[str, List[Union[dict, ProxyHost]]]) -> None:
+        self.inbounds = parse_inbounds(core_config)
+        self.hosts = {
+            tag: [settings for settings in map(_host_settings, tag_hosts) if not settings["is_disabled"]]
+            for tag, tag_hosts in hosts.items()
+        }
+        self._order = {tag: index for index, tag in enumerate(self.inbounds)}
+
+    @classmethod
+    async def from_api(cls, api: Any, **kwargs) -> "LinkGenerator":
+        core_config, hosts = await asyncio.gather(api.get_core_config(), api.get_hosts())
+        return cls(core_config, hosts, **kwargs)
+
+    async def refresh(self, api: Any) -> None:
+        core_config, hosts = await asyncio.gather(api.get_core_config(), api.get_hosts())
+        self.update(core_config, hosts)
+
+    def _choice(self, values: List[str]) -> str:
+        if not values:
+            return ""
+        return self.rng.choice(values).replace("*", secrets.token_hex(8))
+
+    def links(self, user: UserResponse) -> List[str]:
+        """
+        Return share links of the user in the same order as the panel.
+        """
+        variables = format_variables(user, self.server_ip, self.server_ipv6)
+        tags = [(protocol, tag) for protocol, protocol_tags in user.inbounds.items() for tag in protocol_tags]
+        tags.sort(key=lambda item: self._order.get(item[1], float("inf")))
+
+        links = []
+        for protocol, tag in tags:
+            settings = user.proxies.get(protocol)
+            inbound = self.inbounds.get(tag)
+            if not settings or not inbound:
+                continue
+            variables.update(PROTOCOL=protocol, TRANSPORT=inbound["network"])
+
+            for host in self.hosts.get(tag, []):
+                sni = self._choice(host["sni"] or inbound["sni"])
+                sid = self.rng.choice(inbound["sids"]) if inbound.get("sids") else ""
+                req_host = self._choice(host["host"] or inbound["host"])
+                address = self._choice(host["address"])
+                if host["path"] is not None:
+                    path = host["path"].format_map(variables)
+                else:
+                    path = inbound["path"].format_map(variables)
+                if host["use_sni_as_host"] and sni:
+                    req_host = sni
+
+                host_inbound = dict(
+                    inbound,
+                    sni=sni,
+                    sid=sid,
+                    host=req_host,
+                    path=path,
+                    tls=inbound["tls"] if host["tls"] is None else host["tls"],
+                    alpn=host["alpn"] or None,
+                    fp=host["fingerprint"] or inbound.get("fp", ""),
+                    ais=host["allowinsecure"] or "",
+                    fs=host["fragment_setting"] or "",
+                )
+                links.append(self._link(
+                    protocol,
+                    remark=host["remark"].format_map(variables),
+                    address=address.format_map(variables),
+                    port=host["port"] or inbound["port"],
+                    settings=settings,
+                    inbound=host_inbound,
+                ))
+        return links
+
+    @staticmethod
+    def _link(protocol: str, remark: str, address: str, port: int, settings: dict, inbound: dict) -> str:
+        if protocol == "vmess":
+            return vmess_link(remark, address, port, settings["id"], inbound)
+        if protocol == "vless":
+            return vless_link(remark, address, port, settings["id"], inbound, settings.get("flow", ""))
+        if protocol == "trojan":
+            return trojan_link(remark, address, port, settings["password"], inbound, settings.get("flow", ""))
+        return shadowsocks_link(remark, address, port, settings["password"], settings["method"])
+
+    def subscription(self, user: UserResponse) -> str:
+        """
+        Return v2ray subscription body: base64 of newline separated links.
+        """
+        return base64.b64encode("\n".join(self.links(user)).encode()).decode()
+
+    def subscription_content(self, user: UserResponse) -> SubscriptionContent:
+        """
+        Return v2ray subscription with the headers the panel sends along with it.
+        """
+        userinfo = {
+            "upload": 0,
+            "download": user.used_traffic,
+            "total": user.data_limit or 0,
+            "expire": user.expire or 0,
+        }
+        headers = {
+            "content-type": "text/plain; charset=utf-8",
+            "content-disposition": f'attachment; filename="{user.username}"',
+            "subscription-userinfo": "; ".join(f"{key}={value}" for key, value in userinfo.items()),
+        }
+        if self.profile_update_interval is not None:
+            headers["profile-update-interval"] = str(self.profile_update_interval)
+        return SubscriptionContent(body=self.subscription(user).encode(), headers=headers)
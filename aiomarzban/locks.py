@@ -0,0 +1,79 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Hashable, AsyncIterator
+
+
+class _Entry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Coroutines holding or waiting for the lock
+        self.users = 0
+
+
+class KeyedLock:
+    """
+    Async locks by key (e.g. username): operations with the same key run one at a time,
+    operations with different keys run in parallel.
+
+    Locks are created on demand and dropped as soon as nobody holds or waits for them, so memory
+    is proportional to the number of keys in use, not to the key space.
+    With `max_keys` at most that many keys are locked at once, other keys wait for a free slot.
+    Locks are not reentrant.
+    """
+
+    def __init__(self, max_keys: Optional[int] = None):
+        """
+        :param max_keys: Maximum number of keys locked at the same time. Unlimited by default.
+        """
+        self.max_keys = max_keys
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._slots = asyncio.Semaphore(max_keys) if max_keys else None
+
+    async def acquire(self, key: Hashable) -> None:
+        entry = self._entries.get(key)
+        if entry is None and self._slots is not None:
+            await self._slots.acquire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                # The key was taken while waiting for the slot
+                self._slots.release()
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        entry.users += 1
+        try:
+            await entry.lock.acquire()
+        except BaseException:
+            self._leave(key, entry)
+            raise
+
+    def release(self, key: Hashable) -> None:
+        entry = self._entries[key]
+        entry.lock.release()
+        self._leave(key, entry)
+
+    def _leave(self, key: Hashable, entry: _Entry) -> None:
+        entry.users -= 1
+        if not entry.users:
+            del self._entries[key]
+            if self._slots is not None:
+                self._slots.release()
+
+    @asynccontextmanager
+    async def __call__(self, key: Hashable) -> AsyncIterator[None]:
+        """
+        Hold the lock of the key: `async with locks(username): ...`.
+        """
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def locked(self, key: Any) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.lock.locked()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,251 @@
+import re
+from bisect import bisect_left
+from typing import Optional, List, Dict, Tuple, Iterable
+
+from pydantic import BaseModel
+
+# Routes of the panel API, used to keep metric labels bounded: /user/alice -> /user/{username}
+API_ROUTES = (
+    "/admin/token",
+    "/admin",
+    "/admins",
+    "/admin/{username}",
+    "/admin/{username}/users/disable",
+    "/admin/{username}/users/activate",
+    "/admin/usage/reset/{username}",
+    "/admin/usage/{username}",
+    "/core",
+    "/core/restart",
+    "/core/config",
+    "/node/settings",
+    "/node",
+    "/node/{node_id}",
+    "/node/{node_id}/reconnect",
+    "/nodes",
+    "/nodes/usage",
+    "/system",
+    "/inbounds",
+    "/hosts",
+    "/user_template",
+    "/user_template/{template_id}",
+    "/user",
+    "/user/{username}",
+    "/user/{username}/reset",
+    "/user/{username}/revoke_sub",
+    "/user/{username}/usage",
+    "/user/{username}/active-next",
+    "/user/{username}/set-owner",
+    "/users",
+    "/users/reset",
+    "/users/usage",
+    "/users/expired",
+)
+
+SUBSCRIPTION_ROUTES = (
+    "/{token}",
+    "/{token}/info",
+    "/{token}/usage",
+    "/{token}/{client_type}",
+)
+
+UNMATCHED_ROUTE = "{unmatched}"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _compile(templates: Iterable[str]) -> Tuple[Dict[str, str], List[Tuple[re.Pattern, str]]]:
+    static, dynamic = {}, []
+    for template in templates:
+        if "{" not in template:
+            static[template] = template
+        else:
+            dynamic.append((re.compile("^" + re.sub(r"\{\w+}", "[^/]+", template) + "$"), template))
+    return static, dynamic
+
+
+_API_STATIC, _API_DYNAMIC = _compile(API_ROUTES)
+_, _SUBSCRIPTION_DYNAMIC = _compile(SUBSCRIPTION_ROUTES)
+
+
+def route_template(path: str, sub_path: Optional[str] = None) -> str:
+    """
+    Return route template of the request path, e.g. "/user/{username}" for "/user/alice".
+    Unknown paths are reported as "{unmatched}".
+
+    :param path: Request path relative to the api url (or panel root for subscription routes).
+    :param sub_path: Subscription path of the panel. Subscription routes are matched if provided.
+    """
+    route = _API_STATIC.get(path)
+    if route is not None:
+        return route
+    if sub_path:
+        prefix = f"/{sub_path}"
+        if path.startswith(prefix + "/"):
+            rest = path[len(prefix):]
+            for pattern, template in _SUBSCRIPTION_DYNAMIC:
+                if pattern.match(rest):
+                    return prefix + template
+    for pattern, template in _API_DYNAMIC:
+        if pattern.match(path):
+            return template
+    return UNMATCHED_ROUTE
+
+
+class RouteMetrics(BaseModel):
+    method: str
+    route: str
+    requests: int
+    statuses: Dict[str, int]
+    retries: Dict[str, int]
+    duration_sum: float
+    buckets: Dict[str, int]
+    bytes_sent: int
+    bytes_received: int
+
+
+class _RouteStats:
+    __slots__ = ("statuses", "retries", "counts", "duration_sum", "bytes_sent", "bytes_received")
+
+    def __init__(self, buckets: int):
+        self.statuses: Dict[str, int] = {}
+        self.retries: Dict[str, int] = {}
+        self.counts = [0] * (buckets + 1)
+        self.duration_sum = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_le(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class MetricsRegistry:
+    """
+    In-memory metrics of requests sent by `MarzbanAPI`, labelled by method and route template.
+
+    Every HTTP attempt is recorded with its status ("error" if no response was received), latency and size.
+    Retries are counted by reason and token refresh time is accumulated separately.
+    Read with `routes()` or export with `to_prometheus()`.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS, namespace: str = "marzban_client"):
+        """
+        :param buckets: Upper bounds of latency histogram buckets in seconds.
+        :param namespace: Prefix of exported metric names.
+        """
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.namespace = namespace
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+        self.token_refreshes = 0
+        self.token_refresh_errors = 0
+        self.token_refresh_seconds = 0.0
+
+    def _stats(self, method: str, route: str) -> _RouteStats:
+        stats = self._routes.get((method, route))
+        if stats is None:
+            stats = self._routes[(method, route)] = _RouteStats(len(self.buckets))
+        return stats
+
+    def observe_request(
+        self,
+        method: str,
+        route: str,
+        status: str,
+        duration: float,
+        bytes_sent: int = 0,
+        bytes_received: int = 0,
+    ) -> None:
+        stats = self._stats(method, route)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.counts[bisect_left(self.buckets, duration)] += 1
+        stats.duration_sum += duration
+        stats.bytes_sent += bytes_sent
+        stats.bytes_received += bytes_received
+
+    def observe_retry(self, method: str, route: str, reason: str) -> None:
+        stats = self._stats(method, route)
+        stats.retries[reason] = stats.retries.get(reason, 0) + 1
+
+    def observe_token_refresh(self, duration: float, error: bool = False) -> None:
+        self.token_refreshes += 1
+        self.token_refresh_seconds += duration
+        if error:
+            self.token_refresh_errors += 1
+
+    def reset(self) -> None:
+        self._routes.clear()
+        self.token_refreshes = 0
+        self.token_refresh_errors = 0
+        self.token_refresh_seconds = 0.0
+
+    def routes(self) -> List[RouteMetrics]:
+        """
+        Return metrics of every route, sorted by total time spent in requests (slowest first).
+        """
+        result = []
+        for (method, route), stats in self._routes.items():
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + (float("inf"),), stats.counts):
+                cumulative += count
+                buckets[_format_le(bound)] = cumulative
+            result.append(RouteMetrics(
+                method=method,
+                route=route,
+                requests=cumulative,
+                statuses=dict(stats.statuses),
+                retries=dict(stats.retries),
+                duration_sum=stats.duration_sum,
+                buckets=buckets,
+                bytes_sent=stats.bytes_sent,
+                bytes_received=stats.bytes_received,
+            ))
+        result.sort(key=lambda item: item.duration_sum, reverse=True)
+        return result
+
+    def to_prometheus(self) -> str:
+        """
+        Return metrics in Prometheus text exposition format.
+        """
+        ns = self.namespace
+        requests, duration, retries, sent, received = [], [], [], [], []
+        for item in self.routes():
+            labels = f'method="{_escape(item.method)}",route="{_escape(item.route)}"'
+            for status, count in item.statuses.items():
+                requests.append(f'{ns}_requests_total{{{labels},status="{_escape(status)}"}} {count}')
+            for reason, count in item.retries.items():
+                retries.append(f'{ns}_retries_total{{{labels},reason="{_escape(reason)}"}} {count}')
+            for le, count in item.buckets.items():
+                duration.append(f'{ns}_request_duration_seconds_bucket{{{labels},le="{le}"}} {count}')
+            duration.append(f"{ns}_request_duration_seconds_sum{{{labels}}} {item.duration_sum}")
+            duration.append(f"{ns}_request_duration_seconds_count{{{labels}}} {item.requests}")
+            sent.append(f"{ns}_request_bytes_total{{{labels}}} {item.bytes_sent}")
+            received.append(f"{ns}_response_bytes_total{{{labels}}} {item.bytes_received}")
+
+        lines = []
+        for name, kind, help_text, samples in (
+            ("requests_total", "counter", "HTTP requests sent to the panel.", requests),
+            ("request_duration_seconds", "histogram", "Latency of HTTP requests.", duration),
+            ("retries_total", "counter", "Retried requests by reason.", retries),
+            ("request_bytes_total", "counter", "Bytes of request bodies.", sent),
+            ("response_bytes_total", "counter", "Bytes of response bodies.", received),
+        ):
+            lines.append(f"# HELP {ns}_{name} {help_text}")
+            lines.append(f"# TYPE {ns}_{name} {kind}")
+            lines.extend(samples)
+
+        lines.append(f"# HELP {ns}_token_refreshes_total Access token refreshes.")
+        lines.append(f"# TYPE {ns}_token_refreshes_total counter")
+        lines.append(f"{ns}_token_refreshes_total {self.token_refreshes}")
+        lines.append(f"# HELP {ns}_token_refresh_errors_total Failed access token refreshes.")
+        lines.append(f"# TYPE {ns}_token_refresh_errors_total counter")
+        lines.append(f"{ns}_token_refresh_errors_total {self.token_refresh_errors}")
+        lines.append(f"# HELP {ns}_token_refresh_seconds_total Time spent refreshing the access token.")
+        lines.append(f"# TYPE {ns}_token_refresh_seconds_total counter")
+        lines.append(f"{ns}_token_refresh_seconds_total {self.token_refresh_seconds}")
+        return "\n".join(lines) + "\n"
+
@@ -0,0 +1,50 @@
+from functools import partial
+from typing import Optional, Callable, Awaitable, Sequence
+
+from .transport import Request, Response
+
+CallNext = Callable[[Request], Awaitable[Response]]
+
+
+class Middleware:
+    """
+    Base class of request middlewares (interceptors).
+
+    Override any of the hooks:
+    - `before_request` may change the request or return a response to skip sending it (e.g. cache, fault injection);
+    - `after_response` may inspect or replace the response;
+    - `on_error` is called when sending fails (connection error, timeout) and may return a response instead.
+
+    For full control (e.g. timing or retries around the call) override `__call__` and await `call_next(request)`.
+    Middlewares run in registration order: the first one sees the request first and the response last.
+    """
+
+    async def before_request(self, request: Request) -> Optional[Response]:
+        return None
+
+    async def after_response(self, request: Request, response: Response) -> Response:
+        return response
+
+    async def on_error(self, request: Request, error: Exception) -> Optional[Response]:
+        return None
+
+    async def __call__(self, request: Request, call_next: CallNext) -> Response:
+        response = await self.before_request(request)
+        if response is None:
+            try:
+                response = await call_next(request)
+            except Exception as e:
+                response = await self.on_error(request, e)
+                if response is None:
+                    raise
+        return await self.after_response(request, response)
+
+
+def build_chain(middlewares: Sequence[Middleware], send: CallNext) -> CallNext:
+    """
+    Wrap `send` into middlewares. Returns `send` itself when there are no middlewares.
+    """
+    call_next = send
+    for middleware in reversed(middlewares):
+        call_next = partial(middleware, call_next=call_next)
+    return call_next
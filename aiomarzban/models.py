@@ -1,11 +1,17 @@
+import json
 from typing import Optional, List, Union, Dict, Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel as _BaseModel, ConfigDict
 
 from aiomarzban.enums import NodeStatus, ProxyHostSecurity, ProxyHostFingerprint, ProxyHostALPN, ProxyTypes, \
     UserDataLimitResetStrategy, UserStatus, UserStatusCreate, UserStatusModify
 
 
+class BaseModel(_BaseModel):
+    # Validators are built on first use instead of import, most programs use only a few models
+    model_config = ConfigDict(defer_build=True)
+
+
 # ADMIN
 
 class Admin(BaseModel):
@@ -164,6 +170,27 @@ class SubscriptionUserResponse(BaseModel):
     subscription_url: str = ""
 
 
+class SubscriptionContent(BaseModel):
+    body: bytes
+    headers: Dict[str, str] = {}
+    status: int = 200
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self.headers.get("content-type")
+
+    def text(self) -> str:
+        return self.body.decode()
+
+    def decode(self) -> Any:
+        """
+        Return parsed JSON for JSON responses (info, sing-box, v2ray-json) and text otherwise (base64, YAML).
+        """
+        if "json" in (self.content_type or ""):
+            return json.loads(self.body)
+        return self.text()
+
+
 class SystemStats(BaseModel):
     version: str
     mem_total: int
@@ -239,6 +266,7 @@ class UserResponse(BaseModel):
     sub_updated_at: Optional[str] = None
     sub_last_user_agent: Optional[str] = None
     online_at: Optional[str] = None
+    on_hold_expire_duration: Optional[int] = None
     on_hold_timeout: Optional[str] = None
     auto_delete_in_days: Optional[int] = None
     next_plan: Optional[NextPlanModel] = None
@@ -332,7 +360,7 @@ class GetUsersParams(BaseModel):
     limit: Optional[int] = None
     username: Optional[List[str]] = None
     search: Optional[str] = None
-    admin: Optional[str] = None
+    admin: Optional[List[str]] = None
     status: Optional[UserStatus] = None
     sort: Optional[str] = None
 
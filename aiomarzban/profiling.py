@@ -0,0 +1,240 @@
+"""
+Time attribution of client calls: where the time of e.g. `get_users` goes.
+
+Phases:
+- queue_wait: waiting for a free connection in the pool;
+- connect: opening a new connection (DNS, TCP, TLS);
+- ttfb: sending the request and waiting for response headers (panel processing and network);
+- body_read: reading the response body;
+- decode: JSON decoding;
+- validation: building pydantic models and everything else the method does outside of requests;
+- retry: attempts which failed with connection error or timeout and were retried.
+"""
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Optional, List, Dict, Tuple, Any
+
+import aiohttp
+from pydantic import BaseModel
+
+PHASES = ("queue_wait", "connect", "ttfb", "body_read", "decode", "validation", "retry")
+
+# Public methods which are not calls to the panel
+NOT_PROFILED = {"close", "add_middleware"}
+
+
+class _Frame:
+    __slots__ = ("stack", "inner", "busy")
+
+    def __init__(self, stack: Tuple[str, ...]):
+        self.stack = stack
+        self.inner = 0.0
+        self.busy = 0
+
+
+_current_frame: ContextVar[Optional[_Frame]] = ContextVar("aiomarzban_profile_frame", default=None)
+
+
+class RequestTrace:
+    """
+    Timestamps of a single HTTP attempt, filled by aiohttp trace callbacks.
+    """
+
+    __slots__ = ("stack", "started", "queue_wait", "connect", "headers_received")
+
+    def __init__(self, stack: Tuple[str, ...]):
+        self.stack = stack
+        self.started = time.perf_counter()
+        self.queue_wait = 0.0
+        self.connect = 0.0
+        self.headers_received: Optional[float] = None
+
+
+class PhaseStats(BaseModel):
+    endpoint: str
+    phase: str
+    count: int
+    seconds: float
+
+
+class Profiler:
+    """
+    Opt-in profiler of `MarzbanAPI` calls. Pass it as `MarzbanAPI(..., profiler=Profiler())`.
+
+    Phases are aggregated per endpoint (public method name) and per call stack (for flamegraphs).
+    Connection phases are only measured on sessions created by the client; for external sessions
+    add `profiler.trace_config` to their `trace_configs`, otherwise the whole request is reported as ttfb.
+    """
+
+    def __init__(self):
+        self._stacks: Dict[Tuple[str, ...], List[float]] = {}
+        self.trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=SimpleNamespace)
+        self.trace_config.on_connection_queued_start.append(self._on_queued_start)
+        self.trace_config.on_connection_queued_end.append(self._on_queued_end)
+        self.trace_config.on_connection_create_start.append(self._on_create_start)
+        self.trace_config.on_connection_create_end.append(self._on_create_end)
+        self.trace_config.on_request_end.append(self._on_request_end)
+
+    # Recording
+
+    def add(self, stack: Tuple[str, ...], phase: str, seconds: float) -> None:
+        key = stack + (phase,)
+        entry = self._stacks.get(key)
+        if entry is None:
+            self._stacks[key] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def reset(self) -> None:
+        self._stacks.clear()
+
+    def instrument(self, api: Any) -> None:
+        """
+        Wrap public coroutine methods of the client instance to attribute time to them.
+        """
+        for name, method in inspect.getmembers(api, inspect.iscoroutinefunction):
+            if not name.startswith("_") and name not in NOT_PROFILED:
+                setattr(api, name, self._wrap(name, method))
+
+    def _wrap(self, name: str, method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            parent = _current_frame.get()
+            frame = _Frame((parent.stack if parent is not None else ()) + (name,))
+            token = _current_frame.set(frame)
+            counted = self.enter(parent)
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                _current_frame.reset(token)
+                self.exit(parent, counted, elapsed)
+                self.add(frame.stack, "validation", max(elapsed - frame.inner, 0.0))
+
+        return wrapper
+
+    @staticmethod
+    def current_stack() -> Tuple[str, ...]:
+        frame = _current_frame.get()
+        return frame.stack if frame is not None else ()
+
+    @staticmethod
+    def enter(frame: Optional[_Frame] = None) -> bool:
+        """
+        Mark start of a child (request or nested call) of the frame. Only outermost children are counted,
+        so that a token refresh inside a request is not subtracted twice.
+        """
+        frame = frame if frame is not None else _current_frame.get()
+        if frame is None:
+            return False
+        frame.busy += 1
+        return frame.busy == 1
+
+    @staticmethod
+    def exit(frame: Optional[_Frame], counted: bool, elapsed: float) -> None:
+        frame = frame if frame is not None else _current_frame.get()
+        if frame is None:
+            return
+        frame.busy -= 1
+        if counted:
+            frame.inner += elapsed
+
+    def start_request(self, method: str, route: str) -> RequestTrace:
+        return RequestTrace(self.current_stack() + (f"{method} {route}",))
+
+    def end_request(self, trace: RequestTrace) -> None:
+        now = time.perf_counter()
+        self.add(trace.stack, "queue_wait", trace.queue_wait)
+        self.add(trace.stack, "connect", trace.connect)
+        if trace.headers_received is None:
+            self.add(trace.stack, "ttfb", now - trace.started - trace.queue_wait - trace.connect)
+            self.add(trace.stack, "body_read", 0.0)
+        else:
+            self.add(trace.stack, "ttfb", trace.headers_received - trace.started - trace.queue_wait - trace.connect)
+            self.add(trace.stack, "body_read", now - trace.headers_received)
+
+    # aiohttp trace callbacks
+
+    @staticmethod
+    def _trace(ctx: SimpleNamespace) -> Optional[RequestTrace]:
+        trace = ctx.trace_request_ctx
+        return trace if isinstance(trace, RequestTrace) else None
+
+    async def _on_queued_start(self, session, ctx, params) -> None:
+        ctx.queued = time.perf_counter()
+
+    async def _on_queued_end(self, session, ctx, params) -> None:
+        trace = self._trace(ctx)
+        if trace is not None:
+            trace.queue_wait += time.perf_counter() - ctx.queued
+
+    async def _on_create_start(self, session, ctx, params) -> None:
+        ctx.connecting = time.perf_counter()
+
+    async def _on_create_end(self, session, ctx, params) -> None:
+        trace = self._trace(ctx)
+        if trace is not None:
+            trace.connect += time.perf_counter() - ctx.connecting
+
+    async def _on_request_end(self, session, ctx, params) -> None:
+        trace = self._trace(ctx)
+        if trace is not None:
+            trace.headers_received = time.perf_counter()
+
+    # Reports
+
+    def summary(self) -> List[PhaseStats]:
+        """
+        Return phase totals per endpoint (innermost public method).
+        Requests made outside of public methods are reported under their route.
+        """
+        totals: Dict[Tuple[str, str], List[float]] = {}
+        for key, (seconds, count) in self._stacks.items():
+            stack, phase = key[:-1], key[-1]
+            methods = [name for name in stack if " " not in name]
+            endpoint = methods[-1] if methods else stack[-1]
+            entry = totals.setdefault((endpoint, phase), [0.0, 0])
+            entry[0] += seconds
+            entry[1] += count
+        result = [
+            PhaseStats(endpoint=endpoint, phase=phase, count=int(count), seconds=seconds)
+            for (endpoint, phase), (seconds, count) in totals.items()
+        ]
+        result.sort(key=lambda item: (item.endpoint, PHASES.index(item.phase)))
+        return result
+
+    def format_summary(self) -> str:
+        """
+        Return summary as a text table: one row per endpoint, one column per phase (milliseconds).
+        """
+        rows: Dict[str, Dict[str, float]] = {}
+        for item in self.summary():
+            rows.setdefault(item.endpoint, {})[item.phase] = item.seconds * 1000
+        header = f"{'endpoint':<32}" + "".join(f"{phase:>12}" for phase in PHASES) + f"{'total':>12}"
+        lines = [header]
+        for endpoint, phases in sorted(rows.items(), key=lambda row: -sum(row[1].values())):
+            lines.append(
+                f"{endpoint:<32}"
+                + "".join(f"{phases.get(phase, 0.0):>12.2f}" for phase in PHASES)
+                + f"{sum(phases.values()):>12.2f}"
+            )
+        return "\n".join(lines)
+
+    def collapsed(self) -> str:
+        """
+        Return stacks in collapsed format (`a;b;c <microseconds>`) for flamegraph.pl, speedscope, etc.
+        """
+        return "\n".join(
+            f"{';'.join(key)} {round(seconds * 1_000_000)}"
+            for key, (seconds, _) in sorted(self._stacks.items())
+            if seconds > 0
+        ) + "\n"
+
+    def dump_collapsed(self, path: str) -> None:
+        with open(path, "w") as f:
+            f.write(self.collapsed())
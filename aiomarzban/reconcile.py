@@ -0,0 +1,244 @@
+"""
+Declarative user sync: describe the desired users, get the minimal list of API operations to reach them.
+
+Only fields set in a `UserSpec` are managed, other fields of the user are left as they are.
+"""
+from typing import Optional, Dict, List, Any, Iterable, Literal
+
+from pydantic import BaseModel
+
+from .enums import UserDataLimitResetStrategy
+from .journal import BulkJob
+from .models import NextPlanModel, UserCreate
+from .utils import gb_to_bytes
+
+# Desired status -> actual statuses which satisfy it. Expired and limited are set by the panel,
+# on_hold users become active on first connection.
+_STATUSES = {
+    "active": ("active", "expired", "limited"),
+    "disabled": ("disabled",),
+    "on_hold": ("on_hold", "active", "expired", "limited"),
+}
+
+# Usernames per `get_users` request when actual state is fetched by username
+_USERNAMES_PER_REQUEST = 100
+
+
+class UserSpec(BaseModel):
+    """
+    Desired state of a user. Fields which are not passed are not managed.
+    """
+
+    username: str
+    expire: Optional[int] = None
+    data_limit: Optional[int] = None  # GB, like `MarzbanAPI.add_user`
+    data_limit_reset_strategy: Optional[UserDataLimitResetStrategy] = None
+    inbounds: Optional[Dict[str, List[str]]] = None
+    proxies: Optional[Dict[str, Any]] = None
+    note: Optional[str] = None
+    status: Optional[Literal["active", "disabled", "on_hold"]] = None
+    on_hold_expire_duration: Optional[int] = None
+    next_plan: Optional[NextPlanModel] = None
+
+    def fields(self) -> Dict[str, Any]:
+        """
+        Managed fields in API units (data limit in bytes). Unlimited expire and data limit are sent as 0,
+        because the panel ignores None in modifications.
+        """
+        fields = self.model_dump(mode="json", include=self.model_fields_set - {"username"})
+        if "data_limit" in fields:
+            fields["data_limit"] = gb_to_bytes(fields["data_limit"]) or 0
+        if "expire" in fields:
+            fields["expire"] = fields["expire"] or 0
+        return fields
+
+
+class ReconcileOperation(BaseModel):
+    action: Literal["add", "modify", "remove"]
+    username: str
+    # Fields to send, in API units. Empty for "remove".
+    changes: Dict[str, Any] = {}
+
+
+class ReconcilePlan(BaseModel):
+    operations: List[ReconcileOperation] = []
+    unchanged: int = 0
+    applied: int = 0
+    errors: Dict[str, str] = {}
+
+    def count(self, action: str) -> int:
+        return sum(1 for operation in self.operations if operation.action == action)
+
+    def format(self) -> str:
+        text = (
+            f"add {self.count('add')}, modify {self.count('modify')}, remove {self.count('remove')}, "
+            f"unchanged {self.unchanged}"
+        )
+        if self.applied or self.errors:
+            text += f"; applied {self.applied}, failed {len(self.errors)}"
+        return text
+
+
+def _normalize(field: str, value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        value = value.model_dump(mode="json")
+    if hasattr(value, "value"):
+        value = value.value
+    if field in ("expire", "data_limit"):
+        # 0 and None both mean "unlimited"
+        return value or None
+    if field == "inbounds":
+        return {protocol: sorted(tags) for protocol, tags in (value or {}).items()}
+    if field == "proxies":
+        # Proxy settings (ids, passwords) are generated by the panel, only protocols are compared
+        return sorted(value or {})
+    return value
+
+
+def diff_user(spec: UserSpec, actual: Any) -> Dict[str, Any]:
+    """
+    Fields of the spec which differ from the actual user.
+
+    :param spec: Desired state.
+    :param actual: `UserResponse` or an object with the same attributes (e.g. a `Snapshot` record).
+    :return: Changes in API units, empty if the user is up to date.
+    """
+    changes = {}
+    for field, value in spec.fields().items():
+        current = getattr(actual, field, None)
+        if field == "status":
+            if value is not None and getattr(current, "value", current) not in _STATUSES[value]:
+                changes[field] = value
+        elif _normalize(field, value) != _normalize(field, current):
+            changes[field] = value
+    return changes
+
+
+class Reconciler:
+    """
+    Brings users of the panel to the desired state with the least number of requests.
+
+    Example:
+        reconciler = Reconciler(api, concurrency=20)
+        specs = [UserSpec(username=row.username, expire=row.expire, data_limit=row.gb) for row in rows]
+        plan = await reconciler.reconcile(specs, dry_run=True)
+        print(plan.format())
+    """
+
+    def __init__(
+        self,
+        api: Any,
+        concurrency: int = 10,
+        page_size: int = 1000,
+        remove_missing: bool = False,
+        admins: Optional[List[str]] = None,
+    ):
+        """
+        :param api: `MarzbanAPI` of the panel.
+        :param concurrency: Maximum number of operations in flight.
+        :param page_size: Users per `get_users` request when actual state is fetched.
+        :param remove_missing: Remove users of the panel which have no spec.
+        :param admins: Manage only users of these admins (limits both fetching and removal).
+        """
+        self.api = api
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.remove_missing = remove_missing
+        self.admins = admins
+
+    async def fetch_actual(self, usernames: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Fetch users of the panel: only the given usernames when there are few of them, otherwise all pages.
+        """
+        users: Dict[str, Any] = {}
+        if usernames is not None and len(usernames) <= self.page_size:
+            for i in range(0, len(usernames), _USERNAMES_PER_REQUEST):
+                page = await self.api.get_users(username=usernames[i:i + _USERNAMES_PER_REQUEST], admin=self.admins)
+                users.update((user.username, user) for user in page.users)
+            return users
+
+        offset = 0
+        while True:
+            page = await self.api.get_users(offset=offset, limit=self.page_size, admin=self.admins, sort="created_at")
+            users.update((user.username, user) for user in page.users)
+            offset += self.page_size
+            if len(page.users) < self.page_size or offset >= page.total:
+                return users
+
+    async def plan(self, specs: Iterable[UserSpec], actual: Optional[Iterable[Any]] = None) -> ReconcilePlan:
+        """
+        Compute operations without applying them.
+
+        :param specs: Desired users.
+        :param actual: Current users, e.g. from a mirror or `Snapshot.users`. Fetched from the panel if not passed.
+        :return: `ReconcilePlan`
+        """
+        specs = {spec.username: spec for spec in specs}
+        if actual is None:
+            current = await self.fetch_actual(None if self.remove_missing else list(specs))
+        else:
+            current = {user.username: user for user in actual}
+
+        plan = ReconcilePlan()
+        for username, spec in specs.items():
+            user = current.get(username)
+            if user is None:
+                plan.operations.append(ReconcileOperation(action="add", username=username, changes=spec.fields()))
+                continue
+            changes = diff_user(spec, user)
+            if changes:
+                plan.operations.append(ReconcileOperation(action="modify", username=username, changes=changes))
+            else:
+                plan.unchanged += 1
+        if self.remove_missing:
+            for username in current:
+                if username not in specs:
+                    plan.operations.append(ReconcileOperation(action="remove", username=username))
+        return plan
+
+    async def _apply_operation(self, operation: ReconcileOperation) -> None:
+        api = self.api
+        username = operation.username
+        changes = dict(operation.changes)
+        async with api.user_locks(username):
+            if operation.action == "add":
+                status = changes.pop("status", None)
+                data = UserCreate(
+                    username=username,
+                    proxies=changes.pop("proxies", None) or api.default_proxies,
+                    inbounds=changes.pop("inbounds", None) or api.default_inbounds,
+                    status="on_hold" if status == "on_hold" else "active",
+                    **changes,
+                )
+                await api._add_user(data)
+                if status == "disabled":
+                    await api._modify_user(username, {"status": "disabled"})
+            elif operation.action == "modify":
+                await api._modify_user(username, changes)
+            else:
+                await api.remove_user(username)
+
+    async def apply(self, plan: ReconcilePlan) -> ReconcilePlan:
+        """
+        Run operations of the plan concurrently. Failed operations don't stop the others,
+        they are collected in `plan.errors`.
+        """
+        job = BulkJob(concurrency=self.concurrency)
+        progress = await job.run(plan.operations, self._apply_operation, key=lambda operation: operation.username)
+        plan.applied = progress.done
+        plan.errors = {username: f"{type(error).__name__}: {error}" for username, error in job.errors.items()}
+        return plan
+
+    async def reconcile(
+        self,
+        specs: Iterable[UserSpec],
+        actual: Optional[Iterable[Any]] = None,
+        dry_run: bool = False,
+    ) -> ReconcilePlan:
+        """
+        Plan and apply operations. With `dry_run` only the plan is returned.
+        """
+        plan = await self.plan(specs, actual)
+        if dry_run:
+            return plan
+        return await self.apply(plan)
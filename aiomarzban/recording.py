@@ -0,0 +1,343 @@
+"""
+Recording of client traffic to JSONL and its replay, e.g. to reproduce production load against a local panel.
+
+Every line of a recording is a JSON object:
+{"timestamp": 1700000000.123, "method": "GET", "api": "api", "path": "/user/john", "route": "/user/{username}",
+ "params": null, "json": null, "data": null, "user_agent": null, "status": 200, "error": null, "duration": 0.0123,
+ "size": 1345}
+
+"api" is "api" for panel API requests and "sub" for subscription requests. Credentials (passwords, tokens,
+subscription links) in form, JSON and response bodies are redacted, proxy settings of users are dropped (the replay
+panel generates new ones) and headers other than User-Agent are not recorded. Subscription tokens in paths are
+replaced with a stable hash ("token-" and 16 hex digits), so requests of one subscription can still be grouped.
+"""
+import asyncio
+import hashlib
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, List, Dict, Any, Iterable, Union, TextIO
+
+from pydantic import BaseModel
+
+from .middleware import Middleware, CallNext, build_chain
+from .transport import Request, Response, aiohttp_send
+
+REDACTED = "***"
+SECRET_FIELDS = ("password", "client_secret", "access_token", "subscription_url", "links")
+
+# Requests which are not replayed: the replay driver authenticates with its own client
+NOT_REPLAYED = {("POST", "/admin/token")}
+
+
+class RecordingMiddleware(Middleware):
+    """
+    Middleware appending every request and its response (or error) to a JSONL file.
+    Add it first to record requests as they are sent by the client code, or last to record them as sent over the wire.
+    """
+
+    def __init__(self, path: str, response_body: bool = False, buffer_size: int = 100, flush_interval: float = 1.0):
+        """
+        :param path: File to append records to.
+        :param response_body: Also record response bodies (decoded JSON or text). Disabled by default as bodies
+        of e.g. `get_users` are large.
+        :param buffer_size: Number of records written at once. Writes run in a background thread.
+        :param flush_interval: Maximum seconds records are kept in memory before they are written.
+        Buffered records are lost if the process crashes, `close` writes them.
+        """
+        self.path = path
+        self.response_body = response_body
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._file: Optional[TextIO] = None
+        self._buffer: List[str] = []
+        self._flushed_at = time.monotonic()
+        # One thread, so that batches are written in order
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @staticmethod
+    def _redact_path(path: str, route: str) -> str:
+        segments = path.split("/")
+        templates = route.split("/")
+        if len(segments) != len(templates) or "{token}" not in templates:
+            return path
+        return "/".join(
+            "token-" + hashlib.sha256(segment.encode()).hexdigest()[:16] if template == "{token}" else segment
+            for segment, template in zip(segments, templates)
+        )
+
+    @classmethod
+    def _redact(cls, data: Any) -> Any:
+        if isinstance(data, list):
+            return [cls._redact(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        redacted = {}
+        for key, value in data.items():
+            if key in SECRET_FIELDS:
+                redacted[key] = REDACTED
+            elif key == "proxies" and isinstance(value, dict):
+                # Proxy settings are credentials (uuids, passwords), only protocols are kept
+                redacted[key] = {protocol: {} for protocol in value}
+            else:
+                redacted[key] = cls._redact(value)
+        return redacted
+
+    def _write_lines(self, lines: str) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(lines)
+        self._file.flush()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._buffer.append(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        if len(self._buffer) >= self.buffer_size or time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Send buffered records to the writer thread.
+        """
+        self._flushed_at = time.monotonic()
+        if not self._buffer:
+            return
+        lines = "".join(self._buffer)
+        self._buffer.clear()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aiomarzban-recording")
+        self._executor.submit(self._write_lines, lines)
+
+    async def __call__(self, request: Request, call_next: CallNext) -> Response:
+        timestamp = time.time()
+        started = time.perf_counter()
+        response = error = None
+        try:
+            response = await call_next(request)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            base = request.url[:len(request.url) - len(request.path)] if request.url.endswith(request.path) else ""
+            record = {
+                "timestamp": timestamp,
+                "method": request.method,
+                "api": "api" if base.endswith("/api") else "sub",
+                "path": self._redact_path(request.path, request.route),
+                "route": request.route,
+                "params": request.params or None,
+                "json": self._redact(request.json),
+                "data": self._redact(request.data),
+                "user_agent": (request.headers or {}).get("user-agent"),
+                "status": response.status if response is not None else None,
+                "error": f"{type(error).__name__}: {error}" if error is not None else None,
+                "duration": round(time.perf_counter() - started, 6),
+                "size": response.size if response is not None else 0,
+            }
+            if self.response_body and response is not None and not response.handled:
+                try:
+                    record["response"] = self._redact(response.json())
+                except ValueError:
+                    record["response"] = response.text()
+            self._write(record)
+
+    def close(self) -> None:
+        """
+        Write buffered records and close the file.
+        """
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_recording(path: str) -> List[Dict[str, Any]]:
+    """
+    Read records of a JSONL recording, sorted by time.
+    """
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record["timestamp"])
+    return records
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def _change(before: float, after: float) -> Optional[float]:
+    return round((after - before) / before, 4) if before else None
+
+
+class ReplayRouteStats(BaseModel):
+    method: str
+    route: str
+    count: int
+    errors: int
+    status_mismatches: int
+    recorded_p50_ms: float
+    recorded_p99_ms: float
+    recorded_mean_ms: float
+    replayed_p50_ms: float
+    replayed_p99_ms: float
+    replayed_mean_ms: float
+    p50_change: Optional[float] = None
+    p99_change: Optional[float] = None
+
+
+class ReplayReport(BaseModel):
+    requests: int
+    duration: float
+    recorded_duration: float
+    speed: Optional[float] = None
+    concurrency: int
+    max_lag: float
+    routes: List[ReplayRouteStats]
+
+    def format(self) -> str:
+        """
+        Return report as a text table: one row per route, latencies in milliseconds.
+        """
+        lines = [
+            f"{self.requests} requests in {self.duration:.2f}s (recorded {self.recorded_duration:.2f}s), "
+            f"max lag {self.max_lag * 1000:.1f}ms",
+            f"{'route':<40}{'count':>8}{'errors':>8}{'status':>8}"
+            f"{'rec p50':>10}{'p50':>10}{'rec p99':>10}{'p99':>10}",
+        ]
+        for item in self.routes:
+            lines.append(
+                f"{item.method + ' ' + item.route:<40}{item.count:>8}{item.errors:>8}{item.status_mismatches:>8}"
+                f"{item.recorded_p50_ms:>10.2f}{item.replayed_p50_ms:>10.2f}"
+                f"{item.recorded_p99_ms:>10.2f}{item.replayed_p99_ms:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+class _Result:
+    __slots__ = ("record", "status", "duration", "error")
+
+    def __init__(self, record: Dict[str, Any], status: Optional[int], duration: float, error: Optional[str]):
+        self.record = record
+        self.status = status
+        self.duration = duration
+        self.error = error
+
+
+async def replay(
+    api: Any,
+    records: Union[str, Iterable[Dict[str, Any]]],
+    speed: Optional[float] = 1.0,
+    concurrency: int = 10,
+) -> ReplayReport:
+    """
+    Reissue recorded requests with the client's session, credentials and middlewares
+    and compare latencies with the recording.
+
+    :param api: `MarzbanAPI` of the target panel.
+    :param records: Path to a JSONL recording or records.
+    :param speed: Replay speed: 1 keeps original timing, 2 is twice as fast, None sends requests as fast as possible.
+    :param concurrency: Maximum number of requests in flight.
+    """
+    if isinstance(records, str):
+        records = load_recording(records)
+    records = [record for record in records if (record["method"], record["route"]) not in NOT_REPLAYED]
+    if not records:
+        raise ValueError("Nothing to replay")
+
+    if api.headers is None:
+        await api.refresh_credentials()
+    own_session = None
+    if api.transport is not None:
+        send = api.transport.send
+    else:
+        session = api._get_session()
+        if session is None:
+            session = own_session = api._new_session()
+        send = partial(aiohttp_send, session)
+    send = build_chain(api.middlewares, send)
+    semaphore = asyncio.Semaphore(concurrency)
+    first = records[0]["timestamp"]
+    started = time.perf_counter()
+    lags: List[float] = []
+
+    async def reissue(record: Dict[str, Any]) -> _Result:
+        if speed:
+            await asyncio.sleep(max(0.0, started + (record["timestamp"] - first) / speed - time.perf_counter()))
+        async with semaphore:
+            if speed:
+                lags.append(max(0.0, time.perf_counter() - started - (record["timestamp"] - first) / speed))
+            base = api.api_url if record["api"] == "api" else api.sub_url
+            request_started = time.perf_counter()
+            try:
+                for _ in range(2):
+                    request = Request(
+                        record["method"],
+                        url=base + record["path"],
+                        path=record["path"],
+                        route=record["route"],
+                        json=record["json"],
+                        data=record["data"],
+                        params=record["params"],
+                        headers=dict(api.headers or {}, **({"user-agent": record["user_agent"]}
+                                                           if record.get("user_agent") is not None else {})),
+                        timeout=api.timeout,
+                    )
+                    response = await send(request)
+                    if response.status != 401 or record["api"] != "api":
+                        break
+                    # Access token expired during the replay
+                    await api.refresh_credentials()
+                    request_started = time.perf_counter()
+            except Exception as e:
+                return _Result(record, None, time.perf_counter() - request_started, f"{type(e).__name__}: {e}")
+            return _Result(record, response.status, time.perf_counter() - request_started, None)
+
+    try:
+        results = await asyncio.gather(*(reissue(record) for record in records))
+    finally:
+        if own_session is not None:
+            await own_session.close()
+    duration = time.perf_counter() - started
+
+    grouped: Dict[tuple, List[_Result]] = {}
+    for result in results:
+        grouped.setdefault((result.record["method"], result.record["route"]), []).append(result)
+    routes = []
+    for (method, route), items in grouped.items():
+        recorded = [item.record["duration"] * 1000 for item in items]
+        replayed = [item.duration * 1000 for item in items]
+        stats = ReplayRouteStats(
+            method=method,
+            route=route,
+            count=len(items),
+            errors=sum(1 for item in items if item.error is not None),
+            status_mismatches=sum(1 for item in items if item.status != item.record["status"]),
+            recorded_p50_ms=_percentile(recorded, 50),
+            recorded_p99_ms=_percentile(recorded, 99),
+            recorded_mean_ms=statistics.fmean(recorded),
+            replayed_p50_ms=_percentile(replayed, 50),
+            replayed_p99_ms=_percentile(replayed, 99),
+            replayed_mean_ms=statistics.fmean(replayed),
+        )
+        stats.p50_change = _change(stats.recorded_p50_ms, stats.replayed_p50_ms)
+        stats.p99_change = _change(stats.recorded_p99_ms, stats.replayed_p99_ms)
+        routes.append(stats)
+    routes.sort(key=lambda item: -item.count)
+
+    return ReplayReport(
+        requests=len(results),
+        duration=duration,
+        recorded_duration=records[-1]["timestamp"] - first,
+        speed=speed,
+        concurrency=concurrency,
+        max_lag=max(lags, default=0.0),
+        routes=routes,
+    )
@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+from bisect import bisect, insort
+from typing import Optional, List, Dict, Any, Iterable, Tuple
+
+from pydantic import BaseModel
+
+from .api import MarzbanAPI
+from .cluster import MarzbanCluster
+from .enums import UserStatus, UserStatusCreate, UserStatusModify
+from .models import UserCreate, UserResponse, UserUsageResponse
+
+
+class HashRing:
+    """
+    Consistent hash ring with virtual nodes.
+    Adding or removing a node only remaps keys which belong (or will belong) to that node.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        self._hashes: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            raise ValueError(f"Node {node} is already in the ring.")
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = self._hash(f"{node}#{i}")
+            if point in self._owners:
+                continue
+            self._owners[point] = node
+            insort(self._hashes, point)
+
+    def remove(self, node: str) -> None:
+        self.nodes.remove(node)
+        self._hashes = [point for point in self._hashes if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def get(self, key: str) -> str:
+        if not self._hashes:
+            raise LookupError("Hash ring is empty.")
+        index = bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[self._hashes[index]]
+
+    def copy(self) -> "HashRing":
+        ring = HashRing(vnodes=self.vnodes)
+        ring.nodes = list(self.nodes)
+        ring._hashes = list(self._hashes)
+        ring._owners = dict(self._owners)
+        return ring
+
+
+class UserMove(BaseModel):
+    username: str
+    source: str
+    target: str
+    error: Optional[str] = None
+
+
+class ShardedMarzbanAPI:
+    """
+    Spreads users over several panels by consistent hashing of the username.
+
+    Per-username methods are sent straight to the owning panel. Calls which are not tied to a username
+    can be fanned out to all panels through `cluster`.
+    """
+
+    def __init__(
+        self,
+        panels: Dict[str, MarzbanAPI],
+        vnodes: int = 160,
+        timeout: Optional[float] = 10,
+        pinned: Optional[Dict[str, str]] = None,
+    ):
+        """
+        :param panels: Mapping of panel name to `MarzbanAPI`. Names are hashed, so keep them stable.
+        :param vnodes: Virtual nodes per panel. More virtual nodes give a more even distribution.
+        :param timeout: Per-panel timeout of fanned out calls.
+        :param pinned: `pinned` saved before a restart.
+        """
+        self.panels: Dict[str, MarzbanAPI] = dict(panels)
+        self.ring = HashRing(self.panels, vnodes=vnodes)
+        self.cluster = MarzbanCluster(self.panels, timeout=timeout)
+        # username -> panel, for users whose move is in progress or failed, or who were created while
+        # the ring changed. They are routed to the panel which actually has them instead of their owner
+        # in the ring. It is kept in memory only: save it when adding or removing panels fails or is
+        # interrupted, and pass it back after a restart, otherwise these users are routed by the ring.
+        self.pinned: Dict[str, str] = dict(pinned or {})
+        # username -> panel of users created while moves are planned
+        self._created: Optional[Dict[str, str]] = None
+
+    def panel_for(self, username: Any) -> str:
+        username = str(username)
+        pinned = self.pinned.get(username)
+        if pinned is not None:
+            return pinned
+        return self.ring.get(username)
+
+    def api_for(self, username: Any) -> MarzbanAPI:
+        return self.panels[self.panel_for(username)]
+
+    # Per-username methods
+
+    def _track_created(self, username: str, panel: str) -> None:
+        if self._created is not None:
+            self._created[username] = panel
+        if self.panel_for(username) != panel:
+            # The ring changed while the user was created
+            self.pinned[username] = panel
+
+    async def add_user(self, username: Any, **kwargs) -> UserResponse:
+        panel = self.panel_for(username)
+        user = await self.panels[panel].add_user(username, **kwargs)
+        self._track_created(str(username), panel)
+        return user
+
+    async def get_user(self, username: Any) -> UserResponse:
+        return await self.api_for(username).get_user(username)
+
+    async def get_or_create_user(self, username: Any, **kwargs) -> UserResponse:
+        panel = self.panel_for(username)
+        user = await self.panels[panel].get_or_create_user(username, **kwargs)
+        self._track_created(str(username), panel)
+        return user
+
+    async def modify_user(self, username: Any, **kwargs) -> UserResponse:
+        return await self.api_for(username).modify_user(username, **kwargs)
+
+    async def remove_user(self, username: Any) -> None:
+        return await self.api_for(username).remove_user(username)
+
+    async def reset_user_usage_data(self, username: Any) -> UserResponse:
+        return await self.api_for(username).reset_user_usage_data(username)
+
+    async def revoke_user_subscription(self, username: Any) -> UserResponse:
+        return await self.api_for(username).revoke_user_subscription(username)
+
+    async def get_user_usage(self, username: Any, start: Optional[str] = "", end: Optional[str] = "") -> UserUsageResponse:
+        return await self.api_for(username).get_user_usage(username, start=start, end=end)
+
+    async def active_next_plan(self, username: Any) -> UserResponse:
+        return await self.api_for(username).active_next_plan(username)
+
+    async def set_owner(self, username: Any, admin_username: Any) -> UserResponse:
+        return await self.api_for(username).set_owner(username, admin_username)
+
+    async def user_add_days(self, username: Any, days: int) -> UserResponse:
+        return await self.api_for(username).user_add_days(username, days)
+
+    # Rebalancing
+
+    async def _usernames(self, api: MarzbanAPI, page_size: int) -> List[str]:
+        usernames = []
+        offset = 0
+        while True:
+            page = await api.get_users(offset=offset, limit=page_size)
+            usernames.extend(user.username for user in page.users)
+            offset += len(page.users)
+            if not page.users or offset >= page.total:
+                return usernames
+
+    async def _plan(self, ring: HashRing, sources: Iterable[str], page_size: int) -> List[Tuple[str, str, str]]:
+        sources = list(sources)
+        self._created = {}
+        try:
+            pages = await asyncio.gather(*(self._usernames(self.panels[name], page_size) for name in sources))
+            moves = []
+            planned = set()
+            for source, usernames in zip(sources, pages):
+                for username in usernames:
+                    target = ring.get(username)
+                    if target != source:
+                        moves.append((username, source, target))
+                        planned.add(username)
+            # Users created through the client while the panels were listed
+            for username, source in self._created.items():
+                if username not in planned and source in sources and ring.get(username) != source:
+                    moves.append((username, source, ring.get(username)))
+            return moves
+        finally:
+            self._created = None
+
+    async def _move_user(self, username: str, source: str, target: str) -> UserMove:
+        move = UserMove(username=username, source=source, target=target)
+        source_api, target_api = self.panels[source], self.panels[target]
+        created = False
+        try:
+            user = await source_api.get_user(username)
+            data = UserCreate(**{
+                **user.model_dump(include=set(UserCreate.model_fields)),
+                "status": UserStatusCreate.on_hold if user.status == UserStatus.on_hold else UserStatusCreate.active,
+            })
+            new_user = await target_api._add_user(data)
+            created = True
+            if user.status in (UserStatus.disabled, UserStatus.limited):
+                # Used traffic can't be transferred, limited users would get a fresh quota
+                await target_api.modify_user(username, status=UserStatusModify.disabled)
+            if user.admin is not None and (new_user.admin is None or new_user.admin.username != user.admin.username):
+                await target_api.set_owner(username, user.admin.username)
+            await source_api.remove_user(username)
+        except Exception as e:
+            move.error = repr(e)
+            if created:
+                try:
+                    await target_api.remove_user(username)
+                except Exception as rollback_error:
+                    move.error += f"; rollback failed: {rollback_error!r}"
+        else:
+            if self.pinned.get(username) == source:
+                del self.pinned[username]
+        return move
+
+    async def _execute(self, moves: List[Tuple[str, str, str]], concurrency: int) -> List[UserMove]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def move_user(username: str, source: str, target: str) -> UserMove:
+            async with semaphore:
+                return await self._move_user(username, source, target)
+
+        return list(await asyncio.gather(*(move_user(*move) for move in moves)))
+
+    async def add_panel(
+        self,
+        name: str,
+        api: MarzbanAPI,
+        migrate: bool = True,
+        dry_run: bool = False,
+        concurrency: int = 10,
+        page_size: int = 500,
+    ) -> List[UserMove]:
+        """
+        Add panel to the ring and move users which now belong to it.
+        Only users that hash to the new panel are moved, all other users stay where they are.
+
+        Users are copied to the new panel and then removed from the old one. Used traffic is not
+        transferred (limited users are disabled on the new panel) and subscription links change,
+        because they are issued by the new panel.
+        Until its move succeeds a user is routed to its old panel (see `pinned`). Users which failed to move
+        stay on the old panel and stay pinned to it. Users created through this client while the moves are
+        planned are moved too. Users created while moves run stay pinned to the panel they were created on.
+
+        :param name: Panel name.
+        :param api: Panel client.
+        :param migrate: Move affected users. If false, only routing is changed.
+        :param dry_run: Only return planned moves, don't change anything.
+        :param concurrency: Maximal number of users moved simultaneously.
+        :param page_size: Page size for fetching usernames.
+        :return: List of `UserMove`, failed moves have `error` set.
+        """
+        ring = self.ring.copy()
+        ring.add(name)
+        if dry_run:
+            if not migrate:
+                return []
+            moves = await self._plan(ring, self.panels, page_size)
+            return [UserMove(username=username, source=source, target=target) for username, source, target in moves]
+
+        moves = await self._plan(ring, self.panels, page_size) if migrate else []
+        self.panels[name] = api
+        self.cluster.add_panel(name, api)
+        self.pinned.update((username, source) for username, source, _ in moves)
+        self.ring = ring
+        return await self._execute(moves, concurrency)
+
+    async def remove_panel(
+        self,
+        name: str,
+        migrate: bool = True,
+        dry_run: bool = False,
+        concurrency: int = 10,
+        page_size: int = 500,
+    ) -> List[UserMove]:
+        """
+        Remove panel from the ring and move its users to their new owners.
+        The panel is kept in `panels` until all moves are finished. If some users failed to move, the panel
+        is kept and these users stay pinned to it.
+        """
+        ring = self.ring.copy()
+        ring.remove(name)
+        moves = await self._plan(ring, [name], page_size) if migrate else []
+        if dry_run:
+            return [UserMove(username=username, source=source, target=target) for username, source, target in moves]
+        if not migrate:
+            self.pinned = {username: panel for username, panel in self.pinned.items() if panel != name}
+
+        self.pinned.update((username, source) for username, source, _ in moves)
+        self.ring = ring
+        result = await self._execute(moves, concurrency)
+        if name not in self.pinned.values():
+            self.cluster.remove_panel(name)
+            del self.panels[name]
+        return result
+
+    async def close(self) -> None:
+        await self.cluster.close()
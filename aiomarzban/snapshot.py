@@ -0,0 +1,476 @@
+"""
+Compact binary snapshots of panel state for analytics: users, nodes, templates, hosts and inbounds.
+
+File layout (little-endian, sections aligned to 8 bytes):
+
+    header      b"AMZSNAP1", u64 directory offset, u64 directory length
+    sections    string table, columns and records of every table
+    directory   JSON with row counts, column types and section offsets
+
+Columns are fixed-width arrays: "int" is int64 (None stored as INT_NONE), "float" is float64 (None is NaN),
+"bool" is int8 (None is -1) and "str" is uint32 id in the string table (None is STR_NONE).
+Strings are deduplicated, so repeated values (statuses, admins, dates) are stored once.
+Fields without a column (links, proxies, ...) are kept per row as a JSON record, parsed only when accessed.
+Column values are not repeated in records, unless a column can't restore them exactly (e.g. an int port
+in a "str" column).
+
+The loader memory-maps the file: `Snapshot.users.column("used_traffic")` is a memoryview of the file
+without copying, and `Snapshot.users[i]` reads fields of one user on demand.
+"""
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from typing import Optional, Dict, List, Any, Iterator, Union
+
+from pydantic import BaseModel
+
+from . import models
+
+MAGIC = b"AMZSNAP1"
+INT_NONE = -(2 ** 63)
+STR_NONE = 2 ** 32 - 1
+
+_HEADER = struct.Struct("<8sQQ")
+_TYPECODES = {"int": "q", "float": "d", "bool": "b", "str": "I"}
+
+# table name -> (model of records, columns). Dotted column names read nested fields.
+TABLES = {
+    "users": ("UserResponse", {
+        "username": "str",
+        "status": "str",
+        "expire": "int",
+        "data_limit": "int",
+        "data_limit_reset_strategy": "str",
+        "used_traffic": "int",
+        "lifetime_used_traffic": "int",
+        "created_at": "str",
+        "online_at": "str",
+        "sub_updated_at": "str",
+        "note": "str",
+        "admin.username": "str",
+    }),
+    "nodes": ("NodeResponse", {
+        "id": "int",
+        "name": "str",
+        "address": "str",
+        "port": "int",
+        "api_port": "int",
+        "usage_coefficient": "float",
+        "status": "str",
+        "xray_version": "str",
+    }),
+    "templates": ("UserTemplateResponse", {
+        "id": "int",
+        "name": "str",
+        "data_limit": "int",
+        "expire_duration": "int",
+        "username_prefix": "str",
+        "username_suffix": "str",
+    }),
+    "hosts": ("ProxyHost", {
+        "inbound_tag": "str",
+        "remark": "str",
+        "address": "str",
+        "port": "int",
+        "sni": "str",
+        "host": "str",
+        "security": "str",
+        "is_disabled": "bool",
+    }),
+    "inbounds": ("ProxyInbound", {
+        "tag": "str",
+        "protocol": "str",
+        "network": "str",
+        "tls": "str",
+        "port": "str",
+    }),
+}
+
+
+def _get(row: Dict[str, Any], name: str) -> Any:
+    for key in name.split("."):
+        if not isinstance(row, dict):
+            return None
+        row = row.get(key)
+    return row
+
+
+def _pop(row: Dict[str, Any], name: str) -> None:
+    # Remove a (dotted) field from the row, copying nested dicts instead of changing them
+    *parents, leaf = name.split(".")
+    for key in parents:
+        child = row.get(key)
+        if not isinstance(child, dict):
+            return
+        row[key] = child = dict(child)
+        row = child
+    row.pop(leaf, None)
+
+
+def _restorable(kind: str, value: Any) -> bool:
+    # The column decodes to exactly the same value
+    if value is None:
+        return True
+    if kind == "float":
+        return type(value) is float and not math.isnan(value)
+    return type(value) is {"int": int, "str": str, "bool": bool}[kind]
+
+
+class _StringTableWriter:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.offsets = array("Q", [0])
+        self.blob = bytearray()
+
+    def add(self, value: str) -> int:
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.ids)
+            self.blob += value.encode()
+            self.offsets.append(len(self.blob))
+        return string_id
+
+
+class _TableWriter:
+    def __init__(self, model: str, columns: Dict[str, str]):
+        self.model = model
+        self.columns = columns
+        self.arrays = {name: array(_TYPECODES[kind]) for name, kind in columns.items()}
+        self.record_offsets = array("Q", [0])
+        # Records are spooled to disk, only columns are kept in memory
+        self.records = tempfile.TemporaryFile()
+
+    def add(self, row: Dict[str, Any], strings: _StringTableWriter) -> None:
+        record = dict(row)
+        for name, kind in self.columns.items():
+            value = _get(row, name)
+            if _restorable(kind, value):
+                _pop(record, name)
+            if kind == "str":
+                value = STR_NONE if value is None else strings.add(str(value))
+            elif kind == "int":
+                value = INT_NONE if value is None else int(value)
+            elif kind == "float":
+                value = math.nan if value is None else float(value)
+            else:
+                value = -1 if value is None else int(bool(value))
+            self.arrays[name].append(value)
+        data = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode()
+        self.records.write(data)
+        self.record_offsets.append(self.record_offsets[-1] + len(data))
+
+    def __len__(self) -> int:
+        return len(self.record_offsets) - 1
+
+
+class SnapshotWriter:
+    """
+    Collects rows of panel state and writes them as a snapshot file. A writer writes one snapshot.
+
+    Example:
+        writer = SnapshotWriter()
+        for user in users:
+            writer.add("users", user)
+        writer.write("panel.snapshot")
+    """
+
+    def __init__(self):
+        self.strings = _StringTableWriter()
+        self.tables = {name: _TableWriter(model, columns) for name, (model, columns) in TABLES.items()}
+
+    def add(self, table: str, row: Union[BaseModel, Dict[str, Any]], **extra: Any) -> None:
+        """
+        Add a row to the table.
+
+        :param table: One of `TABLES`.
+        :param row: Model or dict of the row.
+        :param extra: Additional fields, e.g. `inbound_tag` of hosts.
+        """
+        if isinstance(row, BaseModel):
+            row = row.model_dump(mode="json")
+        if extra:
+            row = {**row, **extra}
+        self.tables[table].add(row, self.strings)
+
+    def write(self, path: str) -> int:
+        """
+        Write the snapshot. The file is replaced atomically, so readers of the previous snapshot are not affected.
+
+        :return: Size of the file in bytes.
+        """
+        directory: Dict[str, Any] = {"created_at": int(time.time()), "tables": {}}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+
+            def section(data: Union[array, bytes, bytearray]) -> int:
+                padding = -f.tell() % 8
+                f.write(b"\0" * padding)
+                offset = f.tell()
+                if isinstance(data, array) and sys.byteorder != "little":
+                    data = array(data.typecode, data)
+                    data.byteswap()
+                f.write(data.tobytes() if isinstance(data, array) else data)
+                return offset
+
+            directory["strings"] = {
+                "count": len(self.strings.ids),
+                "offsets": section(self.strings.offsets),
+                "blob": section(self.strings.blob),
+            }
+            for name, table in self.tables.items():
+                columns = {
+                    column: {"type": kind, "offset": section(table.arrays[column])}
+                    for column, kind in table.columns.items()
+                }
+                padding = -f.tell() % 8
+                f.write(b"\0" * padding)
+                records = f.tell()
+                table.records.seek(0)
+                shutil.copyfileobj(table.records, f)
+                table.records.close()
+                directory["tables"][name] = {
+                    "model": table.model,
+                    "rows": len(table),
+                    "columns": columns,
+                    "record_offsets": section(table.record_offsets),
+                    "records": records,
+                }
+
+            data = json.dumps(directory).encode()
+            offset = section(data)
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, offset, len(data)))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.seek(0, os.SEEK_END)
+        os.replace(tmp_path, path)
+        return size
+
+
+async def take_snapshot(api: Any, path: str, page_size: int = 1000) -> int:
+    """
+    Fetch users, nodes, templates, hosts and inbounds of the panel and write them as a snapshot.
+    Users are fetched page by page, only their columns are kept in memory.
+
+    :param api: `MarzbanAPI` of the panel.
+    :param path: Snapshot file.
+    :param page_size: Users per `get_users` request.
+    :return: Size of the file in bytes.
+    """
+    writer = SnapshotWriter()
+    offset = 0
+    while True:
+        page = await api.get_users(offset=offset, limit=page_size, sort="created_at")
+        for user in page.users:
+            writer.add("users", user)
+        offset += page_size
+        if len(page.users) < page_size or offset >= page.total:
+            break
+    for node in await api.get_nodes():
+        writer.add("nodes", node)
+    for template in await api.get_user_templates():
+        writer.add("templates", template)
+    for tag, hosts in (await api.get_hosts()).items():
+        for host in hosts:
+            writer.add("hosts", host, inbound_tag=tag)
+    for inbounds in (await api.get_inbounds()).values():
+        for inbound in inbounds:
+            writer.add("inbounds", inbound)
+    return writer.write(path)
+
+
+class SnapshotRecord:
+    """
+    Row of a snapshot table. Column fields are read from the columns, other fields parse the record.
+    """
+    __slots__ = ("table", "index", "_model")
+
+    def __init__(self, table: "SnapshotTable", index: int):
+        self.table = table
+        self.index = index
+        self._model: Optional[BaseModel] = None
+
+    def __getattr__(self, name: str) -> Any:
+        if name in self.table.columns:
+            return self.table.value(name, self.index)
+        return getattr(self.model(), name)
+
+    def model(self) -> BaseModel:
+        """
+        Parse the full record into its model, e.g. `UserResponse`.
+        """
+        if self._model is None:
+            self._model = self.table.model(self.index)
+        return self._model
+
+    def __repr__(self) -> str:
+        return f"<SnapshotRecord {self.table.name}[{self.index}]>"
+
+
+class SnapshotTable:
+    def __init__(self, snapshot: "Snapshot", name: str, info: Dict[str, Any]):
+        self.snapshot = snapshot
+        self.name = name
+        self.rows: int = info["rows"]
+        self.columns: Dict[str, str] = {column: spec["type"] for column, spec in info["columns"].items()}
+        self._info = info
+        self._model = getattr(models, info["model"])
+        self._record_offsets = snapshot._view(info["record_offsets"], self.rows + 1, "Q")
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> memoryview:
+        """
+        Raw column without copying: int64, float64, int8 or uint32 string ids (see the module docstring).
+        """
+        spec = self._info["columns"][name]
+        return self.snapshot._view(spec["offset"], self.rows, _TYPECODES[spec["type"]])
+
+    def value(self, name: str, index: int) -> Any:
+        return self._decode(self.columns[name], self.column(name)[index])
+
+    def values(self, name: str) -> List[Any]:
+        """
+        Decoded column: strings instead of ids and None instead of missing values.
+        """
+        kind = self.columns[name]
+        return [self._decode(kind, value) for value in self.column(name)]
+
+    def _decode(self, kind: str, value: Any) -> Any:
+        if kind == "str":
+            return None if value == STR_NONE else self.snapshot.string(value)
+        if kind == "int":
+            return None if value == INT_NONE else value
+        if kind == "float":
+            return None if math.isnan(value) else value
+        return None if value < 0 else bool(value)
+
+    def record(self, index: int) -> Dict[str, Any]:
+        """
+        Full JSON record of the row: the stored record with column values filled in.
+        """
+        start = self._info["records"] + self._record_offsets[index]
+        end = self._info["records"] + self._record_offsets[index + 1]
+        record = json.loads(self.snapshot._buffer[start:end].tobytes())
+        for name in self.columns:
+            *parents, leaf = name.split(".")
+            target = record
+            for key in parents:
+                target = target.get(key) if isinstance(target, dict) else None
+            if isinstance(target, dict) and leaf not in target:
+                target[leaf] = self.value(name, index)
+        return record
+
+    def model(self, index: int) -> BaseModel:
+        return self._model.model_validate(self.record(index))
+
+    def __getitem__(self, index: int) -> SnapshotRecord:
+        if index < 0:
+            index += self.rows
+        if not 0 <= index < self.rows:
+            raise IndexError(f"{self.name} index out of range")
+        return SnapshotRecord(self, index)
+
+    def __iter__(self) -> Iterator[SnapshotRecord]:
+        return (SnapshotRecord(self, index) for index in range(self.rows))
+
+
+class Snapshot:
+    """
+    Memory-mapped snapshot written by `take_snapshot` or `SnapshotWriter`.
+
+    Example:
+        with Snapshot("panel.snapshot") as snapshot:
+            total = sum(snapshot.users.column("used_traffic"))
+            user = snapshot.users[0]
+            print(user.username, user.status, user.links)
+
+    Column views keep the file mapped: release them (or drop references) before `close`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is not a snapshot")
+        self._buffer = memoryview(self._mmap)
+        self._string_offsets = None
+        self.tables: Dict[str, SnapshotTable] = {}
+        if len(self._mmap) < _HEADER.size or self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot")
+        _, offset, length = _HEADER.unpack_from(self._mmap, 0)
+        self.directory: Dict[str, Any] = json.loads(self._buffer[offset:offset + length].tobytes())
+        self.created_at: int = self.directory["created_at"]
+        strings = self.directory["strings"]
+        self._string_offsets = self._view(strings["offsets"], strings["count"] + 1, "Q")
+        self._string_blob = strings["blob"]
+        self._strings: Dict[int, str] = {}
+        self.tables = {name: SnapshotTable(self, name, info) for name, info in self.directory["tables"].items()}
+
+    def _view(self, offset: int, count: int, typecode: str) -> Any:
+        size = array(typecode).itemsize * count
+        view = self._buffer[offset:offset + size]
+        if sys.byteorder == "little":
+            return view.cast(typecode)
+        values = array(typecode, view.tobytes())
+        values.byteswap()
+        return values
+
+    def string(self, string_id: int) -> str:
+        value = self._strings.get(string_id)
+        if value is None:
+            start = self._string_blob + self._string_offsets[string_id]
+            end = self._string_blob + self._string_offsets[string_id + 1]
+            value = self._strings[string_id] = self._buffer[start:end].tobytes().decode()
+        return value
+
+    @property
+    def users(self) -> SnapshotTable:
+        return self.tables["users"]
+
+    @property
+    def nodes(self) -> SnapshotTable:
+        return self.tables["nodes"]
+
+    @property
+    def templates(self) -> SnapshotTable:
+        return self.tables["templates"]
+
+    @property
+    def hosts(self) -> SnapshotTable:
+        return self.tables["hosts"]
+
+    @property
+    def inbounds(self) -> SnapshotTable:
+        return self.tables["inbounds"]
+
+    def close(self) -> None:
+        for view in [table._record_offsets for table in self.tables.values()] + [self._string_offsets]:
+            if isinstance(view, memoryview):
+                view.release()
+        self.tables = {}
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+        if not self._mmap.closed:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
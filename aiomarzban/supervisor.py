@@ -0,0 +1,292 @@
+import asyncio
+import inspect
+import math
+import random
+import time
+from collections import deque
+from typing import Optional, List, Dict, Callable, Any, Iterable, Deque
+
+from pydantic import BaseModel
+
+from .enums import NodeStatus
+from .models import NodeResponse
+
+
+class NodeStateEvent(BaseModel):
+    node_id: int
+    node_name: str
+    old_status: Optional[NodeStatus] = None
+    new_status: Optional[NodeStatus] = None
+    message: Optional[str] = None
+    timestamp: float
+    recovery_time: Optional[float] = None
+
+
+class NodeRecoveryStats(BaseModel):
+    failures: int = 0
+    recoveries: int = 0
+    reconnect_attempts: int = 0
+    suppressed: bool = False
+    penalty: float = 0
+    last_recovery_time: Optional[float] = None
+    mean_recovery_time: Optional[float] = None
+    max_recovery_time: Optional[float] = None
+
+
+class _NodeState:
+    def __init__(self, node: NodeResponse):
+        self.node_id = node.id
+        self.status = node.status
+        self.failures = 0
+        self.unhealthy_since: Optional[float] = None
+        self.next_attempt = 0.0
+        self.reconnect_attempts = 0
+        self.in_progress = False
+
+        # Flap damping
+        self.penalty = 0.0
+        self.penalty_updated = 0.0
+        self.suppressed = False
+
+        # Recovery metrics
+        self.recoveries = 0
+        self.recovery_times: Deque[float] = deque(maxlen=100)
+
+    def decay_penalty(self, now: float, half_life: float) -> float:
+        if self.penalty:
+            self.penalty *= math.pow(0.5, (now - self.penalty_updated) / half_life)
+        self.penalty_updated = now
+        return self.penalty
+
+
+class NodeSupervisor:
+    """
+    Watches node statuses and reconnects unhealthy nodes.
+
+    Nodes are polled with a single `get_nodes` call per tick. Reconnects of different nodes run concurrently,
+    every node has its own exponential backoff. Nodes which flap (fail again and again shortly after recovery)
+    accumulate penalty and are not reconnected until the penalty decays, like route flap damping.
+    """
+
+    def __init__(
+        self,
+        api: Any,
+        interval: float = 5,
+        unhealthy_statuses: Iterable[NodeStatus] = (NodeStatus.error,),
+        base_backoff: float = 2,
+        max_backoff: float = 300,
+        jitter: float = 0.1,
+        max_concurrency: int = 10,
+        flap_penalty: float = 1000,
+        suppress_limit: float = 3000,
+        reuse_limit: float = 750,
+        penalty_half_life: float = 900,
+        on_event: Optional[Callable[[NodeStateEvent], Any]] = None,
+        on_error: Optional[Callable[[BaseException], Any]] = None,
+    ):
+        """
+        :param api: `MarzbanAPI` instance.
+        :param interval: Seconds between status polls.
+        :param unhealthy_statuses: Node statuses which trigger reconnect.
+        :param base_backoff: Delay before the second reconnect attempt in seconds, doubled on every failure.
+        :param max_backoff: Maximal delay between reconnect attempts in seconds.
+        :param jitter: Random part of backoff delay (0.1 = up to 10%).
+        :param max_concurrency: Maximal number of simultaneous reconnect requests.
+        :param flap_penalty: Penalty added every time a connected node becomes unhealthy.
+        :param suppress_limit: Reconnects are suppressed when penalty exceeds this value.
+        :param reuse_limit: Suppressed node is reconnected again when penalty decays below this value.
+        :param penalty_half_life: Seconds for penalty to decay by half.
+        :param on_event: Sync or async callback for state-change events.
+        :param on_error: Called with exception when poll or reconnect fails.
+        """
+        self.api = api
+        self.interval = interval
+        self.unhealthy_statuses = frozenset(unhealthy_statuses)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.flap_penalty = flap_penalty
+        self.suppress_limit = suppress_limit
+        self.reuse_limit = reuse_limit
+        self.penalty_half_life = penalty_half_life
+        self.on_event = on_event
+        self.on_error = on_error
+
+        self.nodes: Dict[int, NodeResponse] = {}
+        self._states: Dict[int, _NodeState] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._reconnects: Dict[int, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _is_unhealthy(self, status: Optional[NodeStatus]) -> bool:
+        return status in self.unhealthy_statuses
+
+    def _backoff(self, failures: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * 2 ** max(failures - 1, 0))
+        return delay * (1 + random.uniform(0, self.jitter))
+
+    async def _emit(self, event: NodeStateEvent) -> None:
+        if self.on_event is None:
+            return
+        result = self.on_event(event)
+        if inspect.isawaitable(result):
+            await result
+
+    def _handle_error(self, error: BaseException) -> None:
+        if self.on_error is not None:
+            self.on_error(error)
+
+    async def _reconnect(self, state: _NodeState) -> None:
+        try:
+            async with self._semaphore:
+                state.reconnect_attempts += 1
+                await self.api.reconnect_node(state.node_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._handle_error(e)
+        finally:
+            state.in_progress = False
+
+    async def tick(self, now: Optional[float] = None) -> List[NodeStateEvent]:
+        """
+        Poll nodes once, emit state changes and schedule reconnects.
+
+        :return: State-change events of this tick.
+        """
+        nodes = await self.api.get_nodes()
+        now = time.monotonic() if now is None else now
+        events = []
+
+        seen = set()
+        for node in nodes:
+            seen.add(node.id)
+            self.nodes[node.id] = node
+            state = self._states.get(node.id)
+            if state is None:
+                state = self._states[node.id] = _NodeState(node)
+                state.penalty_updated = now
+                if self._is_unhealthy(node.status):
+                    state.unhealthy_since = now
+            elif state.status != node.status:
+                event = self._transition(state, node, now)
+                events.append(event)
+
+            if self._is_unhealthy(node.status):
+                self._schedule_reconnect(state, now)
+
+        for node_id in list(self._states):
+            if node_id not in seen:
+                del self._states[node_id]
+                self.nodes.pop(node_id, None)
+
+        for event in events:
+            await self._emit(event)
+        return events
+
+    def _transition(self, state: _NodeState, node: NodeResponse, now: float) -> NodeStateEvent:
+        was_unhealthy = self._is_unhealthy(state.status)
+        is_unhealthy = self._is_unhealthy(node.status)
+        event = NodeStateEvent(
+            node_id=node.id,
+            node_name=node.name,
+            old_status=state.status,
+            new_status=node.status,
+            message=node.message,
+            timestamp=time.time(),
+        )
+
+        if is_unhealthy and not was_unhealthy:
+            if state.unhealthy_since is None:
+                state.unhealthy_since = now
+                state.failures = 0
+                state.next_attempt = now
+            # else: a failed reconnect (error -> connecting -> error) continues the outage and its backoff
+            if state.status == NodeStatus.connected:
+                state.decay_penalty(now, self.penalty_half_life)
+                state.penalty += self.flap_penalty
+        elif node.status == NodeStatus.connected and state.unhealthy_since is not None:
+            recovery_time = now - state.unhealthy_since
+            state.recovery_times.append(recovery_time)
+            state.recoveries += 1
+            state.unhealthy_since = None
+            state.failures = 0
+            event.recovery_time = recovery_time
+
+        state.status = node.status
+        return event
+
+    def _schedule_reconnect(self, state: _NodeState, now: float) -> None:
+        if state.in_progress or now < state.next_attempt:
+            return
+
+        penalty = state.decay_penalty(now, self.penalty_half_life)
+        if state.suppressed and penalty < self.reuse_limit:
+            state.suppressed = False
+        elif not state.suppressed and penalty > self.suppress_limit:
+            state.suppressed = True
+        if state.suppressed:
+            return
+
+        state.failures += 1
+        state.next_attempt = now + self._backoff(state.failures)
+        state.in_progress = True
+        self._reconnects[state.node_id] = asyncio.create_task(self._reconnect(state))
+
+    async def wait_reconnects(self) -> None:
+        """
+        Wait until all scheduled reconnect requests are finished.
+        """
+        tasks = list(self._reconnects.values())
+        self._reconnects.clear()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._handle_error(e)
+            self._reconnects = {node_id: task for node_id, task in self._reconnects.items() if not task.done()}
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in self._reconnects.values():
+            task.cancel()
+        await self.wait_reconnects()
+
+    def stats(self, node_id: int) -> NodeRecoveryStats:
+        """
+        Return recovery metrics of the node.
+        """
+        state = self._states.get(node_id)
+        if state is None:
+            return NodeRecoveryStats()
+        times = state.recovery_times
+        return NodeRecoveryStats(
+            failures=state.failures,
+            recoveries=state.recoveries,
+            reconnect_attempts=state.reconnect_attempts,
+            suppressed=state.suppressed,
+            penalty=state.penalty,
+            last_recovery_time=times[-1] if times else None,
+            mean_recovery_time=sum(times) / len(times) if times else None,
+            max_recovery_time=max(times) if times else None,
+        )
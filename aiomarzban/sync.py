@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import inspect
+import threading
+from typing import Any, Coroutine
+
+from .api import MarzbanAPI
+
+
+class SyncMarzbanAPI:
+    """
+    Synchronous facade of `MarzbanAPI` for sync code (Django views, cron scripts, etc.).
+
+    Every `MarzbanAPI` method is available with the same arguments and blocks until the result is ready.
+    Calls run on a single long-lived event loop in a daemon thread, so the session (connection pool)
+    and the access token are reused between calls. It is safe to call methods from many threads at once.
+    Don't forget to .close() it (or use it as a context manager).
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Accepts the arguments of `MarzbanAPI`. `use_single_session` is enabled by default.
+        An external `session` or `transport` must be created on the loop of this client (see `run`).
+        """
+        kwargs.setdefault("use_single_session", True)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="aiomarzban-sync", daemon=True)
+        self._thread.start()
+        self.api = MarzbanAPI(*args, **kwargs)
+
+    def run(self, coro: Coroutine) -> Any:
+        """
+        Run coroutine on the client loop and return its result.
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("SyncMarzbanAPI can't be called from its own event loop, use .api instead")
+        with self._lock:
+            if self._closed:
+                coro.close()
+                raise RuntimeError("Client is closed")
+            future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result()
+
+    def add_middleware(self, middleware) -> None:
+        self.api.add_middleware(middleware)
+
+    async def _shutdown(self) -> None:
+        # Calls which are still running get CancelledError instead of waiting for a stopped loop forever
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.api.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        try:
+            future.result()
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+    def __enter__(self) -> "SyncMarzbanAPI":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def _sync_method(name: str):
+    @functools.wraps(getattr(MarzbanAPI, name))
+    def method(self: SyncMarzbanAPI, *args, **kwargs):
+        return self.run(getattr(self.api, name)(*args, **kwargs))
+
+    return method
+
+
+for _name, _ in inspect.getmembers(MarzbanAPI, inspect.iscoroutinefunction):
+    if not _name.startswith("_") and _name != "close":
+        setattr(SyncMarzbanAPI, _name, _sync_method(_name))
@@ -0,0 +1,1031 @@
+"""
+In-memory fake Marzban 0.8.4 panel for benchmarks and offline tests.
+
+Covers admins, users, user templates, nodes, core config, hosts, inbounds, system stats and subscriptions,
+with token auth and the panel's error bodies ("Could not validate credentials", "User not found", ...).
+Responses have the shapes the client models expect and realistic sizes: share links are rendered from the
+core config and hosts with `LinkGenerator`, like the panel does.
+
+Usage in async code:
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, panel.admin_username, panel.admin_password)
+
+Usage from sync code or across event loops (e.g. pytest fixtures):
+    panel = FakeMarzban()
+    address = panel.start_in_thread()
+    ...
+    panel.stop_thread()
+"""
+import asyncio
+import base64
+import copy
+import json
+import re
+import secrets
+import threading
+import time
+import uuid
+from typing import Optional, List, Dict, Any
+
+from aiohttp import web
+
+from .cache import user_agent_class
+from .links import LinkGenerator
+from .models import UserResponse
+
+USERNAME_PATTERN = re.compile(r"^[a-zA-Z0-9_@.\-]{3,32}$")
+
+REALITY_PRIVATE_KEY = "sIirz1JIZzhBUO_7SA1LuE3gNWv030yH0MbkJCLzi2k"
+
+NODE_CERTIFICATE = "-----BEGIN CERTIFICATE-----\nMIIEnDCCAoQCAQAwDQYJKoZIhvcNAQENBQAwEzERMA8GA1UEAwwIR296YXJnYWgw\n-----END CERTIFICATE-----\n"
+
+DEFAULT_HOST_REMARK = "🚀 Marz ({USERNAME}) [{PROTOCOL} - {TRANSPORT}]"
+
+
+def default_core_config() -> dict:
+    return {
+        "log": {"loglevel": "warning"},
+        "routing": {"rules": [{"ip": ["geoip:private"], "outboundTag": "BLOCK", "type": "field"}]},
+        "inbounds": [
+            {
+                "tag": "VLESS TCP REALITY",
+                "listen": "0.0.0.0",
+                "port": 8443,
+                "protocol": "vless",
+                "settings": {"clients": [], "decryption": "none"},
+                "streamSettings": {
+                    "network": "tcp",
+                    "tcpSettings": {},
+                    "security": "reality",
+                    "realitySettings": {
+                        "show": False,
+                        "dest": "www.google.com:443",
+                        "xver": 0,
+                        "serverNames": ["www.google.com"],
+                        "privateKey": REALITY_PRIVATE_KEY,
+                        "shortIds": [""],
+                    },
+                },
+                "sniffing": {"enabled": True, "destOverride": ["http", "tls", "quic"]},
+            },
+        ],
+        "outbounds": [{"protocol": "freedom", "tag": "DIRECT"}, {"protocol": "blackhole", "tag": "BLOCK"}],
+    }
+
+
+def _host(remark: str, address: str, **kwargs) -> dict:
+    host = {
+        "remark": remark,
+        "address": address,
+        "port": None,
+        "sni": None,
+        "host": None,
+        "path": None,
+        "security": "inbound_default",
+        "alpn": "",
+        "fingerprint": "",
+        "allowinsecure": None,
+        "is_disabled": False,
+        "mux_enable": False,
+        "fragment_setting": None,
+        "noise_setting": None,
+        "random_user_agent": False,
+        "use_sni_as_host": False,
+    }
+    host.update(kwargs)
+    return host
+
+
+def _inbound_settings(inbound: dict) -> dict:
+    stream = inbound.get("streamSettings") or {}
+    return {
+        "tag": inbound["tag"],
+        "protocol": inbound["protocol"],
+        "network": stream.get("network", "tcp"),
+        "tls": stream.get("security") or "none",
+        "port": inbound.get("port"),
+    }
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def _iso(timestamp: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp))
+
+
+class FakeMarzban:
+    """
+    Stateful in-memory fake of the Marzban API served by aiohttp.
+    State is public (`users`, `admins`, `nodes`, `templates`, `hosts`, `core_config`) and can be inspected
+    or prepared directly in tests.
+    """
+
+    def __init__(
+        self,
+        admin_username: str = "admin",
+        admin_password: str = "admin",
+        latency: float = 0,
+        links_per_user: int = 3,
+        sub_path: str = "sub",
+        core_config: Optional[dict] = None,
+    ):
+        """
+        :param admin_username: Username of the sudo admin.
+        :param admin_password: Password of the sudo admin.
+        :param latency: Artificial delay of every response in seconds.
+        :param links_per_user: Number of hosts (and therefore share links per user) of every inbound
+        of the default config.
+        :param sub_path: Subscription path.
+        :param core_config: Xray config. Default: one VLESS TCP REALITY inbound.
+        """
+        self.admin_username = admin_username
+        self.admin_password = admin_password
+        self.latency = latency
+        self.sub_path = sub_path
+        self.address = "http://127.0.0.1/"
+
+        self.admins: Dict[str, dict] = {}
+        self.passwords: Dict[str, str] = {}
+        self.users: Dict[str, dict] = {}
+        self.templates: Dict[int, dict] = {}
+        self.nodes: Dict[int, dict] = {}
+        self.hosts: Dict[str, List[dict]] = {}
+        self.core_config: dict = {}
+        self.tokens: Dict[str, str] = {}
+        self.sub_tokens: Dict[str, str] = {}
+        self.master_usage = {"uplink": 0, "downlink": 0}
+        self.requests = 0
+
+        self._ids = {"node": 0, "template": 0}
+        self._generator: Optional[LinkGenerator] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self.add_admin(admin_username, admin_password, is_sudo=True)
+        self.set_core_config(core_config or default_core_config())
+        if core_config is None:
+            tag = self.core_config["inbounds"][0]["tag"]
+            self.hosts[tag] = [
+                _host(f"{DEFAULT_HOST_REMARK} #{i}", f"node{i}.example.com", sni="www.google.com")
+                for i in range(links_per_user)
+            ]
+
+    # State
+
+    def add_admin(
+        self,
+        username: str,
+        password: str,
+        is_sudo: bool = False,
+        telegram_id: Optional[int] = None,
+        discord_webhook: Optional[str] = None,
+    ) -> dict:
+        admin = {
+            "username": username,
+            "is_sudo": is_sudo,
+            "telegram_id": telegram_id,
+            "discord_webhook": discord_webhook,
+            "users_usage": 0,
+        }
+        self.admins[username] = admin
+        self.passwords[username] = password
+        return admin
+
+    @property
+    def inbounds_by_tag(self) -> Dict[str, dict]:
+        return {
+            inbound["tag"]: inbound
+            for inbound in self.core_config.get("inbounds", [])
+            if inbound.get("protocol") in ("vmess", "vless", "trojan", "shadowsocks")
+        }
+
+    def set_core_config(self, config: dict) -> None:
+        """
+        Apply core config. Like the panel, every new inbound gets a default host.
+        """
+        self.core_config = copy.deepcopy(config)
+        for tag in self.inbounds_by_tag:
+            self.hosts.setdefault(tag, [_host(DEFAULT_HOST_REMARK, "127.0.0.1")])
+        self._generator = None
+
+    def _inbounds_for(self, protocols) -> Dict[str, List[str]]:
+        inbounds = {}
+        for tag, inbound in self.inbounds_by_tag.items():
+            if inbound["protocol"] in protocols:
+                inbounds.setdefault(inbound["protocol"], []).append(tag)
+        return inbounds
+
+    @staticmethod
+    def _proxy_settings(protocol: str, settings: Optional[dict]) -> dict:
+        settings = dict(settings or {})
+        if protocol in ("vless", "vmess"):
+            settings["id"] = settings.get("id") or str(uuid.uuid4())
+        else:
+            settings["password"] = settings.get("password") or secrets.token_urlsafe(16)
+        if protocol == "vless":
+            settings.setdefault("flow", "")
+        if protocol == "shadowsocks":
+            settings.setdefault("method", "chacha20-ietf-poly1305")
+        return settings
+
+    def _issue_sub_token(self, user: dict) -> None:
+        old = user.get("subscription_url", "").rsplit("/", 1)[-1]
+        self.sub_tokens.pop(old, None)
+        payload = base64.urlsafe_b64encode(f"{user['username']},{_now()}".encode()).decode().rstrip("=")
+        token = payload + secrets.token_hex(5)
+        self.sub_tokens[token] = user["username"]
+        user["subscription_url"] = f"/{self.sub_path}/{token}"
+
+    def _review(self, user: dict) -> dict:
+        """
+        Update status of an active/limited/expired user, like the panel's periodic review job.
+        """
+        if user["status"] in ("active", "limited", "expired"):
+            if user["data_limit"] and user["used_traffic"] >= user["data_limit"]:
+                user["status"] = "limited"
+            elif user["expire"] and user["expire"] <= _now():
+                user["status"] = "expired"
+            else:
+                user["status"] = "active"
+        return user
+
+    def _render_links(self, user: dict) -> None:
+        if self._generator is None:
+            self._generator = LinkGenerator(self.core_config, self.hosts)
+        user["links"] = self._generator.links(UserResponse(**user))
+
+    def create_user(self, data: Dict[str, Any], admin: Optional[str] = None) -> dict:
+        username = data["username"]
+        proxies = {
+            protocol: self._proxy_settings(protocol, settings)
+            for protocol, settings in (data.get("proxies") or {"vless": {}}).items()
+        }
+        inbounds = self._inbounds_for(proxies)
+        inbounds.update({protocol: tags for protocol, tags in (data.get("inbounds") or {}).items() if tags})
+        status = data.get("status") or "active"
+        owner = self.admins.get(admin or self.admin_username)
+        user = {
+            "proxies": proxies,
+            "expire": None if status == "on_hold" else data.get("expire"),
+            "data_limit": data.get("data_limit"),
+            "data_limit_reset_strategy": data.get("data_limit_reset_strategy") or "no_reset",
+            "inbounds": inbounds,
+            "note": data.get("note"),
+            "sub_updated_at": None,
+            "sub_last_user_agent": None,
+            "online_at": None,
+            "on_hold_expire_duration": data.get("on_hold_expire_duration"),
+            "on_hold_timeout": data.get("on_hold_timeout"),
+            "auto_delete_in_days": data.get("auto_delete_in_days"),
+            "next_plan": data.get("next_plan"),
+            "username": username,
+            "status": status,
+            "used_traffic": 0,
+            "lifetime_used_traffic": 0,
+            "created_at": _iso(),
+            "links": [],
+            "subscription_url": "",
+            "excluded_inbounds": self._excluded(inbounds),
+            "admin": copy.copy(owner) if owner else None,
+        }
+        self._issue_sub_token(user)
+        self._render_links(user)
+        self.users[username] = user
+        return user
+
+    def _excluded(self, inbounds: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        all_inbounds = self._inbounds_for(inbounds)
+        return {
+            protocol: [tag for tag in tags if tag not in inbounds.get(protocol, [])]
+            for protocol, tags in all_inbounds.items()
+        }
+
+    def seed_users(self, count: int, prefix: str = "user", used_traffic: int = 1024 ** 3) -> List[str]:
+        """
+        Create `count` users named f"{prefix}{i}".
+        """
+        usernames = []
+        for i in range(count):
+            username = f"{prefix}{i}"
+            user = self.create_user({"username": username, "data_limit": 10 * 1024 ** 3, "note": f"Seeded user {i}"})
+            user["used_traffic"] = user["lifetime_used_traffic"] = used_traffic
+            usernames.append(username)
+        return usernames
+
+    def add_traffic(self, username: str, uplink: int, downlink: int, node_id: Optional[int] = None) -> None:
+        """
+        Account traffic of a user, as if it was reported by a node (None for the master core).
+        """
+        user = self.users[username]
+        total = uplink + downlink
+        user["used_traffic"] += total
+        user["lifetime_used_traffic"] += total
+        if user["admin"] is not None and user["admin"]["username"] in self.admins:
+            self.admins[user["admin"]["username"]]["users_usage"] += total
+        usage = self.master_usage if node_id is None else self.nodes[node_id]["usage"]
+        usage["uplink"] += uplink
+        usage["downlink"] += downlink
+        self._review(user)
+
+    def set_node_status(self, node_id: int, status: str, message: Optional[str] = None) -> None:
+        self.nodes[node_id]["status"] = status
+        self.nodes[node_id]["message"] = message
+
+    def expire_tokens(self) -> None:
+        """
+        Invalidate issued access tokens, as if they expired.
+        """
+        self.tokens.clear()
+
+    # Helpers
+
+    @staticmethod
+    def _error(status: int, detail: Any) -> web.Response:
+        return web.json_response({"detail": detail}, status=status)
+
+    @staticmethod
+    def _validation_error(location: List[str], message: str) -> web.Response:
+        return web.json_response(
+            {"detail": [{"loc": location, "msg": message, "type": "value_error"}]}, status=422,
+        )
+
+    def _status_error(self, data: Dict[str, Any]) -> Optional[web.Response]:
+        # Same checks as the status validator of UserCreate and UserModify of the panel
+        if data.get("status") != "on_hold":
+            return None
+        if not data.get("on_hold_expire_duration"):
+            return self._validation_error(
+                ["body", "status"], "User cannot be on hold without a valid on_hold_expire_duration.",
+            )
+        if data.get("expire"):
+            return self._validation_error(["body", "status"], "User cannot be on hold with specified expire.")
+        return None
+
+    @staticmethod
+    def _not_found(detail: str) -> web.HTTPNotFound:
+        return web.HTTPNotFound(text=json.dumps({"detail": detail}), content_type="application/json")
+
+    @staticmethod
+    def _forbidden() -> web.HTTPForbidden:
+        return web.HTTPForbidden(text=json.dumps({"detail": "You're not allowed"}), content_type="application/json")
+
+    def _current_admin(self, request: web.Request) -> dict:
+        token = request.headers["Authorization"][len("Bearer "):]
+        return self.admins[self.tokens[token]]
+
+    def _require_sudo(self, request: web.Request) -> dict:
+        admin = self._current_admin(request)
+        if not admin["is_sudo"]:
+            raise self._forbidden()
+        return admin
+
+    def _user(self, request: web.Request) -> dict:
+        user = self.users.get(request.match_info["username"])
+        admin = self._current_admin(request)
+        if user is None or not (admin["is_sudo"] or (user["admin"] or {}).get("username") == admin["username"]):
+            raise self._not_found("User not found")
+        return self._review(user)
+
+    def _admin(self, username: str) -> dict:
+        admin = self.admins.get(username)
+        if admin is None:
+            raise self._not_found("Admin not found")
+        return admin
+
+    def _node(self, request: web.Request) -> dict:
+        node = self.nodes.get(int(request.match_info["node_id"]))
+        if node is None:
+            raise self._not_found("Node not found")
+        return node
+
+    def _template(self, request: web.Request) -> dict:
+        template = self.templates.get(int(request.match_info["template_id"]))
+        if template is None:
+            raise self._not_found("User Template not found")
+        return template
+
+    @staticmethod
+    def _node_response(node: dict) -> dict:
+        return {key: value for key, value in node.items() if key != "usage"}
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.path.startswith("/api/") and request.path != "/api/admin/token":
+            authorization = request.headers.get("Authorization", "")
+            if not authorization.startswith("Bearer "):
+                return self._error(401, "Not authenticated")
+            username = self.tokens.get(authorization[len("Bearer "):])
+            if username is None or username not in self.admins:
+                return self._error(401, "Could not validate credentials")
+        return await handler(request)
+
+    # Admin
+
+    async def _token(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        username = form.get("username")
+        if username not in self.passwords or self.passwords[username] != form.get("password"):
+            return self._error(401, "Incorrect username or password")
+        token = secrets.token_hex(32)
+        self.tokens[token] = username
+        return web.json_response({"access_token": token, "token_type": "bearer"})
+
+    async def _get_current_admin(self, request: web.Request) -> web.Response:
+        return web.json_response(self._current_admin(request))
+
+    async def _create_admin(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        data = await request.json()
+        if data["username"] in self.admins:
+            return self._error(409, "Admin already exists")
+        admin = self.add_admin(
+            data["username"], data["password"], bool(data.get("is_sudo")),
+            telegram_id=data.get("telegram_id"), discord_webhook=data.get("discord_webhook"),
+        )
+        return web.json_response(admin)
+
+    async def _modify_admin(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        admin = self._admin(request.match_info["username"])
+        data = await request.json()
+        if data.get("password"):
+            self.passwords[admin["username"]] = data["password"]
+        admin["is_sudo"] = bool(data.get("is_sudo"))
+        for field in ("telegram_id", "discord_webhook"):
+            if data.get(field) is not None:
+                admin[field] = data[field]
+        return web.json_response(admin)
+
+    async def _remove_admin(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        admin = self._admin(request.match_info["username"])
+        del self.admins[admin["username"]]
+        del self.passwords[admin["username"]]
+        for user in self.users.values():
+            if (user["admin"] or {}).get("username") == admin["username"]:
+                user["admin"] = None
+        return web.json_response({})
+
+    async def _get_admins(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        admins = list(self.admins.values())
+        username = request.query.get("username")
+        if username:
+            admins = [admin for admin in admins if username in admin["username"]]
+        offset = int(request.query.get("offset", 0))
+        limit = request.query.get("limit")
+        admins = admins[offset:offset + int(limit)] if limit is not None else admins[offset:]
+        return web.json_response(admins)
+
+    def _set_admin_users_status(self, request: web.Request, old: str, new: str) -> web.Response:
+        self._require_sudo(request)
+        admin = self._admin(request.match_info["username"])
+        for user in self.users.values():
+            if (user["admin"] or {}).get("username") == admin["username"] and self._review(user)["status"] == old:
+                user["status"] = new
+        return web.json_response({"detail": f"Users successfully {'disabled' if new == 'disabled' else 'activated'}."})
+
+    async def _disable_admin_users(self, request: web.Request) -> web.Response:
+        return self._set_admin_users_status(request, "active", "disabled")
+
+    async def _activate_admin_users(self, request: web.Request) -> web.Response:
+        response = self._set_admin_users_status(request, "disabled", "active")
+        for user in self.users.values():
+            self._review(user)
+        return response
+
+    async def _reset_admin_usage(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        admin = self._admin(request.match_info["username"])
+        admin["users_usage"] = 0
+        return web.json_response(admin)
+
+    async def _get_admin_usage(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        return web.json_response(self._admin(request.match_info["username"])["users_usage"])
+
+    # Core
+
+    async def _get_core_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"version": "1.8.24", "started": True, "logs_websocket": "/api/core/logs"})
+
+    async def _restart_core(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        return web.json_response({})
+
+    async def _get_core_config(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        return web.json_response(self.core_config)
+
+    async def _modify_core_config(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        config = await request.json()
+        if not isinstance(config, dict) or not isinstance(config.get("inbounds"), list):
+            return self._error(400, "Invalid config: inbounds are required")
+        self.set_core_config(config)
+        return web.json_response(self.core_config)
+
+    # Node
+
+    async def _get_node_settings(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        return web.json_response({"min_node_version": "v0.2.0", "certificate": NODE_CERTIFICATE})
+
+    async def _add_node(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        data = await request.json()
+        if any(node["name"] == data["name"] for node in self.nodes.values()):
+            return self._error(409, f'Node "{data["name"]}" already exists')
+        self._ids["node"] += 1
+        node = {
+            "name": data["name"],
+            "address": data["address"],
+            "port": data.get("port") or 62050,
+            "api_port": data.get("api_port") or 62051,
+            "usage_coefficient": data.get("usage_coefficient") or 1,
+            "id": self._ids["node"],
+            "xray_version": None,
+            "status": "connecting",
+            "message": None,
+            "usage": {"uplink": 0, "downlink": 0},
+        }
+        self.nodes[node["id"]] = node
+        if data.get("add_as_new_host", True):
+            for tag in self.inbounds_by_tag:
+                self.hosts.setdefault(tag, []).append(_host(f"{DEFAULT_HOST_REMARK} ({node['name']})", node["address"]))
+            self._generator = None
+        return web.json_response(self._node_response(node))
+
+    async def _get_node(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        return web.json_response(self._node_response(self._node(request)))
+
+    async def _modify_node(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        node = self._node(request)
+        data = await request.json()
+        for field in ("name", "address", "port", "api_port", "usage_coefficient"):
+            if data.get(field) is not None:
+                node[field] = data[field]
+        if data.get("status") == "disabled":
+            node["status"], node["message"] = "disabled", None
+        elif data.get("status") is not None or node["status"] == "disabled":
+            node["status"], node["message"] = "connecting", None
+        return web.json_response(self._node_response(node))
+
+    async def _remove_node(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        del self.nodes[self._node(request)["id"]]
+        return web.json_response({})
+
+    async def _get_nodes(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        return web.json_response([self._node_response(node) for node in self.nodes.values()])
+
+    async def _reconnect_node(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        node = self._node(request)
+        if node["status"] != "disabled":
+            node["status"], node["message"] = "connecting", None
+        return web.json_response({})
+
+    async def _get_nodes_usage(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        usages = [{"node_id": None, "node_name": "Master", **self.master_usage}]
+        usages += [{"node_id": node["id"], "node_name": node["name"], **node["usage"]} for node in self.nodes.values()]
+        return web.json_response({"usages": usages})
+
+    # Subscription
+
+    def _subscription_user(self, request: web.Request) -> dict:
+        username = self.sub_tokens.get(request.match_info["token"])
+        if username is None or username not in self.users:
+            raise self._not_found("Not Found")
+        user = self._review(self.users[username])
+        user["sub_updated_at"] = _iso()
+        user["sub_last_user_agent"] = request.headers.get("user-agent", "")
+        return user
+
+    def _subscription_response(self, request: web.Request, user: dict, client_type: str) -> web.Response:
+        if self._generator is None:
+            self._generator = LinkGenerator(self.core_config, self.hosts)
+        content = self._generator.subscription_content(UserResponse(**user))
+        headers = dict(content.headers)
+        headers["profile-title"] = "base64:" + base64.b64encode(b"Marzban").decode()
+        headers["profile-web-page-url"] = str(request.url)
+        headers["support-url"] = ""
+
+        if client_type in ("sing-box", "v2ray-json", "outline"):
+            body = json.dumps({"outbounds": [{"type": "vless", "tag": link.rsplit("#", 1)[-1]} for link in user["links"]]})
+            headers["content-type"] = "application/json"
+        elif client_type in ("clash", "clash-meta"):
+            body = "proxies:\n" + "".join(f"- name: {link.rsplit('#', 1)[-1]}\n  type: vless\n" for link in user["links"])
+            headers["content-type"] = "text/yaml; charset=utf-8"
+        else:
+            body = content.body.decode()
+        content_type = headers.pop("content-type")
+        response = web.Response(text=body, headers=headers)
+        response.headers["content-type"] = content_type
+        return response
+
+    async def _user_subscription(self, request: web.Request) -> web.Response:
+        user = self._subscription_user(request)
+        client_type = user_agent_class(request.headers.get("user-agent", ""))
+        return self._subscription_response(request, user, client_type if client_type != "default" else "v2ray")
+
+    async def _user_subscription_info(self, request: web.Request) -> web.Response:
+        user = self._subscription_user(request)
+        hidden = ("inbounds", "excluded_inbounds", "admin", "note", "auto_delete_in_days")
+        return web.json_response({key: value for key, value in user.items() if key not in hidden})
+
+    async def _user_subscription_usage(self, request: web.Request) -> web.Response:
+        user = self._subscription_user(request)
+        return web.json_response({
+            "username": user["username"],
+            "usages": [{"node_id": None, "node_name": "Master", "used_traffic": user["used_traffic"]}],
+        })
+
+    async def _user_subscription_with_client_type(self, request: web.Request) -> web.Response:
+        user = self._subscription_user(request)
+        return self._subscription_response(request, user, request.match_info["client_type"])
+
+    # System
+
+    async def _get_system_stats(self, request: web.Request) -> web.Response:
+        users = [self._review(user) for user in self.users.values()]
+        statuses = [user["status"] for user in users]
+        uplink = self.master_usage["uplink"] + sum(node["usage"]["uplink"] for node in self.nodes.values())
+        downlink = self.master_usage["downlink"] + sum(node["usage"]["downlink"] for node in self.nodes.values())
+        return web.json_response({
+            "version": "0.8.4",
+            "mem_total": 8 * 1024 ** 3,
+            "mem_used": 2 * 1024 ** 3,
+            "cpu_cores": 4,
+            "cpu_usage": 3.5,
+            "total_user": len(users),
+            "online_users": 0,
+            "users_active": statuses.count("active"),
+            "users_on_hold": statuses.count("on_hold"),
+            "users_disabled": statuses.count("disabled"),
+            "users_expired": statuses.count("expired"),
+            "users_limited": statuses.count("limited"),
+            "incoming_bandwidth": uplink,
+            "outgoing_bandwidth": downlink,
+            "incoming_bandwidth_speed": 0,
+            "outgoing_bandwidth_speed": 0,
+        })
+
+    async def _get_inbounds(self, request: web.Request) -> web.Response:
+        inbounds = {}
+        for inbound in self.inbounds_by_tag.values():
+            inbounds.setdefault(inbound["protocol"], []).append(_inbound_settings(inbound))
+        return web.json_response(inbounds)
+
+    def _hosts_response(self) -> web.Response:
+        return web.json_response({tag: self.hosts.get(tag, []) for tag in self.inbounds_by_tag})
+
+    async def _get_hosts(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        return self._hosts_response()
+
+    async def _modify_hosts(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        data = await request.json()
+        for tag in data:
+            if tag not in self.inbounds_by_tag:
+                return self._error(400, f"Inbound {tag} doesn't exist")
+        for tag, hosts in data.items():
+            self.hosts[tag] = [_host(**host) for host in hosts]
+        self._generator = None
+        return self._hosts_response()
+
+    # User template
+
+    async def _add_user_template(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        data = await request.json()
+        if data.get("name") and any(item["name"] == data["name"] for item in self.templates.values()):
+            return self._error(409, "Template by this name already exists")
+        self._ids["template"] += 1
+        template = {
+            "name": data.get("name"),
+            "data_limit": data.get("data_limit"),
+            "expire_duration": data.get("expire_duration"),
+            "username_prefix": data.get("username_prefix"),
+            "username_suffix": data.get("username_suffix"),
+            "inbounds": data.get("inbounds") or {},
+            "id": self._ids["template"],
+        }
+        self.templates[template["id"]] = template
+        return web.json_response(template)
+
+    async def _get_user_templates(self, request: web.Request) -> web.Response:
+        templates = list(self.templates.values())
+        offset = int(request.query.get("offset", 0))
+        limit = request.query.get("limit")
+        templates = templates[offset:offset + int(limit)] if limit is not None else templates[offset:]
+        return web.json_response(templates)
+
+    async def _get_user_template(self, request: web.Request) -> web.Response:
+        return web.json_response(self._template(request))
+
+    async def _modify_user_template(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        template = self._template(request)
+        data = await request.json()
+        for field in ("name", "data_limit", "expire_duration", "username_prefix", "username_suffix", "inbounds"):
+            if data.get(field) is not None:
+                template[field] = data[field]
+        return web.json_response(template)
+
+    async def _remove_user_template(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        del self.templates[self._template(request)["id"]]
+        return web.json_response({})
+
+    # User
+
+    async def _add_user(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if not USERNAME_PATTERN.match(str(data.get("username", ""))):
+            return self._validation_error(
+                ["body", "username"],
+                "Username only can be 3 to 32 characters and contain a-z, 0-9, and underscores in between.",
+            )
+        error = self._status_error(data)
+        if error is not None:
+            return error
+        if data["username"] in self.users:
+            return self._error(409, "User already exists")
+        return web.json_response(self.create_user(data, admin=self._current_admin(request)["username"]))
+
+    async def _get_user(self, request: web.Request) -> web.Response:
+        return web.json_response(self._user(request))
+
+    async def _modify_user(self, request: web.Request) -> web.Response:
+        user = self._user(request)
+        data = await request.json()
+        error = self._status_error(data)
+        if error is not None:
+            return error
+        if data.get("proxies"):
+            user["proxies"] = {
+                protocol: self._proxy_settings(protocol, {**user["proxies"].get(protocol, {}), **(settings or {})})
+                for protocol, settings in data["proxies"].items()
+            }
+            user["inbounds"] = {
+                protocol: tags for protocol, tags in {**self._inbounds_for(user["proxies"]), **user["inbounds"]}.items()
+                if protocol in user["proxies"]
+            }
+        if data.get("inbounds"):
+            user["inbounds"].update({protocol: tags for protocol, tags in data["inbounds"].items() if tags})
+            user["excluded_inbounds"] = self._excluded(user["inbounds"])
+        for field in ("data_limit", "data_limit_reset_strategy", "note", "on_hold_expire_duration",
+                      "on_hold_timeout", "auto_delete_in_days", "next_plan"):
+            if field in data and data[field] is not None:
+                user[field] = data[field]
+        if data.get("expire") is not None:
+            user["expire"] = data["expire"] or None
+        if data.get("status") is not None:
+            user["status"] = data["status"]
+            if user["status"] == "on_hold":
+                user["expire"] = None
+        self._review(user)
+        self._render_links(user)
+        return web.json_response(user)
+
+    async def _remove_user(self, request: web.Request) -> web.Response:
+        user = self._user(request)
+        del self.users[user["username"]]
+        self.sub_tokens.pop(user["subscription_url"].rsplit("/", 1)[-1], None)
+        return web.json_response({})
+
+    async def _reset_user_usage(self, request: web.Request) -> web.Response:
+        user = self._user(request)
+        user["used_traffic"] = 0
+        if user["status"] == "limited":
+            user["status"] = "active"
+        return web.json_response(self._review(user))
+
+    async def _revoke_user_subscription(self, request: web.Request) -> web.Response:
+        user = self._user(request)
+        user["proxies"] = {
+            protocol: self._proxy_settings(protocol, {key: value for key, value in settings.items()
+                                                      if key not in ("id", "password")})
+            for protocol, settings in user["proxies"].items()
+        }
+        self._issue_sub_token(user)
+        self._render_links(user)
+        return web.json_response(user)
+
+    async def _get_users(self, request: web.Request) -> web.Response:
+        admin = self._current_admin(request)
+        users = [self._review(user) for user in self.users.values()]
+        if not admin["is_sudo"]:
+            users = [user for user in users if (user["admin"] or {}).get("username") == admin["username"]]
+        usernames = request.query.getall("username", [])
+        if usernames:
+            users = [user for user in users if user["username"] in usernames]
+        admins = request.query.getall("admin", [])
+        if admins:
+            users = [user for user in users if (user["admin"] or {}).get("username") in admins]
+        search = request.query.get("search")
+        if search:
+            users = [user for user in users if search in user["username"] or search in (user["note"] or "")]
+        status = request.query.get("status")
+        if status:
+            users = [user for user in users if user["status"] == status]
+        for sort in reversed((request.query.get("sort") or "").split(",")):
+            field = sort.lstrip("-")
+            if field:
+                users.sort(key=lambda user: (user[field] is not None, user[field]), reverse=sort.startswith("-"))
+        total = len(users)
+        offset = int(request.query.get("offset", 0))
+        limit = request.query.get("limit")
+        users = users[offset:offset + int(limit)] if limit is not None else users[offset:]
+        return web.json_response({"users": users, "total": total})
+
+    async def _reset_users_usage(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        for user in self.users.values():
+            user["used_traffic"] = 0
+            self._review(user)
+        return web.json_response({})
+
+    async def _get_user_usage(self, request: web.Request) -> web.Response:
+        user = self._user(request)
+        return web.json_response({"node_id": None, "node_name": "Master", "used_traffic": user["used_traffic"]})
+
+    async def _active_next_plan(self, request: web.Request) -> web.Response:
+        user = self._user(request)
+        plan = user["next_plan"]
+        if not plan:
+            raise self._not_found("User doesn't have next plan")
+        if plan.get("add_remaining_traffic") and user["data_limit"]:
+            remaining = max(user["data_limit"] - user["used_traffic"], 0)
+            user["data_limit"] = (plan.get("data_limit") or 0) + remaining
+        else:
+            user["data_limit"] = plan.get("data_limit")
+        user["expire"] = plan.get("expire")
+        user["used_traffic"] = 0
+        user["next_plan"] = None
+        user["status"] = "active"
+        return web.json_response(self._review(user))
+
+    async def _get_users_usage(self, request: web.Request) -> web.Response:
+        admins = request.query.getall("admin", [])
+        return web.json_response({"usages": [
+            {
+                "username": user["username"],
+                "usages": [{"node_id": None, "node_name": "Master", "used_traffic": user["used_traffic"]}],
+            }
+            for user in self.users.values()
+            if not admins or (user["admin"] or {}).get("username") in admins
+        ]})
+
+    async def _set_owner(self, request: web.Request) -> web.Response:
+        self._require_sudo(request)
+        user = self._user(request)
+        admin = self._admin(request.query.get("admin_username", ""))
+        user["admin"] = copy.copy(admin)
+        return web.json_response(user)
+
+    def _expired_users(self, request: web.Request) -> List[dict]:
+        def timestamp(name: str) -> Optional[float]:
+            value = request.query.get(name)
+            if not value:
+                return None
+            return time.mktime(time.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")) - time.timezone
+
+        before, after = timestamp("expired_before"), timestamp("expired_after")
+        return [
+            user for user in map(self._review, list(self.users.values()))
+            if user["status"] == "expired"
+            and (before is None or user["expire"] <= before)
+            and (after is None or user["expire"] >= after)
+        ]
+
+    async def _get_expired_users(self, request: web.Request) -> web.Response:
+        return web.json_response([user["username"] for user in self._expired_users(request)])
+
+    async def _delete_expired_users(self, request: web.Request) -> web.Response:
+        usernames = [user["username"] for user in self._expired_users(request)]
+        for username in usernames:
+            user = self.users.pop(username)
+            self.sub_tokens.pop(user["subscription_url"].rsplit("/", 1)[-1], None)
+        return web.json_response(usernames)
+
+    # Server
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        add_get, add_post, add_put, add_delete = (
+            app.router.add_get, app.router.add_post, app.router.add_put, app.router.add_delete,
+        )
+
+        add_post("/api/admin/token", self._token)
+        add_get("/api/admin", self._get_current_admin)
+        add_post("/api/admin", self._create_admin)
+        add_put("/api/admin/{username}", self._modify_admin)
+        add_delete("/api/admin/{username}", self._remove_admin)
+        add_get("/api/admins", self._get_admins)
+        add_post("/api/admin/{username}/users/disable", self._disable_admin_users)
+        add_post("/api/admin/{username}/users/activate", self._activate_admin_users)
+        add_post("/api/admin/usage/reset/{username}", self._reset_admin_usage)
+        add_get("/api/admin/usage/{username}", self._get_admin_usage)
+
+        add_get("/api/core", self._get_core_stats)
+        add_post("/api/core/restart", self._restart_core)
+        add_get("/api/core/config", self._get_core_config)
+        add_put("/api/core/config", self._modify_core_config)
+
+        add_get("/api/node/settings", self._get_node_settings)
+        add_post("/api/node", self._add_node)
+        add_get(r"/api/node/{node_id:\d+}", self._get_node)
+        add_put(r"/api/node/{node_id:\d+}", self._modify_node)
+        add_delete(r"/api/node/{node_id:\d+}", self._remove_node)
+        add_get("/api/nodes", self._get_nodes)
+        add_post(r"/api/node/{node_id:\d+}/reconnect", self._reconnect_node)
+        add_get("/api/nodes/usage", self._get_nodes_usage)
+
+        sub = f"/{self.sub_path}/{{token}}"
+        add_get(sub, self._user_subscription)
+        add_get(sub + "/info", self._user_subscription_info)
+        add_get(sub + "/usage", self._user_subscription_usage)
+        add_get(sub + "/{client_type:sing-box|clash-meta|clash|outline|v2ray|v2ray-json}",
+                self._user_subscription_with_client_type)
+
+        add_get("/api/system", self._get_system_stats)
+        add_get("/api/inbounds", self._get_inbounds)
+        add_get("/api/hosts", self._get_hosts)
+        add_put("/api/hosts", self._modify_hosts)
+
+        add_post("/api/user_template", self._add_user_template)
+        add_get("/api/user_template", self._get_user_templates)
+        add_get(r"/api/user_template/{template_id:\d+}", self._get_user_template)
+        add_put(r"/api/user_template/{template_id:\d+}", self._modify_user_template)
+        add_delete(r"/api/user_template/{template_id:\d+}", self._remove_user_template)
+
+        add_post("/api/user", self._add_user)
+        add_get("/api/user/{username}", self._get_user)
+        add_put("/api/user/{username}", self._modify_user)
+        add_delete("/api/user/{username}", self._remove_user)
+        add_post("/api/user/{username}/reset", self._reset_user_usage)
+        add_post("/api/user/{username}/revoke_sub", self._revoke_user_subscription)
+        add_get("/api/users", self._get_users)
+        add_post("/api/users/reset", self._reset_users_usage)
+        add_get("/api/user/{username}/usage", self._get_user_usage)
+        add_post("/api/user/{username}/active-next", self._active_next_plan)
+        add_get("/api/users/usage", self._get_users_usage)
+        add_put("/api/user/{username}/set-owner", self._set_owner)
+        add_get("/api/users/expired", self._get_expired_users)
+        add_delete("/api/users/expired", self._delete_expired_users)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start serving and return panel address for `MarzbanAPI`.
+        """
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.address = f"http://{host}:{port}/"
+        return self.address
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Serve from an event loop in a daemon thread, so the panel can be used from any loop or sync code.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-marzban", daemon=True)
+        self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self.start(host, port), self._loop).result()
+
+    def stop_thread(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+    async def __aenter__(self) -> "FakeMarzban":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
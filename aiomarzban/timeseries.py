@@ -0,0 +1,275 @@
+import asyncio
+import datetime
+import time
+from array import array
+from typing import Optional, List, Dict, Tuple, Callable, Any
+
+from .models import NodesUsageResponse, SystemStats
+
+
+# Resolution in seconds -> number of buckets kept for that resolution.
+DEFAULT_TIERS: Dict[int, int] = {
+    1: 3600,       # 1 hour of 1s buckets
+    60: 1440,      # 1 day of 1m buckets
+    3600: 24 * 90,  # 90 days of 1h buckets
+}
+
+SYSTEM_SERIES = "__system__"
+
+
+class TrafficRingBuffer:
+    """
+    Fixed-size, array-backed ring of (uplink, downlink) byte counters.
+
+    Every bucket covers `resolution` seconds. A bucket is addressed directly by its slot number
+    (timestamp // resolution) modulo capacity, so writes and lookups are O(1) and the memory
+    footprint never changes once the buffer is created.
+    """
+
+    def __init__(self, resolution: int, capacity: int):
+        if resolution <= 0 or capacity <= 0:
+            raise ValueError("Resolution and capacity must be positive.")
+        self.resolution = resolution
+        self.capacity = capacity
+        self.last_slot = -1
+        self._slots = array("q", [-1]) * capacity
+        self._uplink = array("q", [0]) * capacity
+        self._downlink = array("q", [0]) * capacity
+
+    def add(self, timestamp: float, uplink: int, downlink: int) -> None:
+        """
+        Accumulate traffic into the bucket that covers the timestamp.
+        Samples older than the retained window are ignored.
+        """
+        slot = int(timestamp // self.resolution)
+        if slot <= self.last_slot - self.capacity:
+            return
+        index = slot % self.capacity
+        if self._slots[index] != slot:
+            self._slots[index] = slot
+            self._uplink[index] = 0
+            self._downlink[index] = 0
+        self._uplink[index] += uplink
+        self._downlink[index] += downlink
+        if slot > self.last_slot:
+            self.last_slot = slot
+
+    def range(self, start: float, end: float) -> List[Tuple[int, int, int]]:
+        """
+        Return buckets within [start, end] as (bucket start timestamp, uplink, downlink).
+        Buckets without samples are skipped.
+        """
+        if self.last_slot < 0:
+            return []
+        first = max(int(start // self.resolution), self.last_slot - self.capacity + 1)
+        last = min(int(end // self.resolution), self.last_slot)
+        result = []
+        for slot in range(first, last + 1):
+            index = slot % self.capacity
+            if self._slots[index] == slot:
+                result.append((slot * self.resolution, self._uplink[index], self._downlink[index]))
+        return result
+
+    def total(self, start: float, end: float) -> Tuple[int, int]:
+        """
+        Return summed (uplink, downlink) over [start, end].
+        """
+        uplink = downlink = 0
+        for _, up, down in self.range(start, end):
+            uplink += up
+            downlink += down
+        return uplink, downlink
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self._slots, self._uplink, self._downlink))
+
+
+class TrafficSeries:
+    """
+    Traffic of a single node stored in several downsampled ring buffers (by default 1s, 1m and 1h).
+    """
+
+    def __init__(self, tiers: Optional[Dict[int, int]] = None):
+        tiers = tiers or DEFAULT_TIERS
+        self.tiers: Dict[int, TrafficRingBuffer] = {
+            resolution: TrafficRingBuffer(resolution, capacity)
+            for resolution, capacity in sorted(tiers.items())
+        }
+        self.last_timestamp: Optional[float] = None
+        self.uplink_rate = 0.0
+        self.downlink_rate = 0.0
+
+    def add(self, timestamp: float, uplink: int, downlink: int, interval: Optional[float] = None) -> None:
+        """
+        Add traffic delta measured over `interval` seconds ending at `timestamp`.
+        """
+        for tier in self.tiers.values():
+            tier.add(timestamp, uplink, downlink)
+        if interval:
+            self.uplink_rate = uplink / interval
+            self.downlink_rate = downlink / interval
+        self.last_timestamp = timestamp
+
+    def best_resolution(self, start: float, end: float) -> int:
+        """
+        Return the finest resolution which still covers the requested start.
+        """
+        for resolution, tier in self.tiers.items():
+            if tier.last_slot < 0:
+                continue
+            oldest = (tier.last_slot - tier.capacity + 1) * resolution
+            if oldest <= start:
+                return resolution
+        return max(self.tiers)
+
+    def range(
+        self,
+        start: float,
+        end: Optional[float] = None,
+        resolution: Optional[int] = None,
+    ) -> List[Tuple[int, int, int]]:
+        end = time.time() if end is None else end
+        resolution = resolution or self.best_resolution(start, end)
+        if resolution not in self.tiers:
+            raise ValueError(f"Unknown resolution: {resolution}. Available: {list(self.tiers)}")
+        return self.tiers[resolution].range(start, end)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tier.nbytes for tier in self.tiers.values())
+
+
+class NodeTrafficCollector:
+    """
+    Periodically samples cumulative node usage and stores traffic deltas per node.
+
+    Memory usage is constant: every node gets a `TrafficSeries` of fixed-size ring buffers.
+    Cumulative counters that go backwards (usage reset, node re-creation) are treated
+    as a new baseline instead of producing negative traffic.
+
+    Without `start` the panel returns usage of a rolling window (the last 30 days), which loses old traffic
+    between samples. Usage is therefore always requested from a fixed `usage_start`.
+    """
+
+    def __init__(
+        self,
+        api: Any,
+        interval: float = 10,
+        tiers: Optional[Dict[int, int]] = None,
+        collect_system_stats: bool = False,
+        on_error: Optional[Callable[[BaseException], Any]] = None,
+        usage_start: Optional[str] = None,
+    ):
+        """
+        :param api: `MarzbanAPI` instance.
+        :param interval: Seconds between samples.
+        :param tiers: Mapping of resolution in seconds to amount of kept buckets.
+        :param collect_system_stats: Also sample incoming/outgoing bandwidth of `get_system_stats`.
+        :param on_error: Called with exception when sampling fails. By default errors are ignored.
+        :param usage_start: Fixed `start` of `get_nodes_usage` requests (ISO datetime in UTC), so that usage
+        is a cumulative counter. By default, the creation time of the collector rounded down to the hour
+        (the panel stores node usage in hourly rows).
+        """
+        self.api = api
+        self.interval = interval
+        self.tiers = tiers or DEFAULT_TIERS
+        self.collect_system_stats = collect_system_stats
+        self.on_error = on_error
+        if usage_start is None:
+            now = datetime.datetime.now(tz=datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+            usage_start = now.strftime("%Y-%m-%dT%H:%M:%S")
+        self.usage_start = usage_start
+        self.series: Dict[str, TrafficSeries] = {}
+        self._counters: Dict[str, Tuple[float, int, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _record(self, name: str, timestamp: float, uplink: int, downlink: int) -> None:
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = TrafficSeries(self.tiers)
+
+        previous = self._counters.get(name)
+        self._counters[name] = (timestamp, uplink, downlink)
+        if previous is None:
+            series.last_timestamp = timestamp
+            return
+
+        prev_timestamp, prev_uplink, prev_downlink = previous
+        delta_up = uplink - prev_uplink
+        delta_down = downlink - prev_downlink
+        if delta_up < 0 or delta_down < 0:
+            return
+        series.add(timestamp, delta_up, delta_down, interval=timestamp - prev_timestamp)
+
+    async def sample(self, timestamp: Optional[float] = None) -> None:
+        """
+        Take a single sample of all nodes (and system stats if enabled).
+        """
+        usage: NodesUsageResponse = await self.api.get_nodes_usage(start=self.usage_start)
+        timestamp = time.time() if timestamp is None else timestamp
+        for node in usage.usages:
+            self._record(node.node_name, timestamp, node.uplink, node.downlink)
+
+        if self.collect_system_stats:
+            stats: SystemStats = await self.api.get_system_stats()
+            self._record(SYSTEM_SERIES, timestamp, stats.outgoing_bandwidth, stats.incoming_bandwidth)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                await self.sample()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def nodes(self) -> List[str]:
+        return [name for name in self.series if name != SYSTEM_SERIES]
+
+    def query(
+        self,
+        node_name: str,
+        start: float,
+        end: Optional[float] = None,
+        resolution: Optional[int] = None,
+    ) -> List[Tuple[int, int, int]]:
+        """
+        Return traffic buckets of the node as (timestamp, uplink bytes, downlink bytes).
+
+        :param node_name: Node name, or `SYSTEM_SERIES` for system bandwidth.
+        :param start: Range start in unix time.
+        :param end: Range end in unix time, now by default.
+        :param resolution: Bucket size in seconds. By default, the finest tier covering `start`.
+        """
+        series = self.series.get(node_name)
+        if series is None:
+            return []
+        return series.range(start, end, resolution)
+
+    def rate(self, node_name: str) -> Tuple[float, float]:
+        """
+        Return the latest (uplink, downlink) rate of the node in bytes per second.
+        """
+        series = self.series.get(node_name)
+        if series is None:
+            return 0.0, 0.0
+        return series.uplink_rate, series.downlink_rate
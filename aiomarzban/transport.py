@@ -0,0 +1,310 @@
+import abc
+import json
+from asyncio.exceptions import TimeoutError
+from typing import Optional, Any, Dict, Callable, Awaitable, AsyncIterator, Union, Mapping
+
+import aiohttp
+from aiohttp.payload import JsonPayload
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from .metrics import route_template
+
+
+class Request:
+    """
+    HTTP request to the panel as seen by middlewares. Middlewares may change any attribute before it is sent.
+    """
+
+    __slots__ = ("method", "url", "path", "_route", "_sub_path", "json", "data", "params", "headers", "timeout", "ssl",
+                 "handler", "extensions")
+
+    def __init__(
+        self,
+        method: str,
+        url: str,
+        path: str,
+        route: Optional[str] = None,
+        json: Optional[Any] = None,
+        data: Optional[dict] = None,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        timeout: Optional[float] = None,
+        ssl: bool = False,
+        handler: Optional[Callable[["Response"], Awaitable[Any]]] = None,
+        sub_path: Optional[str] = None,
+    ):
+        """
+        :param method: HTTP method.
+        :param url: Full url including path.
+        :param path: Path relative to the api url (or panel root for subscription routes).
+        :param route: Route template of the path, e.g. "/user/{username}". Computed from `path` on first access
+        if not specified.
+        :param json: JSON body.
+        :param data: Form body.
+        :param params: Query parameters.
+        :param headers: Request headers.
+        :param timeout: Total timeout in seconds.
+        :param ssl: Verify SSL certificate.
+        :param handler: Coroutine function consuming a successful response while the connection is open
+        (e.g. to stream the body). Its result is stored in `Response.result`.
+        :param sub_path: Subscription path of the panel for subscription requests, used to compute `route`.
+        """
+        self.method = method
+        self.url = url
+        self.path = path
+        self._route = route
+        self._sub_path = sub_path
+        self.json = json
+        self.data = data
+        self.params = params
+        self.headers = headers
+        self.timeout = timeout
+        self.ssl = ssl
+        self.handler = handler
+        # Free-form per-request state for middlewares
+        self.extensions: Dict[str, Any] = {}
+
+    @property
+    def route(self) -> str:
+        if self._route is None:
+            self._route = route_template(self.path, self._sub_path)
+        return self._route
+
+    @route.setter
+    def route(self, route: str) -> None:
+        self._route = route
+
+    def __repr__(self) -> str:
+        return f"Request({self.method} {self.url})"
+
+
+class _BufferedContent:
+    def __init__(self, body: bytes):
+        self._body = body
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def iter_chunked(self, n: int) -> AsyncIterator[bytes]:
+        for i in range(0, len(self._body), n):
+            yield self._body[i:i + n]
+
+
+class Response:
+    """
+    HTTP response of the panel as seen by middlewares.
+
+    The body is read into `body`, except for successful responses of requests with a handler:
+    their body is consumed by the handler and its result is stored in `result`.
+    Middlewares may also return a `Response` of their own (e.g. from cache) without sending the request.
+    """
+
+    __slots__ = ("status", "headers", "body", "content", "size", "sent", "result", "handled")
+
+    def __init__(
+        self,
+        status: int,
+        headers: Optional[Union[Mapping[str, str], CIMultiDictProxy]] = None,
+        body: bytes = b"",
+        content: Optional[Any] = None,
+        size: Optional[int] = None,
+    ):
+        """
+        :param status: HTTP status.
+        :param headers: Response headers.
+        :param body: Response body.
+        :param content: Body stream with `read()` and `iter_chunked(n)`. Built from `body` if not specified.
+        :param size: Number of body bytes received. Length of `body` if not specified.
+        """
+        self.status = status
+        self.headers = headers if isinstance(headers, CIMultiDictProxy) else CIMultiDictProxy(CIMultiDict(headers or {}))
+        self.body = body
+        self.content = content if content is not None else _BufferedContent(body)
+        self.size = len(body) if size is None else size
+        # Number of request body bytes sent, if the transport knows it
+        self.sent: Optional[int] = None
+        self.result: Any = None
+        self.handled = False
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status <= 226
+
+    async def read(self) -> bytes:
+        return await self.content.read()
+
+    def text(self) -> str:
+        return self.body.decode(errors="replace")
+
+    def json(self) -> Any:
+        """
+        Decode JSON body. Empty body is decoded as None.
+        """
+        if not self.body.strip():
+            return None
+        return json.loads(self.body)
+
+    def __repr__(self) -> str:
+        return f"Response(status={self.status}, size={self.size})"
+
+
+async def aiohttp_send(session: aiohttp.ClientSession, request: Request) -> Response:
+    """
+    Send request with aiohttp session.
+    """
+    # Serialized here (as aiohttp would do for json=) to know the sent size without encoding the body twice
+    payload = JsonPayload(request.json) if request.json is not None else None
+    async with session.request(
+        request.method,
+        url=request.url,
+        data=payload if payload is not None else request.data,
+        headers=request.headers,
+        params=request.params,
+        ssl=request.ssl,
+        timeout=aiohttp.ClientTimeout(total=request.timeout),
+        trace_request_ctx=request.extensions.get("trace_request_ctx"),
+    ) as resp:
+        if request.handler is not None and 200 <= resp.status <= 226:
+            response = Response(resp.status, resp.headers, content=resp.content)
+            response.result = await request.handler(response)
+            response.handled = True
+        else:
+            response = Response(resp.status, resp.headers, await resp.read())
+        response.size = resp.content.total_bytes
+        if payload is not None:
+            response.sent = payload.size
+        return response
+
+
+class TransportConnectError(ConnectionError):
+    """
+    Connection to the panel failed in a non-aiohttp transport. Retried like aiohttp connection errors.
+    """
+
+
+class Transport(abc.ABC):
+    """
+    Backend sending requests to the panel. Pass it as `MarzbanAPI(..., transport=...)`.
+
+    Implement `send`: send the request and return the response. For successful (2xx) responses of requests
+    with a handler, call the handler with a streaming `Response` while the connection is open,
+    store its result in `Response.result` and set `Response.handled`. Raise `TimeoutError` on timeouts
+    and `TransportConnectError` when the panel is unreachable, so that the client retries.
+    """
+
+    @abc.abstractmethod
+    async def send(self, request: Request) -> Response:
+        ...
+
+    async def close(self) -> None:
+        return None
+
+    async def __aenter__(self) -> "Transport":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+
+class AiohttpTransport(Transport):
+    """
+    Transport over a persistent `aiohttp.ClientSession` (HTTP/1.1 connection pool).
+    """
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None, **session_kwargs):
+        """
+        :param session: External session. It is not closed by .close().
+        :param session_kwargs: Arguments of `aiohttp.ClientSession` created on the first request,
+        e.g. `connector=aiohttp.TCPConnector(limit=200)`.
+        """
+        self.session = session
+        self._own_session = session is None
+        self._session_kwargs = session_kwargs
+
+    async def send(self, request: Request) -> Response:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(**self._session_kwargs)
+        return await aiohttp_send(self.session, request)
+
+    async def close(self) -> None:
+        if self.session is not None and self._own_session:
+            await self.session.close()
+            self.session = None
+
+
+class _HttpxContent:
+    def __init__(self, response):
+        self._response = response
+
+    async def read(self) -> bytes:
+        return await self._response.aread()
+
+    async def iter_chunked(self, n: int) -> AsyncIterator[bytes]:
+        async for chunk in self._response.aiter_bytes(n):
+            yield chunk
+
+
+class HttpxTransport(Transport):
+    """
+    Transport over `httpx.AsyncClient`, with HTTP/2 by default: concurrent requests are multiplexed
+    over a few connections instead of a large HTTP/1.1 pool.
+    Requires `pip install aiomarzban[httpx]`. HTTP/2 is negotiated over TLS only, plain http uses HTTP/1.1.
+    """
+
+    def __init__(
+        self,
+        http2: bool = True,
+        max_connections: Optional[int] = 100,
+        verify: bool = False,
+        client: Optional[Any] = None,
+        **client_kwargs,
+    ):
+        """
+        :param http2: Use HTTP/2 when the server supports it.
+        :param max_connections: Connection pool size.
+        :param verify: Verify SSL certificates. Disabled by default like in the aiohttp transport.
+        :param client: External `httpx.AsyncClient`. It is not closed by .close().
+        :param client_kwargs: Other arguments of `httpx.AsyncClient`.
+        """
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("HttpxTransport requires httpx: pip install aiomarzban[httpx]") from e
+        self._httpx = httpx
+        self._own_client = client is None
+        self.client = client if client is not None else httpx.AsyncClient(
+            http2=http2,
+            verify=verify,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            **client_kwargs,
+        )
+
+    async def send(self, request: Request) -> Response:
+        httpx = self._httpx
+        try:
+            async with self.client.stream(
+                request.method,
+                request.url,
+                json=request.json,
+                data=request.data,
+                params=request.params,
+                headers=request.headers,
+                timeout=request.timeout,
+            ) as resp:
+                headers = CIMultiDictProxy(CIMultiDict(resp.headers.multi_items()))
+                if request.handler is not None and 200 <= resp.status_code <= 226:
+                    response = Response(resp.status_code, headers, content=_HttpxContent(resp))
+                    response.result = await request.handler(response)
+                    response.handled = True
+                else:
+                    response = Response(resp.status_code, headers, await resp.aread())
+                response.size = resp.num_bytes_downloaded
+                return response
+        except httpx.TimeoutException as e:
+            raise TimeoutError(str(e)) from e
+        except httpx.ConnectError as e:
+            raise TransportConnectError(str(e)) from e
+
+    async def close(self) -> None:
+        if self._own_client:
+            await self.client.aclose()
@@ -0,0 +1,242 @@
+import asyncio
+import inspect
+import time
+from typing import Optional, List, Dict, Callable, Any, Iterable, Set
+
+from pydantic import BaseModel
+
+from .models import UserResponse
+
+
+class QuotaAlert(BaseModel):
+    username: str
+    # Fraction of the data limit, e.g. 0.8
+    threshold: float
+    used_traffic: int
+    data_limit: int
+    # Estimated consumption in bytes per second
+    rate: float
+    timestamp: float
+
+
+class _UserState:
+    __slots__ = ("used", "limit", "sampled_at", "rate", "next_poll", "fired")
+
+    def __init__(self, user: UserResponse, now: float):
+        self.used = user.used_traffic
+        self.limit = user.data_limit or 0
+        self.sampled_at = now
+        self.rate = 0.0
+        self.next_poll = now
+        self.fired: Set[float] = set()
+
+
+class QuotaWatcher:
+    """
+    Alerts when users cross fractions of their data limit (80%, 90%, 100% by default).
+
+    Instead of scanning all users every few minutes, the watcher estimates the consumption rate of every user
+    from successive `used_traffic` samples and polls a user again shortly before it is predicted to cross
+    its next threshold. Users close to a threshold are checked every `min_interval` seconds with batched
+    `get_users(username=[...])` lookups, idle users only by the full scan every `full_scan_interval` seconds,
+    which also picks up new users, changed limits and usage resets.
+    Users without data limit are not watched.
+    """
+
+    def __init__(
+        self,
+        api: Any,
+        thresholds: Iterable[float] = (0.8, 0.9, 1.0),
+        min_interval: float = 30,
+        full_scan_interval: float = 1800,
+        safety: float = 0.5,
+        smoothing: float = 0.5,
+        batch_size: int = 100,
+        page_size: int = 1000,
+        alert_on_start: bool = False,
+        on_alert: Optional[Callable[[QuotaAlert], Any]] = None,
+        on_error: Optional[Callable[[BaseException], Any]] = None,
+    ):
+        """
+        :param api: `MarzbanAPI` instance.
+        :param thresholds: Fractions of the data limit to alert at.
+        :param min_interval: Minimal seconds between polls of a user, also the tick interval of `run`.
+        :param full_scan_interval: Seconds between scans of all users.
+        :param safety: A user is polled again after this part of its predicted time to the next threshold.
+        :param smoothing: Weight of the newest sample in the consumption rate (exponential moving average).
+        :param batch_size: Usernames per `get_users` lookup.
+        :param page_size: Users per `get_users` request of the full scan.
+        :param alert_on_start: Alert thresholds which are already crossed when a user is seen for the first time
+        (e.g. after a restart of the watcher).
+        :param on_alert: Sync or async callback for alerts.
+        :param on_error: Called with exception when a poll fails.
+        """
+        self.api = api
+        self.thresholds = sorted(thresholds)
+        self.min_interval = min_interval
+        self.full_scan_interval = full_scan_interval
+        self.safety = safety
+        self.smoothing = smoothing
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.alert_on_start = alert_on_start
+        self.on_alert = on_alert
+        self.on_error = on_error
+
+        # Number of get_users requests sent
+        self.requests = 0
+        self._states: Dict[str, _UserState] = {}
+        self._next_full_scan = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _next_threshold(self, state: _UserState) -> Optional[float]:
+        for threshold in self.thresholds:
+            if threshold not in state.fired:
+                return threshold
+        return None
+
+    def _schedule(self, state: _UserState, now: float) -> None:
+        threshold = self._next_threshold(state)
+        if threshold is None or state.rate <= 0:
+            # Nothing to predict, the full scan will notice changes
+            state.next_poll = now + self.full_scan_interval
+            return
+        eta = (threshold * state.limit - state.used) / state.rate
+        state.next_poll = now + min(max(eta * self.safety, self.min_interval), self.full_scan_interval)
+
+    def _observe(self, user: UserResponse, now: float) -> List[QuotaAlert]:
+        if not user.data_limit:
+            self._states.pop(user.username, None)
+            return []
+        state = self._states.get(user.username)
+        if state is None:
+            state = self._states[user.username] = _UserState(user, now)
+            if not self.alert_on_start:
+                state.fired = {threshold for threshold in self.thresholds if user.used_traffic >= threshold * user.data_limit}
+        else:
+            elapsed = now - state.sampled_at
+            if user.used_traffic < state.used:
+                # Usage was reset
+                state.rate = 0.0
+            elif elapsed > 0:
+                rate = (user.used_traffic - state.used) / elapsed
+                state.rate = self.smoothing * rate + (1 - self.smoothing) * state.rate
+            state.used = user.used_traffic
+            state.limit = user.data_limit
+            state.sampled_at = now
+
+        # Thresholds which are not crossed anymore (reset, raised limit) can fire again
+        state.fired = {threshold for threshold in state.fired if state.used >= threshold * state.limit}
+        alerts = []
+        for threshold in self.thresholds:
+            if threshold not in state.fired and state.used >= threshold * state.limit:
+                state.fired.add(threshold)
+                alerts.append(QuotaAlert(
+                    username=user.username,
+                    threshold=threshold,
+                    used_traffic=state.used,
+                    data_limit=state.limit,
+                    rate=state.rate,
+                    timestamp=time.time(),
+                ))
+        self._schedule(state, now)
+        return alerts
+
+    async def _full_scan(self, now: float) -> List[QuotaAlert]:
+        alerts = []
+        seen = set()
+        offset = 0
+        while True:
+            page = await self.api.get_users(offset=offset, limit=self.page_size, sort="created_at")
+            self.requests += 1
+            for user in page.users:
+                seen.add(user.username)
+                alerts.extend(self._observe(user, now))
+            offset += self.page_size
+            if len(page.users) < self.page_size or offset >= page.total:
+                break
+        for username in list(self._states):
+            if username not in seen:
+                del self._states[username]
+        self._next_full_scan = now + self.full_scan_interval
+        return alerts
+
+    async def _poll_due(self, now: float) -> List[QuotaAlert]:
+        due = [username for username, state in self._states.items() if state.next_poll <= now]
+        alerts = []
+        for i in range(0, len(due), self.batch_size):
+            batch = due[i:i + self.batch_size]
+            page = await self.api.get_users(username=batch)
+            self.requests += 1
+            found = set()
+            for user in page.users:
+                found.add(user.username)
+                alerts.extend(self._observe(user, now))
+            for username in batch:
+                if username not in found:
+                    # Removed user
+                    self._states.pop(username, None)
+        return alerts
+
+    async def _emit(self, alert: QuotaAlert) -> None:
+        if self.on_alert is None:
+            return
+        result = self.on_alert(alert)
+        if inspect.isawaitable(result):
+            await result
+
+    async def tick(self, now: Optional[float] = None) -> List[QuotaAlert]:
+        """
+        Run the full scan if it is due, otherwise poll users which are due.
+
+        :return: Alerts of this tick.
+        """
+        now = time.monotonic() if now is None else now
+        if now >= self._next_full_scan:
+            alerts = await self._full_scan(now)
+        else:
+            alerts = await self._poll_due(now)
+        for alert in alerts:
+            await self._emit(alert)
+        return alerts
+
+    def next_poll(self, username: str) -> Optional[float]:
+        """
+        Time (in `time.monotonic` scale, or the scale of `now` passed to `tick`) of the next poll of the user.
+        """
+        state = self._states.get(username)
+        return state.next_poll if state is not None else None
+
+    def rate(self, username: str) -> Optional[float]:
+        """
+        Estimated consumption of the user in bytes per second.
+        """
+        state = self._states.get(username)
+        return state.rate if state is not None else None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+            await asyncio.sleep(max(0.0, self.min_interval - (loop.time() - started)))
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
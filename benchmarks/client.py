@@ -0,0 +1,210 @@
+"""
+Client throughput benchmark against an in-process fake panel.
+
+Run from the repository root:
+    python -m benchmarks.client --users 1000 --links 5 --latency 0.002 --output bench.json
+
+For every operation it reports requests per second, p50/p99/mean latency in milliseconds and
+peak memory allocated by Python while running the operation (measured in a separate tracemalloc pass,
+so that tracing does not slow down the timed pass). Server and client share one event loop.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Optional, List, Dict, Any, Callable, Awaitable
+
+import aiohttp
+import pydantic
+
+from aiomarzban import MarzbanAPI, __version__
+from aiomarzban.testing import FakeMarzban
+
+OPERATIONS = ("get_user", "add_user", "get_users", "get_users_usage", "refresh_credentials")
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _run(call: Callable[[int], Awaitable[Any]], requests: int, concurrency: int) -> List[float]:
+    latencies: List[float] = []
+    counter = itertools.count()
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            started = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def operations(api: MarzbanAPI, usernames: List[str], page_size: int) -> Dict[str, Callable[[int], Awaitable[Any]]]:
+    pages = max(1, -(-len(usernames) // page_size))
+    new_users = itertools.count()
+    rnd = random.Random(0)
+
+    return {
+        "get_user": lambda i: api.get_user(rnd.choice(usernames)),
+        "add_user": lambda i: api.add_user(f"bench{next(new_users)}", days=30, data_limit=10),
+        "get_users": lambda i: api.get_users(offset=(i % pages) * page_size, limit=page_size),
+        "get_users_usage": lambda i: api.get_users_usage(),
+        "refresh_credentials": lambda i: api.refresh_credentials(),
+    }
+
+
+async def bench_operation(
+    name: str,
+    panel: FakeMarzban,
+    usernames: List[str],
+    requests: int,
+    concurrency: int,
+    page_size: int,
+    memory_requests: int,
+) -> Dict[str, Any]:
+    api = MarzbanAPI(
+        panel.address, panel.admin_username, panel.admin_password,
+        default_proxies={"vless": {"flow": ""}}, use_single_session=True,
+    )
+    try:
+        await api.refresh_credentials()
+        call = operations(api, usernames, page_size)[name]
+        # Warm up connections and caches
+        await _run(call, concurrency, concurrency)
+
+        started = time.perf_counter()
+        latencies = await _run(call, requests, concurrency)
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        try:
+            await _run(call, memory_requests, concurrency)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        await api.close()
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "peak_memory_bytes": peak,
+    }
+
+
+async def run(
+    users: int = 1000,
+    links: int = 3,
+    latency: float = 0,
+    requests: int = 500,
+    concurrency: int = 20,
+    page_size: int = 100,
+    memory_requests: int = 50,
+    only: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Run benchmark and return machine-readable results.
+    """
+    panel = FakeMarzban(latency=latency, links_per_user=links)
+    usernames = panel.seed_users(users)
+    await panel.start()
+    results = {}
+    try:
+        for name in only or OPERATIONS:
+            results[name] = await bench_operation(
+                name, panel, usernames, requests, concurrency, page_size, memory_requests,
+            )
+    finally:
+        await panel.close()
+
+    return {
+        "meta": {
+            "timestamp": int(time.time()),
+            "aiomarzban": __version__,
+            "python": platform.python_version(),
+            "aiohttp": aiohttp.__version__,
+            "pydantic": pydantic.VERSION,
+            "platform": platform.platform(),
+        },
+        "params": {
+            "users": users,
+            "links_per_user": links,
+            "latency": latency,
+            "requests": requests,
+            "concurrency": concurrency,
+            "page_size": page_size,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """
+    Return relative change of every metric against the baseline results, e.g. {"get_user": {"rps": -0.12}}.
+    """
+    changes = {}
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        changes[name] = {
+            metric: round((result[metric] - before[metric]) / before[metric], 4)
+            for metric in ("rps", "p50_ms", "p99_ms", "peak_memory_bytes")
+            if before.get(metric)
+        }
+    return changes
+
+
+def main(args: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark aiomarzban against a local fake panel.")
+    parser.add_argument("--users", type=int, default=1000, help="Users on the fake panel.")
+    parser.add_argument("--links", type=int, default=3, help="Share links per user.")
+    parser.add_argument("--latency", type=float, default=0, help="Artificial server latency in seconds.")
+    parser.add_argument("--requests", type=int, default=500, help="Timed requests per operation.")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=100, help="Page size of get_users.")
+    parser.add_argument("--memory-requests", type=int, default=50, help="Requests of the memory pass.")
+    parser.add_argument("--only", nargs="*", choices=OPERATIONS, help="Operations to run. All by default.")
+    parser.add_argument("--output", help="Write JSON results to the file instead of stdout.")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with.")
+    options = parser.parse_args(args)
+
+    result = asyncio.run(run(
+        users=options.users,
+        links=options.links,
+        latency=options.latency,
+        requests=options.requests,
+        concurrency=options.concurrency,
+        page_size=options.page_size,
+        memory_requests=options.memory_requests,
+        only=options.only,
+    ))
+    if options.baseline:
+        with open(options.baseline) as f:
+            result["changes"] = compare(json.load(f), result)
+    text = json.dumps(result, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Import time benchmark with regression budgets.
+
+Run from the repository root:
+    python -m benchmarks.imports --runs 10 --output imports.json
+
+Every statement is run in a fresh interpreter; the reported time is the best run minus the best run
+of an empty interpreter (`python -c pass`). Exits with status 1 if a statement exceeds its budget
+or `import aiomarzban` imports heavy dependencies.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Optional, Dict, Any
+
+STATEMENTS = {
+    "package": "import aiomarzban",
+    "models": "from aiomarzban import UserResponse",
+    "client": "from aiomarzban import MarzbanAPI",
+}
+
+# Milliseconds over an empty interpreter. Generous enough for slow CI machines.
+BUDGETS_MS = {
+    "package": 15,
+    "models": 400,
+    "client": 1000,
+}
+
+# Modules which must not be imported by `import aiomarzban`
+HEAVY_MODULES = ("aiohttp", "pydantic", "aiomarzban.models", "aiomarzban.api")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _best_time(statement: str, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True, cwd=ROOT)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def heavy_modules_imported() -> list:
+    """
+    Return heavy modules imported by `import aiomarzban`.
+    """
+    code = f"import sys, aiomarzban; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=ROOT,
+    ).stdout.strip()
+    return output.split(",") if output else []
+
+
+def run(runs: int = 5, budgets: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Measure import times and return machine-readable results.
+    """
+    budgets = budgets or BUDGETS_MS
+    baseline = _best_time("pass", runs)
+    results = {}
+    for name, statement in STATEMENTS.items():
+        ms = round((_best_time(statement, runs) - baseline) * 1000, 2)
+        results[name] = {"statement": statement, "ms": ms, "budget_ms": budgets[name], "ok": ms <= budgets[name]}
+    heavy = heavy_modules_imported()
+    return {
+        "python": sys.version.split()[0],
+        "interpreter_ms": round(baseline * 1000, 2),
+        "results": results,
+        "heavy_modules": heavy,
+        "ok": not heavy and all(item["ok"] for item in results.values()),
+    }
+
+
+def main(args: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure aiomarzban import time against budgets.")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per statement, the best one is reported.")
+    parser.add_argument("--output", help="Write JSON results to the file instead of stdout.")
+    options = parser.parse_args(args)
+
+    result = run(runs=options.runs)
+    text = json.dumps(result, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if not result["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
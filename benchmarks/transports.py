@@ -0,0 +1,155 @@
+"""
+Transport backends benchmark: concurrent `get_user` calls over aiohttp and httpx (HTTP/1.1 and HTTP/2).
+
+Run from the repository root:
+    python -m benchmarks.transports --requests 2000 --concurrency 200 --pool-size 10
+    python -m benchmarks.transports --address https://panel.example.com/ --username admin --password secret --user john
+
+Without --address it runs against an in-process fake panel. It serves plain http, where httpx falls back
+to HTTP/1.1, so HTTP/2 multiplexing is only measured against a TLS endpoint (e.g. the panel behind its reverse proxy).
+httpx backends are skipped if httpx is not installed.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Optional, List, Dict, Any
+
+import aiohttp
+
+from aiomarzban import MarzbanAPI, AiohttpTransport, HttpxTransport, Transport
+from aiomarzban.testing import FakeMarzban
+from benchmarks.client import percentile, _run
+
+BACKENDS = ("aiohttp", "httpx", "httpx-http2")
+
+
+def make_transport(name: str, pool_size: int) -> Transport:
+    if name == "aiohttp":
+        return AiohttpTransport(connector=aiohttp.TCPConnector(limit=pool_size))
+    return HttpxTransport(http2=name == "httpx-http2", max_connections=pool_size)
+
+
+async def bench_backend(
+    name: str,
+    address: str,
+    username: str,
+    password: str,
+    usernames: List[str],
+    requests: int,
+    concurrency: int,
+    pool_size: int,
+) -> Dict[str, Any]:
+    try:
+        transport = make_transport(name, pool_size)
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    rnd = random.Random(0)
+    async with transport:
+        api = MarzbanAPI(address, username, password, transport=transport)
+        await api.refresh_credentials()
+
+        async def call(i: int):
+            return await api.get_user(rnd.choice(usernames))
+
+        # Warm up connections
+        await _run(call, concurrency, concurrency)
+        started = time.perf_counter()
+        latencies = await _run(call, requests, concurrency)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "pool_size": pool_size,
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+    }
+
+
+async def run(
+    address: Optional[str] = None,
+    username: str = "admin",
+    password: str = "admin",
+    usernames: Optional[List[str]] = None,
+    users: int = 100,
+    latency: float = 0,
+    requests: int = 1000,
+    concurrency: int = 100,
+    pool_size: int = 10,
+    backends: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Run benchmark for every backend and return machine-readable results.
+    """
+    panel = None
+    if address is None:
+        panel = FakeMarzban(admin_username=username, admin_password=password, latency=latency)
+        usernames = panel.seed_users(users)
+        address = await panel.start()
+    results = {}
+    try:
+        for name in backends or BACKENDS:
+            results[name] = await bench_backend(
+                name, address, username, password, usernames, requests, concurrency, pool_size,
+            )
+    finally:
+        if panel is not None:
+            await panel.close()
+
+    return {
+        "params": {
+            "address": "fake" if panel is not None else address,
+            "latency": latency,
+            "requests": requests,
+            "concurrency": concurrency,
+            "pool_size": pool_size,
+        },
+        "results": results,
+    }
+
+
+def main(args: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare aiomarzban transport backends.")
+    parser.add_argument("--address", help="Panel address. In-process fake panel by default.")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--user", action="append", help="Existing username to request (with --address).")
+    parser.add_argument("--users", type=int, default=100, help="Users on the fake panel.")
+    parser.add_argument("--latency", type=float, default=0, help="Artificial latency of the fake panel in seconds.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--pool-size", type=int, default=10, help="Maximum connections per backend.")
+    parser.add_argument("--only", nargs="*", choices=BACKENDS, help="Backends to run. All by default.")
+    parser.add_argument("--output", help="Write JSON results to the file instead of stdout.")
+    options = parser.parse_args(args)
+    if options.address and not options.user:
+        parser.error("--user is required with --address")
+
+    result = asyncio.run(run(
+        address=options.address,
+        username=options.username,
+        password=options.password,
+        usernames=options.user,
+        users=options.users,
+        latency=options.latency,
+        requests=options.requests,
+        concurrency=options.concurrency,
+        pool_size=options.pool_size,
+        backends=options.only,
+    ))
+    text = json.dumps(result, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
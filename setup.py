@@ -23,6 +23,12 @@ setup(
         'pydantic>=2.0',
         'datetime>=4.0',
     ],
+    extras_require={
+        'httpx': ['httpx[http2]>=0.23'],
+    },
+    entry_points={
+        'console_scripts': ['aiomarzban=aiomarzban.cli:main'],
+    },
     classifiers=[
     'Programming Language :: Python :: 3.10',
     'License :: OSI Approved :: MIT License',
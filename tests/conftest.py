@@ -1,4 +1,6 @@
 import asyncio
+import copy
+import json
 import os
 import time
 
@@ -6,8 +8,33 @@ import pytest
 from dotenv import load_dotenv
 
 from aiomarzban import MarzbanAPI
+from aiomarzban.testing import FakeMarzban
 from tests.final import delete_all_data, close_session
 
+load_dotenv()
+
+# Without MARZBAN_ADDRESS the suite runs against an in-memory fake panel
+LIVE_PANEL = bool(os.getenv("MARZBAN_ADDRESS"))
+
+
+def wait(seconds: float) -> None:
+    """
+    Give a live panel time to apply changes. No-op against the fake panel.
+    """
+    if LIVE_PANEL:
+        time.sleep(seconds)
+
+
+def fake_core_config() -> dict:
+    with open(os.path.join(os.path.dirname(__file__), "cfg.json")) as f:
+        config = json.load(f)
+    # Inbound of the hosts in hosts.json
+    inbound = copy.deepcopy(config["inbounds"][0])
+    inbound["tag"] = "VLESS host"
+    inbound["port"] = 2053
+    config["inbounds"].append(inbound)
+    return config
+
 
 @pytest.fixture(autouse=True, scope="function")
 def wait_after_test():
@@ -15,12 +42,21 @@ def wait_after_test():
     Timeout between requests to server.
     """
     yield
-    time.sleep(1)
+    wait(1)
 
 
 @pytest.fixture(scope="session")
 def get_api_client():
-    load_dotenv()
+    if not LIVE_PANEL:
+        panel = FakeMarzban(admin_username="marzban", admin_password="admin", core_config=fake_core_config())
+        client = MarzbanAPI(
+            address=panel.start_in_thread(),
+            username=panel.admin_username,
+            password=panel.admin_password,
+        )
+        yield client
+        panel.stop_thread()
+        return
 
     client = MarzbanAPI(
         address=os.getenv("MARZBAN_ADDRESS"),
@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from benchmarks import imports, transports
+from benchmarks.client import run, compare, OPERATIONS
+
+
+async def test_benchmark_results():
+    result = await run(users=20, links=2, requests=10, concurrency=2, page_size=5, memory_requests=2)
+    json.dumps(result)
+
+    assert result["params"]["users"] == 20
+    assert set(result["results"]) == set(OPERATIONS)
+    for item in result["results"].values():
+        assert item["requests"] == 10
+        assert item["rps"] > 0
+        assert item["p50_ms"] <= item["p99_ms"]
+        assert item["peak_memory_bytes"] > 0
+
+    changes = compare(result, result)
+    assert changes["get_user"]["rps"] == 0
+
+
+async def test_transports_benchmark_results():
+    result = await transports.run(users=10, requests=20, concurrency=5, pool_size=2)
+    json.dumps(result)
+
+    assert set(result["results"]) == set(transports.BACKENDS)
+    assert result["results"]["aiohttp"]["rps"] > 0
+    for item in result["results"].values():
+        assert "skipped" in item or item["p50_ms"] <= item["p99_ms"]
+
+
+def test_lazy_imports():
+    assert imports.heavy_modules_imported() == []
+
+
+# Wall-clock budgets depend on the machine, so they are only checked on request
+@pytest.mark.skipif(not os.getenv("AIOMARZBAN_IMPORT_BUDGET"), reason="set AIOMARZBAN_IMPORT_BUDGET=1 to check import times")
+def test_import_budget():
+    result = imports.run(runs=3)
+    assert set(result["results"]) == set(imports.STATEMENTS)
+    assert result["results"]["package"]["ok"], result
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from aiomarzban import MarzbanAPI, UserWriteBuffer
+from aiomarzban.testing import FakeMarzban
+from aiomarzban.utils import gb_to_bytes
+
+
+async def test_writes_are_merged():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        await api.add_user("john", data_limit=1)
+        requests = panel.requests
+
+        async with UserWriteBuffer(api, window=0.05) as buffer:
+            users = await asyncio.gather(
+                buffer.modify_user("john", status="disabled"),
+                buffer.modify_user("john", data_limit=5),
+                buffer.modify_user("john", note="first"),
+                buffer.modify_user("john", note="second"),
+            )
+        assert panel.requests == requests + 1
+        assert buffer.requests == 1 and buffer.merged == 3
+        assert all(user is users[0] for user in users)
+        assert users[0].status == "disabled"
+        assert users[0].data_limit == gb_to_bytes(5)
+        assert users[0].note == "second"
+
+        # Same values as the last known state are not sent
+        user = await buffer.modify_user("john", note="second", data_limit=5)
+        assert user is users[0]
+        assert panel.requests == requests + 1
+        assert buffer.dropped == 2
+
+        user = await buffer.modify_user("john", note="third", data_limit=5)
+        assert user.note == "third"
+        assert panel.requests == requests + 2
+
+
+async def test_flush_and_errors():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        await api.add_user("john")
+        buffer = UserWriteBuffer(api, window=60)
+
+        task = asyncio.create_task(buffer.modify_user("john", note="note"))
+        missing = asyncio.create_task(buffer.modify_user("unknown", note="note"))
+        await asyncio.sleep(0)
+        await buffer.flush("john")
+        assert (await task).note == "note"
+        assert not missing.done()
+
+        await buffer.close()
+        with pytest.raises(Exception, match="User not found"):
+            await missing
@@ -0,0 +1,89 @@
+import asyncio
+import base64
+
+from aiomarzban import SubscriptionCache
+from aiomarzban.cache import username_from_token, user_agent_class
+
+
+def make_token(username: str) -> str:
+    data = base64.b64encode(f"{username},1700000000".encode(), altchars=b"-_").decode().rstrip("=")
+    return data + "signature_"
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return f"config {self.calls}"
+
+
+def test_token_and_user_agent_parsing():
+    assert username_from_token(make_token("user_1")) == "user_1"
+    assert username_from_token("broken") is None
+    assert user_agent_class("ClashMetaForAndroid/2.8") == "clash-meta"
+    assert user_agent_class("clash-verge/v1.3.8") == "clash-meta"
+    assert user_agent_class("Stash/2.4") == "clash"
+    assert user_agent_class("SFA/1.8") == "sing-box"
+    assert user_agent_class("curl/8.0") == "default"
+
+
+async def test_coalescing_ttl_and_invalidation():
+    cache = SubscriptionCache(ttl=60)
+    token = make_token("user_1")
+    loader = Loader()
+
+    results = await asyncio.gather(*(cache.get(token, "", "v2rayNG/1.8", loader) for _ in range(10)))
+    assert results == ["config 1"] * 10
+    assert loader.calls == 1
+
+    assert await cache.get(token, "", "v2rayNG/1.9", loader) == "config 1"
+    assert await cache.get(token, "", "Stash/2.4", loader) == "config 2"
+
+    cache.invalidate_user("user_1")
+    assert len(cache) == 0
+    assert await cache.get(token, "", "v2rayNG/1.8", loader) == "config 3"
+
+
+async def test_stale_while_revalidate_and_lru():
+    cache = SubscriptionCache(ttl=0, stale_ttl=60, maxsize=2)
+    loader = Loader()
+    token = make_token("user_1")
+
+    assert await cache.get(token, "", "", loader) == "config 1"
+    assert await cache.get(token, "", "", loader) == "config 1"
+    await asyncio.sleep(0.05)
+    assert loader.calls == 2
+    assert await cache.get(token, "", "", loader) == "config 2"
+    assert cache.stale_hits == 2
+
+    await cache.get(make_token("user_2"), "", "", loader)
+    await cache.get(make_token("user_3"), "", "", loader)
+    assert len(cache) == 2
+
+
+async def test_cancelled_caller_and_clear():
+    cache = SubscriptionCache(ttl=60)
+    token = make_token("user_1")
+    loader = Loader()
+
+    leader = asyncio.create_task(cache.get(token, "", "", loader))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get(token, "", "", loader))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await waiter == "config 1"
+    assert leader.cancelled()
+    assert loader.calls == 1
+    assert len(cache) == 1
+
+    # Requests in progress during `clear` are not cached
+    cache.clear()
+    request = asyncio.create_task(cache.get(make_token("user_2"), "", "", loader))
+    await asyncio.sleep(0)
+    cache.clear()
+    assert await request == "config 2"
+    assert len(cache) == 0
+    assert await cache.get(make_token("user_2"), "", "", loader) == "config 3"
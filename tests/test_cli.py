@@ -0,0 +1,53 @@
+import gzip
+import json
+
+import pytest
+
+from aiomarzban import MarzbanAPI
+from aiomarzban.cli import export_users, import_users, main
+from aiomarzban.utils import future_unix_time
+from aiomarzban.testing import FakeMarzban
+
+
+async def test_export_import_round_trip(tmp_path):
+    path = str(tmp_path / "users.ndjson.gz")
+    async with FakeMarzban() as source, FakeMarzban() as target:
+        api = MarzbanAPI(source.address, "admin", "admin")
+        for i in range(25):
+            await api.add_user(f"user{i}", data_limit=i, expire=future_unix_time(days=i + 1), note=f"note {i}")
+        await api.modify_user("user3", status="disabled")
+        source.add_traffic("user1", 1024 ** 3, 0)
+        await api.add_user("held", status="on_hold", on_hold_expire_duration=3600)
+
+        pages = []
+        stats = await export_users(api, path, page_size=10, on_progress=pages.append)
+        assert stats.users == 26
+        assert len(pages) == 3
+        with gzip.open(path, "rt") as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 26
+        assert next(record for record in records if record["username"] == "held")["on_hold_expire_duration"] == 3600
+        await api.close()
+
+        api = MarzbanAPI(target.address, "admin", "admin")
+        await api.add_user("user0")
+        job = await import_users(api, path, concurrency=5)
+        assert job.progress.done == 25
+        assert list(job.errors) == ["user0"]
+
+        job = await import_users(api, path, concurrency=5, skip_existing=True)
+        assert job.progress.done == 26 and not job.errors
+        for username in ("user7", "user3", "held"):
+            old, new = source.users[username], target.users[username]
+            for field in ("expire", "data_limit", "note", "status", "proxies", "inbounds", "on_hold_expire_duration"):
+                assert old[field] == new[field], (username, field)
+        assert source.users["user1"]["status"] == "limited"
+        assert target.users["user1"]["status"] == "disabled"
+        await api.close()
+
+
+def test_main_requires_connection_options(monkeypatch):
+    monkeypatch.delenv("MARZBAN_ADDRESS", raising=False)
+    with pytest.raises(SystemExit) as e:
+        main(["--username", "admin", "--password", "admin", "export"])
+    assert e.value.code == 2
@@ -0,0 +1,59 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from aiomarzban import MarzbanAPI, MarzbanCluster
+
+system_stats = {
+    "version": "0.8.4", "mem_total": 100, "mem_used": 50, "cpu_cores": 2, "cpu_usage": 1.5, "total_user": 10,
+    "online_users": 1, "users_active": 5, "users_on_hold": 0, "users_disabled": 0, "users_expired": 0,
+    "users_limited": 0, "incoming_bandwidth": 100, "outgoing_bandwidth": 200, "incoming_bandwidth_speed": 0,
+}
+
+
+def create_panel(delay: float = 0) -> web.Application:
+    async def token(request):
+        return web.json_response({"access_token": "token", "token_type": "bearer"})
+
+    async def system(request):
+        await asyncio.sleep(delay)
+        return web.json_response(system_stats)
+
+    app = web.Application()
+    app.router.add_post("/api/admin/token", token)
+    app.router.add_get("/api/system", system)
+    return app
+
+
+async def test_cluster_fan_out_with_partial_failure():
+    fast, slow = TestServer(create_panel()), TestServer(create_panel(delay=5))
+    await fast.start_server()
+    await slow.start_server()
+
+    panels = {
+        "eu": MarzbanAPI(str(fast.make_url("/")), "admin", "admin"),
+        "us": MarzbanAPI(str(fast.make_url("/")), "admin", "admin"),
+        "asia": MarzbanAPI(str(slow.make_url("/")), "admin", "admin"),
+    }
+    try:
+        async with MarzbanCluster(panels, timeout=0.5) as cluster:
+            result = await cluster.get_system_stats()
+            assert panels["eu"].session is cluster.session
+    finally:
+        await fast.close()
+        await slow.close()
+
+    assert set(result.results) == {"eu", "us"}
+    assert isinstance(result.errors["asia"], asyncio.TimeoutError)
+    assert result.sum("total_user") == 20
+    assert not result.ok
+    assert panels["eu"].session is None
+    assert panels["eu"].detach_session() is None
+
+    async with aiohttp.ClientSession() as session:
+        panels["eu"].attach_session(session)
+        await panels["eu"].close()
+        assert not session.closed
+        assert panels["eu"].detach_session() is session
@@ -1,9 +1,8 @@
 import copy
 import json
 import os
-import time
 
-from tests.conftest import get_api_client
+from tests.conftest import get_api_client, wait
 
 file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "cfg.json"))
 with open(file_path) as f:
@@ -31,13 +30,13 @@ async def test_modify_core_config(get_api_client):
     assert panel_cfg != new_cfg, "Old and new core configs are the same."
 
     # Settings second config and comparing
-    time.sleep(0.5)
+    wait(0.5)
     await api_client.modify_core_config(new_cfg)
     current_cfg = await api_client.get_core_config()
     assert current_cfg == new_cfg, "The new config was not installed."
 
     # Returning old config
-    time.sleep(0.5)
+    wait(0.5)
     await api_client.modify_core_config(old_cfg)
 
 
@@ -0,0 +1,70 @@
+import asyncio
+import base64
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+
+from aiomarzban import MarzbanAPI, SubscriptionCache
+from aiomarzban.edge import SubscriptionEdge, TokenRateLimiter
+
+token = base64.b64encode(b"user_1,1700000000", altchars=b"-_").decode().rstrip("=") + "signature_"
+subscription_headers = {
+    "profile-update-interval": "12",
+    "subscription-userinfo": "upload=0; download=100; total=1000; expire=0",
+    "content-disposition": 'attachment; filename="user_1"',
+}
+
+
+def create_panel(calls: list) -> web.Application:
+    async def subscription(request):
+        calls.append(request.path)
+        await asyncio.sleep(0.05)
+        if request.match_info["token"] != token:
+            return web.json_response({"detail": "Not Found"}, status=404)
+        body = base64.b64encode(b"vless://uuid@example.com:443#user_1").decode()
+        return web.Response(text=body, headers=subscription_headers)
+
+    async def info(request):
+        calls.append(request.path)
+        return web.json_response({"username": "user_1"})
+
+    app = web.Application()
+    app.router.add_get("/sub/{token}", subscription)
+    app.router.add_get("/sub/{token}/info", info)
+    return app
+
+
+async def test_edge_caches_coalesces_and_limits():
+    calls = []
+    panel = TestServer(create_panel(calls))
+    await panel.start_server()
+    api = MarzbanAPI(str(panel.make_url("/")), "admin", "admin")
+    edge = SubscriptionEdge(api, SubscriptionCache(ttl=60), TokenRateLimiter(rate=0.001, burst=11))
+    client = TestClient(TestServer(edge.create_app()))
+    await client.start_server()
+
+    try:
+        responses = await asyncio.gather(*(client.get(f"/sub/{token}") for _ in range(10)))
+        assert calls == [f"/sub/{token}"]
+        for response in responses:
+            assert response.status == 200
+            assert response.headers["profile-update-interval"] == "12"
+            assert response.headers["subscription-userinfo"] == subscription_headers["subscription-userinfo"]
+            assert base64.b64decode(await response.read()).startswith(b"vless://")
+
+        response = await client.get(f"/sub/{token}/info")
+        assert (await response.json())["username"] == "user_1"
+
+        response = await client.get(f"/sub/{token}")
+        assert response.status == 429
+
+        response = await client.get("/sub/unknown_token_1234567")
+        assert response.status == 404
+
+        stats = (await (await client.get("/metrics")).json())
+        assert stats["upstream_requests"] == 3
+        assert stats["rate_limited"] == 1
+        assert stats["coalesced"] == 9
+    finally:
+        await client.close()
+        await panel.close()
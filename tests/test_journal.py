@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from aiomarzban import MarzbanAPI, BulkJob
+from aiomarzban.testing import FakeMarzban
+
+
+class Crash(BaseException):
+    pass
+
+
+async def test_job_resumes_after_crash(tmp_path):
+    journal = str(tmp_path / "job.journal")
+    usernames = [f"user{i}" for i in range(30)]
+
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+
+        async def crashing_add(username):
+            if username == "user20":
+                raise Crash
+            await api.add_user(username)
+
+        job = BulkJob(journal, concurrency=1, fsync_batch=5)
+        try:
+            await job.run(usernames, crashing_add)
+        except Crash:
+            pass
+        # Simulate a partially written line
+        with open(journal, "a") as f:
+            f.write('{"key": "us')
+        assert len(panel.users) == 20
+
+        async def add(username):
+            if username == "user25":
+                raise ValueError("bad user")
+            await api.add_user(username)
+
+        reports = []
+        job = BulkJob(journal, concurrency=4, progress_interval=0)
+        progress = await job.run(usernames, add, on_progress=reports.append)
+        assert progress.skipped == 20
+        assert progress.done == 9
+        assert progress.failed == 1
+        assert "user25" in job.errors
+        assert progress.rate > 0
+        assert reports and "29/30 done (20 skipped, 1 failed)" in str(reports[-1])
+        assert len(panel.users) == 29
+
+        # Failed items are retried, completed ones are skipped
+        progress = await BulkJob(journal).run(usernames, api.add_user)
+        assert (progress.skipped, progress.done, progress.failed) == (29, 1, 0)
+
+
+async def test_crash_stops_other_workers(tmp_path):
+    journal = str(tmp_path / "job.journal")
+    processed = []
+
+    async def crashing(item):
+        await asyncio.sleep(0.001)
+        if item == 5:
+            raise Crash
+        processed.append(item)
+
+    job = BulkJob(journal, concurrency=4)
+    with pytest.raises(Crash):
+        await job.run(range(40), crashing)
+    count = len(processed)
+    await asyncio.sleep(0.05)
+    assert len(processed) == count < 40
+
+    # Every processed item was journaled before the journal was closed
+    async def noop(item):
+        pass
+
+    progress = await BulkJob(journal).run(range(40), noop)
+    assert (progress.skipped, progress.done) == (count, 40 - count)
@@ -0,0 +1,137 @@
+import base64
+import json
+import os
+import random
+from urllib.parse import quote, urlencode
+
+import pytest
+
+from aiomarzban import LinkGenerator, ProxyHost, UserResponse
+from aiomarzban.links import x25519_public_key, readable_size, format_time_left
+
+with open(os.path.join(os.path.dirname(__file__), "links.json"), encoding="utf-8") as f:
+    FIXTURE = json.load(f)
+
+
+# Link builders of the panel's V2rayShareLink (Marzban 0.8.4, app/subscription/share.py), reduced to the
+# transports of the fixture. They don't share code with LinkGenerator, so the expected links are checked
+# against the panel's encoding instead of against the generator itself.
+def panel_vless_trojan(scheme, credential, remark, address, port, net="tcp", path="", host="", type="", flow="",
+                       tls="none", sni="", fp="", alpn="", pbk="", sid="", ais=False):
+    payload = {"security": tls, "type": net, "headerType": type}
+    if flow and tls in ("tls", "reality") and net in ("tcp", "kcp") and type != "http":
+        payload["flow"] = flow
+    if net == "grpc":
+        payload["serviceName"] = path
+        payload["authority"] = host
+        payload["mode"] = "gun"
+    else:
+        payload["path"] = path
+        payload["host"] = host
+    if tls == "tls":
+        payload["sni"] = sni
+        payload["fp"] = fp
+        if alpn:
+            payload["alpn"] = alpn
+        if ais:
+            payload["allowInsecure"] = 1
+    elif tls == "reality":
+        payload["sni"] = sni
+        payload["fp"] = fp
+        payload["pbk"] = pbk
+        payload["sid"] = sid
+    return f"{scheme}://{credential}@{address}:{port}?{urlencode(payload)}#{quote(remark)}"
+
+
+def panel_vmess(remark, address, port, id, net="tcp", path="", host="", type="", tls="none", sni="", fp="",
+                alpn=""):
+    payload = {
+        "add": address, "aid": "0", "host": host, "id": id, "net": net, "path": path, "port": port,
+        "ps": remark, "scy": "auto", "tls": tls, "type": type, "v": "2",
+    }
+    if tls == "tls":
+        payload["sni"] = sni
+        payload["fp"] = fp
+        if alpn:
+            payload["alpn"] = alpn
+    return "vmess://" + base64.b64encode(json.dumps(payload, sort_keys=True).encode()).decode()
+
+
+def panel_shadowsocks(remark, address, port, password, method):
+    return "ss://" + base64.b64encode(f"{method}:{password}".encode()).decode() + f"@{address}:{port}#{quote(remark)}"
+
+
+def test_fixture_links_follow_panel_encoding():
+    user = FIXTURE["user"]
+    proxies = user["proxies"]
+    reality = FIXTURE["core_config"]["inbounds"][0]["streamSettings"]["realitySettings"]
+    # Host settings of the fixture resolved by hand: remark variables, inbound ports and transports
+    assert FIXTURE["links"] == [
+        panel_vless_trojan(
+            "vless", proxies["vless"]["id"], "🚀 links_user [vless - tcp]", "8.8.8.8", 11111,
+            flow="xtls-rprx-vision", tls="reality", sni="www.google.com", fp="chrome",
+            pbk=x25519_public_key(reality["privateKey"]), sid="",
+        ),
+        panel_vmess(
+            "✅ 4.0 GB left", "vmess.example.com", 443, proxies["vmess"]["id"], net="ws", path="/vmess",
+            host="vmess.example.com", tls="tls", sni="vmess.example.com", fp="chrome", alpn="h2,http/1.1",
+        ),
+        panel_vless_trojan(
+            "trojan", proxies["trojan"]["password"], "Trojan {UNKNOWN}", "trojan.example.com", 2053, net="grpc",
+            path="trojan", tls="tls", sni="trojan.example.com", ais=True,
+        ),
+        panel_shadowsocks(
+            "SS", "ss.example.com", 8388, proxies["shadowsocks"]["password"], proxies["shadowsocks"]["method"],
+        ),
+    ]
+
+
+@pytest.fixture
+def generator():
+    return LinkGenerator(FIXTURE["core_config"], FIXTURE["hosts"], rng=random.Random(0))
+
+
+@pytest.fixture
+def user():
+    return UserResponse(**FIXTURE["user"])
+
+
+def test_links_match_panel(generator, user):
+    assert generator.links(user) == FIXTURE["links"]
+
+
+def test_subscription(generator, user):
+    content = generator.subscription_content(user)
+    assert base64.b64decode(content.body).decode() == "\n".join(FIXTURE["links"])
+    assert content.headers["subscription-userinfo"] == "upload=0; download=1073741824; total=5368709120; expire=0"
+    assert content.headers["content-disposition"] == 'attachment; filename="links_user"'
+
+
+def test_proxy_host_models(user):
+    hosts = {
+        tag: [ProxyHost(**{**host, "allow_insecure": host.get("allowinsecure")}) for host in tag_hosts]
+        for tag, tag_hosts in FIXTURE["hosts"].items()
+    }
+    generator = LinkGenerator(FIXTURE["core_config"], hosts, rng=random.Random(0))
+    assert generator.links(user) == FIXTURE["links"]
+
+
+def test_excluded_inbound(generator, user):
+    user.inbounds = {"vless": ["VLESS TCP REALITY google"]}
+    assert generator.links(user) == FIXTURE["links"][:1]
+
+
+def test_x25519_public_key():
+    # RFC 7748, section 6.1
+    private_key = bytes.fromhex("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a")
+    public_key = x25519_public_key(base64.urlsafe_b64encode(private_key).decode().rstrip("="))
+    assert base64.urlsafe_b64decode(public_key + "=").hex() == \
+        "8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a"
+
+
+def test_formatting():
+    assert readable_size(0) == "0 B"
+    assert readable_size(1536) == "1.5 KB"
+    assert format_time_left(None) == "∞"
+    assert format_time_left(90061) == "1d 1h"
+    assert format_time_left(61) == "1m 1s"
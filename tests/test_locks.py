@@ -0,0 +1,44 @@
+import asyncio
+
+from aiomarzban import MarzbanAPI
+from aiomarzban.locks import KeyedLock
+from aiomarzban.testing import FakeMarzban
+from aiomarzban.utils import future_unix_time, unix_time_delta
+
+
+async def test_keyed_lock_serialises_per_key():
+    locks = KeyedLock(max_keys=2)
+    events = []
+
+    async def work(key, i):
+        async with locks(key):
+            events.append(("start", key, i))
+            await asyncio.sleep(0.01)
+            events.append(("end", key, i))
+
+    await asyncio.gather(work("a", 1), work("a", 2), work("b", 3), work("c", 4))
+    for key in "abc":
+        key_events = [event for event in events if event[1] == key]
+        for start, end in zip(key_events[::2], key_events[1::2]):
+            assert start[0] == "start" and end[0] == "end" and start[2] == end[2]
+    # "b" ran in parallel with "a", "c" waited for a free slot
+    assert events.index(("start", "b", 3)) < events.index(("end", "a", 1))
+    assert events.index(("start", "c", 4)) > events.index(("end", "b", 3))
+    # Locks are dropped when released
+    assert len(locks) == 0
+
+
+async def test_concurrent_renewals_are_not_lost():
+    async with FakeMarzban(latency=0.002) as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        expire = future_unix_time(days=1)
+        await api.add_user("john", expire=expire)
+        await api.add_user("jane", expire=expire)
+
+        await asyncio.gather(*(api.user_add_days(name, 1) for name in ["john", "jane"] * 5))
+        assert (await api.get_user("john")).expire == expire + unix_time_delta(days=5)
+        assert (await api.get_user("jane")).expire == expire + unix_time_delta(days=5)
+
+        user = await api.update_user("john", lambda user: {"note": f"{user.username} renewed"})
+        assert user.note == "john renewed"
+        assert len(api.user_locks) == 0
@@ -0,0 +1,72 @@
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from aiomarzban import MarzbanAPI, MarzbanNotFoundException, MetricsRegistry
+from aiomarzban.metrics import route_template
+
+user = {
+    "proxies": {"vless": {}}, "inbounds": {"vless": ["VLESS TCP"]}, "username": "alice", "status": "active",
+    "used_traffic": 0, "created_at": "2025-01-01T00:00:00",
+}
+
+
+def create_panel() -> web.Application:
+    tokens = []
+
+    async def token(request):
+        tokens.append(1)
+        return web.json_response({"access_token": f"token{len(tokens)}", "token_type": "bearer"})
+
+    async def get_user(request):
+        if request.headers["Authorization"] == "Bearer token1":
+            return web.json_response({"detail": "Could not validate credentials"}, status=401)
+        if request.match_info["username"] != "alice":
+            return web.json_response({"detail": "User not found"}, status=404)
+        return web.json_response(user)
+
+    app = web.Application()
+    app.router.add_post("/api/admin/token", token)
+    app.router.add_get("/api/user/{username}", get_user)
+    return app
+
+
+def test_route_template():
+    assert route_template("/user/alice") == "/user/{username}"
+    assert route_template("/user/alice/revoke_sub") == "/user/{username}/revoke_sub"
+    assert route_template("/users/usage") == "/users/usage"
+    assert route_template("/node/settings") == "/node/settings"
+    assert route_template("/node/3/reconnect") == "/node/{node_id}/reconnect"
+    assert route_template("/admin/usage/reset/bob") == "/admin/usage/reset/{username}"
+    assert route_template("/sub/dG9rZW4/info", "sub") == "/sub/{token}/info"
+    assert route_template("/sub/dG9rZW4/clash-meta", "sub") == "/sub/{token}/{client_type}"
+    assert route_template("/unknown/path") == "{unmatched}"
+
+
+async def test_request_metrics():
+    server = TestServer(create_panel())
+    await server.start_server()
+    metrics = MetricsRegistry()
+    api = MarzbanAPI(str(server.make_url("/")), "admin", "admin", metrics=metrics)
+    try:
+        assert (await api.get_user("alice")).username == "alice"
+        try:
+            await api.get_user("bob")
+        except MarzbanNotFoundException:
+            pass
+    finally:
+        await server.close()
+
+    routes = {(item.method, item.route): item for item in metrics.routes()}
+    get_user = routes[("GET", "/user/{username}")]
+    assert get_user.statuses == {"401": 1, "200": 1, "404": 1}
+    assert get_user.retries == {"unauthorized": 1}
+    assert get_user.buckets["+Inf"] == get_user.requests == 3
+    assert get_user.bytes_received > 0
+    assert routes[("POST", "/admin/token")].bytes_sent == 2 * len("username=admin&password=admin&scope=")
+    assert metrics.token_refreshes == 2
+
+    text = metrics.to_prometheus()
+    assert 'marzban_client_requests_total{method="GET",route="/user/{username}",status="404"} 1' in text
+    assert 'marzban_client_request_duration_seconds_count{method="GET",route="/user/{username}"} 3' in text
+    assert "# TYPE marzban_client_request_duration_seconds histogram" in text
+    assert "marzban_client_token_refreshes_total 2" in text
@@ -0,0 +1,80 @@
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from aiomarzban import MarzbanAPI, MarzbanNotFoundException, Middleware, Request, Response
+
+system_stats = {
+    "version": "0.8.4", "mem_total": 100, "mem_used": 50, "cpu_cores": 2, "cpu_usage": 1.5, "total_user": 10,
+    "online_users": 1, "users_active": 5, "users_on_hold": 0, "users_disabled": 0, "users_expired": 0,
+    "users_limited": 0, "incoming_bandwidth": 100, "outgoing_bandwidth": 200, "incoming_bandwidth_speed": 0,
+}
+
+
+def create_panel(seen: list) -> web.Application:
+    async def token(request):
+        return web.json_response({"access_token": "token", "token_type": "bearer"})
+
+    async def system(request):
+        seen.append(request.headers.get("X-Request-Id"))
+        return web.json_response(system_stats)
+
+    app = web.Application()
+    app.router.add_post("/api/admin/token", token)
+    app.router.add_get("/api/system", system)
+    return app
+
+
+class Recorder(Middleware):
+    def __init__(self, name: str, log: list):
+        self.name = name
+        self.log = log
+
+    async def before_request(self, request: Request):
+        self.log.append(f"{self.name}>{request.route}")
+        request.headers["X-Request-Id"] = self.name
+
+    async def after_response(self, request: Request, response: Response) -> Response:
+        self.log.append(f"{self.name}<{response.status}")
+        return response
+
+
+class FaultInjection(Middleware):
+    async def before_request(self, request: Request):
+        if request.route == "/user/{username}":
+            return Response(404, body=b'{"detail": "User not found"}')
+
+
+class Fallback(Middleware):
+    async def on_error(self, request: Request, error: Exception):
+        return Response(200, {"content-type": "application/json"}, json.dumps(system_stats).encode())
+
+
+async def test_middleware_order_and_headers():
+    seen, log = [], []
+    server = TestServer(create_panel(seen))
+    await server.start_server()
+    api = MarzbanAPI(str(server.make_url("/")), "admin", "admin", middlewares=[Recorder("outer", log)])
+    api.add_middleware(Recorder("inner", log))
+    try:
+        stats = await api.get_system_stats()
+    finally:
+        await server.close()
+
+    assert stats.total_user == 10
+    assert seen == ["inner"]
+    assert log[-4:] == ["outer>/system", "inner>/system", "inner<200", "outer<200"]
+
+
+async def test_short_circuit_and_on_error():
+    api = MarzbanAPI("http://127.0.0.1:9/", "admin", "admin", retries=0, middlewares=[FaultInjection()])
+    api.headers = {"Authorization": "Bearer token"}
+    try:
+        await api.get_user("alice")
+        assert False, "MarzbanNotFoundException expected"
+    except MarzbanNotFoundException:
+        pass
+
+    api.add_middleware(Fallback())
+    assert (await api.get_system_stats()).total_user == 10
@@ -0,0 +1,57 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from aiomarzban import MarzbanAPI, Profiler
+from aiomarzban.profiling import PHASES
+
+user = {
+    "proxies": {"vless": {}}, "inbounds": {"vless": ["VLESS TCP"]}, "username": "alice", "status": "active",
+    "used_traffic": 0, "created_at": "2025-01-01T00:00:00",
+}
+
+
+def create_panel() -> web.Application:
+    async def token(request):
+        return web.json_response({"access_token": "token", "token_type": "bearer"})
+
+    async def get_users(request):
+        await asyncio.sleep(0.05)
+        return web.json_response({"users": [user] * 200, "total": 200})
+
+    app = web.Application()
+    app.router.add_post("/api/admin/token", token)
+    app.router.add_get("/api/users", get_users)
+    return app
+
+
+async def test_profiler_phases(tmp_path):
+    server = TestServer(create_panel())
+    await server.start_server()
+    profiler = Profiler()
+    api = MarzbanAPI(str(server.make_url("/")), "admin", "admin", profiler=profiler)
+    try:
+        users = await api.get_users()
+    finally:
+        await server.close()
+
+    assert users.total == 200
+    phases = {(item.endpoint, item.phase): item for item in profiler.summary()}
+    assert phases[("get_users", "ttfb")].seconds >= 0.05
+    assert phases[("get_users", "connect")].count == 1
+    assert phases[("get_users", "validation")].seconds > 0
+    assert ("get_users", "decode") in phases
+    # Token refresh is attributed to the call which triggered it
+    assert ("refresh_credentials", "ttfb") in phases
+
+    collapsed = profiler.collapsed()
+    assert "get_users;GET /users;ttfb " in collapsed
+    assert "get_users;refresh_credentials;POST /admin/token;ttfb " in collapsed
+    path = tmp_path / "profile.folded"
+    profiler.dump_collapsed(str(path))
+    assert path.read_text() == collapsed
+
+    table = profiler.format_summary()
+    assert table.splitlines()[0].split()[1:-1] == list(PHASES)
+    assert table.splitlines()[1].startswith("get_users")
@@ -0,0 +1,72 @@
+from aiomarzban import MarzbanAPI, Reconciler, UserSpec
+from aiomarzban.reconcile import diff_user
+from aiomarzban.testing import FakeMarzban
+from aiomarzban.utils import future_unix_time
+
+
+async def test_reconcile_minimal_plan():
+    expire = future_unix_time(days=30)
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        for i in range(20):
+            await api.add_user(f"user{i}", expire=expire, data_limit=10, note="keep")
+        await api.add_user("stale")
+
+        specs = [UserSpec(username=f"user{i}", expire=expire, data_limit=10) for i in range(20)]
+        specs[3] = UserSpec(username="user3", expire=expire, data_limit=20)
+        specs[4] = UserSpec(username="user4", expire=expire, data_limit=10, status="disabled")
+        specs.append(UserSpec(username="new", data_limit=5, status="disabled"))
+
+        reconciler = Reconciler(api, concurrency=4, page_size=10, remove_missing=True)
+        plan = await reconciler.reconcile(specs, dry_run=True)
+        assert plan.format() == "add 1, modify 2, remove 1, unchanged 18"
+        assert {op.username: op.changes for op in plan.operations if op.action == "modify"} == {
+            "user3": {"data_limit": 20 * 1024 ** 3},
+            "user4": {"status": "disabled"},
+        }
+        assert "stale" in panel.users
+
+        requests = panel.requests
+        plan = await reconciler.apply(plan)
+        assert plan.applied == 4 and not plan.errors
+        # add + status of the new user, two modifications, one removal
+        assert panel.requests - requests == 5
+        assert "stale" not in panel.users
+        assert panel.users["new"]["status"] == "disabled"
+        assert panel.users["user3"]["data_limit"] == 20 * 1024 ** 3
+        assert panel.users["user3"]["note"] == "keep"
+
+        plan = await Reconciler(api).reconcile(specs)
+        assert plan.operations == [] and plan.unchanged == 21
+        await api.close()
+
+
+def test_diff_user_statuses_and_inbounds():
+    class User:
+        status = "expired"
+        data_limit = 0
+        inbounds = {"vless": ["b", "a"]}
+
+    assert diff_user(UserSpec(username="u", status="active", data_limit=None), User()) == {}
+    assert diff_user(UserSpec(username="u", inbounds={"vless": ["a", "b"]}), User()) == {}
+    assert diff_user(UserSpec(username="u", status="disabled"), User()) == {"status": "disabled"}
+    assert diff_user(UserSpec(username="u", inbounds={"vless": ["a"]}), User()) == {"inbounds": {"vless": ["a"]}}
+
+
+async def test_reconcile_converges():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        specs = [
+            UserSpec(username="held", status="on_hold", on_hold_expire_duration=86400, data_limit=5),
+            UserSpec(username="plain", expire=future_unix_time(days=3), note="billing"),
+            UserSpec(username="unlimited", data_limit=None, expire=None),
+        ]
+        await api.add_user("unlimited", data_limit=10, expire=future_unix_time(days=3))
+        plan = await Reconciler(api).reconcile(specs)
+        assert plan.applied == 3 and not plan.errors
+        assert panel.users["held"]["on_hold_expire_duration"] == 86400
+        assert not panel.users["unlimited"]["data_limit"] and not panel.users["unlimited"]["expire"]
+
+        plan = await Reconciler(api).reconcile(specs, dry_run=True)
+        assert plan.operations == [] and plan.unchanged == 3
+        await api.close()
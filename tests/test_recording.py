@@ -0,0 +1,71 @@
+from aiomarzban import MarzbanAPI, RecordingMiddleware, replay
+from aiomarzban.recording import load_recording
+from aiomarzban.testing import FakeMarzban
+
+
+async def test_record_and_replay(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = RecordingMiddleware(path)
+
+    async with FakeMarzban() as production:
+        api = MarzbanAPI(production.address, "admin", "admin", middlewares=[recorder])
+        user = await api.add_user("john", data_limit=1)
+        await api.get_user("john")
+        await api.get_users(limit=10)
+        await api.user_subscription_info(user.subscription_url.rsplit("/", 1)[-1])
+        try:
+            await api.get_user("unknown")
+        except Exception:
+            pass
+        recorder.close()
+
+    records = load_recording(path)
+    assert [(record["method"], record["route"], record["status"]) for record in records] == [
+        ("POST", "/admin/token", 200),
+        ("POST", "/user", 200),
+        ("GET", "/user/{username}", 200),
+        ("GET", "/users", 200),
+        ("GET", "/sub/{token}/info", 200),
+        ("GET", "/user/{username}", 404),
+    ]
+    assert records[0]["data"]["password"] == "***"
+    assert records[3]["params"] == {"limit": 10}
+
+    async with FakeMarzban() as local:
+        api = MarzbanAPI(local.address, "admin", "admin")
+        report = await replay(api, path, speed=None, concurrency=1)
+        assert report.requests == 5
+        assert "john" in local.users
+        routes = {(item.method, item.route): item for item in report.routes}
+        assert routes[("GET", "/user/{username}")].count == 2
+        assert routes[("GET", "/user/{username}")].status_mismatches == 0
+        # The replayed panel issued its own subscription token
+        assert routes[("GET", "/sub/{token}/info")].status_mismatches == 1
+        assert "/users" in report.format()
+
+
+async def test_recording_redacts_credentials(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    recorder = RecordingMiddleware(str(path), response_body=True, buffer_size=2)
+    secrets = ["S3cretPass!", "N3wPass!", "trojan-Pass-1", "0ed8b6a1-b8c4-4b7b-9b5e-6a1b0d4c9f3e"]
+
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin", middlewares=[recorder])
+        await api.create_admin("bob", secrets[0], is_sudo=False)
+        await api.modify_admin("bob", is_sudo=False, password=secrets[1])
+        user = await api.add_user("john", proxies={"trojan": {"password": secrets[2]}, "vless": {"id": secrets[3]}})
+        token = user.subscription_url.rsplit("/", 1)[-1]
+        await api.user_subscription_info(token)
+        await api.user_subscription_info(token)
+        secrets.append(token)
+        secrets.append(api.headers["Authorization"].split()[-1])
+        recorder.close()
+
+    text = path.read_text()
+    assert text.count("\n") == 6
+    for secret in secrets:
+        assert secret not in text
+    records = load_recording(str(path))
+    assert records[3]["json"]["proxies"] == {"trojan": {}, "vless": {}}
+    assert records[4]["route"] == "/sub/{token}/info"
+    assert records[4]["path"] == records[5]["path"] != records[4]["route"]
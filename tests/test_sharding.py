@@ -0,0 +1,160 @@
+import asyncio
+
+from aiomarzban import HashRing, MarzbanAPI, ShardedMarzbanAPI, UserResponse, UsersResponse, UserStatus
+from aiomarzban.exceptions import MarzbanException, MarzbanNotFoundException
+from aiomarzban.testing import FakeMarzban
+from aiomarzban.utils import future_unix_time
+
+usernames = [f"user_{i}" for i in range(2000)]
+
+
+class Panel:
+    def __init__(self):
+        self.users = {}
+
+    async def get_users(self, offset=0, limit=None):
+        users = list(self.users.values())
+        return UsersResponse(users=users[offset:offset + limit], total=len(users))
+
+    async def get_user(self, username):
+        if username not in self.users:
+            raise MarzbanNotFoundException(username)
+        return self.users[username]
+
+    async def add_user(self, username, **kwargs):
+        self.users[username] = UserResponse(
+            username=username, proxies={}, status=UserStatus.active, used_traffic=0, created_at="", **kwargs,
+        )
+        return self.users[username]
+
+    async def _add_user(self, data):
+        return await self.add_user(data.username, expire=data.expire, data_limit=data.data_limit)
+
+    async def remove_user(self, username):
+        del self.users[username]
+
+
+def test_hash_ring_moves_only_affected_keys():
+    ring = HashRing(["eu", "us", "asia"])
+    owners = {username: ring.get(username) for username in usernames}
+    assert all(600 < list(owners.values()).count(panel) < 730 for panel in ring.nodes)
+
+    ring.add("africa")
+    moved = [username for username in usernames if ring.get(username) != owners[username]]
+    assert all(ring.get(username) == "africa" for username in moved)
+    assert 400 < len(moved) < 600
+
+
+async def test_routing_and_rebalance():
+    panels = {"eu": Panel(), "us": Panel()}
+    sharded = ShardedMarzbanAPI(panels)
+    for username in usernames[:200]:
+        await sharded.add_user(username, expire=100, data_limit=1024)
+    assert len(panels["eu"].users) + len(panels["us"].users) == 200
+
+    user = await sharded.get_user("user_7")
+    assert user.username == "user_7"
+
+    new_panel = Panel()
+    planned = await sharded.add_panel("asia", new_panel, dry_run=True)
+    assert "asia" not in sharded.panels
+
+    moves = await sharded.add_panel("asia", new_panel, page_size=30)
+    assert [move.username for move in moves] == [move.username for move in planned]
+    assert all(move.error is None and move.target == "asia" for move in moves)
+    assert set(new_panel.users) == {move.username for move in moves}
+    assert new_panel.users[moves[0].username].data_limit == 1024
+    assert len(panels["eu"].users) + len(panels["us"].users) + len(new_panel.users) == 200
+
+    for username in usernames[:200]:
+        assert (await sharded.get_user(username)).username == username
+
+
+async def test_moves_keep_users_and_failed_moves_stay_routed():
+    async with FakeMarzban() as eu, FakeMarzban() as asia:
+        for panel in (eu, asia):
+            panel.add_admin("reseller", "secret")
+        eu.add_admin("eu_only", "secret")
+        eu_api = MarzbanAPI(eu.address, "admin", "admin")
+        asia_api = MarzbanAPI(asia.address, "admin", "admin")
+        sharded = ShardedMarzbanAPI({"eu": eu_api})
+        ring = HashRing(["eu", "asia"])
+        moving = [username for username in usernames if ring.get(username) == "asia"][:6]
+        held, limited, expired, owned, failing, orphan = moving
+
+        await sharded.add_user(held, status="on_hold", on_hold_expire_duration=3600)
+        await sharded.add_user(limited, data_limit=1)
+        eu.add_traffic(limited, 1024 ** 3, 0)
+        await sharded.add_user(expired, expire=future_unix_time(days=-1))
+        await sharded.add_user(owned)
+        await eu_api.set_owner(owned, "reseller")
+        await sharded.add_user(failing, note="stays")
+        # Owner doesn't exist on the new panel: the copy is rolled back
+        await sharded.add_user(orphan)
+        await eu_api.set_owner(orphan, "eu_only")
+        asia_api_add = asia_api._add_user
+
+        async def add_user(data):
+            if data.username == failing:
+                raise MarzbanException("target is full")
+            return await asia_api_add(data)
+
+        asia_api._add_user = add_user
+        moves = await sharded.add_panel("asia", asia_api)
+        assert {move.username for move in moves if move.error} == {failing, orphan}
+        assert sharded.pinned == {failing: "eu", orphan: "eu"}
+        assert (await sharded.get_user(failing)).note == "stays"
+        assert orphan not in asia.users
+
+        assert asia.users[held]["status"] == "on_hold"
+        assert asia.users[held]["on_hold_expire_duration"] == 3600
+        assert (await sharded.get_user(limited)).status == "disabled"
+        assert (await sharded.get_user(expired)).status == "expired"
+        assert (await sharded.get_user(owned)).admin.username == "reseller"
+        assert set(eu.users) == {failing, orphan}
+        await eu_api.close()
+        await asia_api.close()
+
+
+class SlowPanel(Panel):
+    def __init__(self):
+        super().__init__()
+        self.adding = asyncio.Event()
+        self.adding.set()
+
+    async def get_users(self, offset=0, limit=None):
+        await asyncio.sleep(0.01)
+        return await super().get_users(offset, limit)
+
+    async def add_user(self, username, **kwargs):
+        await self.adding.wait()
+        return await super().add_user(username, **kwargs)
+
+
+async def test_users_created_during_rebalance_stay_routed():
+    eu, asia = SlowPanel(), Panel()
+    sharded = ShardedMarzbanAPI({"eu": eu})
+    ring = HashRing(["eu", "asia"])
+    during_plan, during_moves = [username for username in usernames if ring.get(username) == "asia"][:2]
+
+    # Created while the panels are listed: moved with the others
+    rebalance = asyncio.create_task(sharded.add_panel("asia", asia))
+    await asyncio.sleep(0)
+    await sharded.add_user(during_plan)
+    moves = await rebalance
+    assert [move.username for move in moves] == [during_plan]
+    assert during_plan in asia.users
+
+    # Created on the old owner, finished after the ring changed: pinned to the panel which has it
+    sharded = ShardedMarzbanAPI({"eu": eu})
+    eu.adding.clear()
+    creation = asyncio.create_task(sharded.add_user(during_moves))
+    await asyncio.sleep(0)
+    await sharded.add_panel("asia", Panel())
+    eu.adding.set()
+    await creation
+    assert sharded.pinned == {during_moves: "eu"}
+    assert (await sharded.get_user(during_moves)).username == during_moves
+
+    restored = ShardedMarzbanAPI({"eu": eu, "asia": asia}, pinned=sharded.pinned)
+    assert restored.panel_for(during_moves) == "eu"
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from aiomarzban import MarzbanAPI, Snapshot, SnapshotWriter, take_snapshot
+from aiomarzban.snapshot import INT_NONE
+from aiomarzban.testing import FakeMarzban
+from aiomarzban.utils import future_unix_time
+
+
+async def test_snapshot_of_panel_state(tmp_path):
+    path = str(tmp_path / "panel.snapshot")
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        for i in range(12):
+            await api.add_user(f"user{i}", data_limit=i or None, expire=future_unix_time(days=1), note="note")
+        await api.modify_user("user5", status="disabled")
+        panel.add_traffic("user3", 100, 200)
+        await api.add_user_template(name="monthly", data_limit=30, expire_duration=30)
+        await api.add_node(name="node", address="1.2.3.4")
+
+        size = await take_snapshot(api, path, page_size=5)
+        hosts = await api.get_hosts()
+        inbounds = await api.get_inbounds()
+        await api.close()
+
+    with Snapshot(path) as snapshot:
+        users = snapshot.users
+        assert len(users) == 12
+        assert snapshot.string(users.column("username")[3]) == "user3"
+        assert users.values("username") == [f"user{i}" for i in range(12)]
+        assert sum(users.column("used_traffic")) == 300
+        assert users.column("data_limit")[0] == INT_NONE
+        assert users.values("data_limit")[:2] == [None, 1024 ** 3]
+        assert users.values("admin.username") == ["admin"] * 12
+
+        user = users[5]
+        assert user.status == "disabled"
+        assert user.note == "note"
+        assert user.links
+        assert user.model().username == "user5"
+        assert users[-1].username == "user11"
+        with pytest.raises(IndexError):
+            users[12]
+
+        assert [template.name for template in snapshot.templates] == ["monthly"]
+        assert snapshot.nodes[0].address == "1.2.3.4"
+        assert len(snapshot.hosts) == sum(len(items) for items in hosts.values())
+        assert set(snapshot.hosts.values("inbound_tag")) == set(hosts)
+        assert snapshot.inbounds.values("tag") == [inbound["tag"] for items in inbounds.values() for inbound in items]
+    assert size > 0
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text("[]")
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+
+def test_snapshot_replaces_file_atomically(tmp_path):
+    path = str(tmp_path / "panel.snapshot")
+    writer = SnapshotWriter()
+    writer.add("nodes", {"id": 1, "name": "old", "address": "1.1.1.1", "usage_coefficient": 1.5})
+    writer.write(path)
+    with Snapshot(path) as old:
+        writer = SnapshotWriter()
+        writer.add("nodes", {"id": 2, "name": "new", "address": "2.2.2.2"})
+        writer.write(path)
+        assert old.nodes.values("name") == ["old"]
+        assert old.nodes.values("usage_coefficient") == [1.5]
+    with Snapshot(path) as new:
+        assert new.nodes.values("name") == ["new"]
+        assert new.nodes.values("usage_coefficient") == [None]
+
+
+async def test_snapshot_is_smaller_than_json(tmp_path):
+    path = str(tmp_path / "panel.snapshot")
+    async with FakeMarzban(links_per_user=2) as panel:
+        panel.seed_users(200)
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        size = await take_snapshot(api, path)
+        page = await api.get_users()
+        await api.close()
+
+    assert size < len(json.dumps(page.model_dump(mode="json"), separators=(",", ":")))
+    with Snapshot(path) as snapshot:
+        # Records don't repeat column values but are restored in full
+        assert [snapshot.users.model(i) for i in range(len(snapshot.users))] == page.users
@@ -0,0 +1,98 @@
+import asyncio
+import base64
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from aiomarzban import MarzbanAPI, SubscriptionContent
+
+token = "dXNlcl8xLDE3MDAwMDAwMDAsignature_"
+links = "\n".join(f"vless://uuid@host{i}.example.com:443#host{i}" for i in range(2000))
+headers = {"profile-update-interval": "12", "subscription-userinfo": "upload=0; download=0; total=0; expire=0"}
+
+
+def create_panel() -> web.Application:
+    async def subscription(request):
+        return web.Response(text=base64.b64encode(links.encode()).decode(), headers=headers)
+
+    async def client_type(request):
+        if request.match_info["client_type"] == "sing-box":
+            return web.json_response({"outbounds": []}, headers=headers)
+        return web.Response(text="proxies: []\n", content_type="text/yaml", headers=headers)
+
+    app = web.Application()
+    app.router.add_get("/sub/{token}", subscription)
+    app.router.add_get("/sub/{token}/{client_type}", client_type)
+    return app
+
+
+class Writer:
+    def __init__(self):
+        self.chunks = []
+
+    async def write(self, data: bytes):
+        self.chunks.append(data)
+
+
+async def test_decoded_and_raw_subscription():
+    panel = TestServer(create_panel())
+    await panel.start_server()
+    api = MarzbanAPI(str(panel.make_url("/")), "admin", "admin")
+    try:
+        body = await api.user_subscription(token, user_agent="v2rayNG/1.8")
+        assert base64.b64decode(body).decode() == links
+
+        content = await api.user_subscription(token, raw=True)
+        assert isinstance(content, SubscriptionContent)
+        assert content.headers["profile-update-interval"] == "12"
+
+        assert await api.user_subscription_with_client_type("sing-box", token) == {"outbounds": []}
+        assert await api.user_subscription_with_client_type("clash", token) == "proxies: []\n"
+    finally:
+        await panel.close()
+
+
+async def test_stream_subscription():
+    panel = TestServer(create_panel())
+    await panel.start_server()
+    api = MarzbanAPI(str(panel.make_url("/")), "admin", "admin")
+    writer = Writer()
+    received_headers = []
+    try:
+        content = await api.stream_subscription(
+            token, writer, on_headers=lambda c: received_headers.append(c.headers), chunk_size=4096,
+        )
+    finally:
+        await panel.close()
+
+    assert len(writer.chunks) > 1
+    assert max(len(chunk) for chunk in writer.chunks) <= 4096
+    assert base64.b64decode(b"".join(writer.chunks)).decode() == links
+    assert received_headers == [content.headers]
+    assert content.body == b""
+
+
+async def test_stream_subscription_is_not_repeated_after_headers():
+    async def stalled(request):
+        response = web.StreamResponse(headers=headers)
+        await response.prepare(request)
+        await response.write(b"vless://")
+        await asyncio.sleep(10)
+        return response
+
+    app = web.Application()
+    app.router.add_get("/sub/{token}", stalled)
+    panel = TestServer(app)
+    await panel.start_server()
+    api = MarzbanAPI(str(panel.make_url("/")), "admin", "admin", retries=2)
+    writer = Writer()
+    received_headers = []
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await api.stream_subscription(token, writer, on_headers=received_headers.append, timeout=0.2)
+    finally:
+        await panel.close()
+
+    assert len(received_headers) == 1
+    assert b"".join(writer.chunks) == b"vless://"
@@ -0,0 +1,86 @@
+from aiomarzban import NodeSupervisor, NodeStatus
+from aiomarzban.models import NodeResponse
+
+
+class NodesSource:
+    def __init__(self):
+        self.statuses = {1: NodeStatus.connected, 2: NodeStatus.connected}
+        self.reconnected = []
+
+    async def get_nodes(self):
+        return [
+            NodeResponse(id=node_id, name=f"Node {node_id}", address="1.1.1.1", status=status)
+            for node_id, status in self.statuses.items()
+        ]
+
+    async def reconnect_node(self, node_id: int):
+        self.reconnected.append(node_id)
+
+
+async def test_reconnect_with_backoff_and_recovery_metrics():
+    source = NodesSource()
+    events = []
+    supervisor = NodeSupervisor(source, base_backoff=10, jitter=0, on_event=events.append)
+
+    await supervisor.tick(now=0)
+    source.statuses[1] = NodeStatus.error
+    await supervisor.tick(now=1)
+    await supervisor.wait_reconnects()
+    assert source.reconnected == [1]
+    assert events[0].old_status == NodeStatus.connected and events[0].new_status == NodeStatus.error
+
+    # Backoff: no new attempt before 10 seconds pass, then the delay doubles
+    await supervisor.tick(now=5)
+    await supervisor.wait_reconnects()
+    assert source.reconnected == [1]
+    await supervisor.tick(now=11)
+    await supervisor.wait_reconnects()
+    assert source.reconnected == [1, 1]
+    await supervisor.tick(now=25)
+    await supervisor.wait_reconnects()
+    assert source.reconnected == [1, 1]
+
+    source.statuses[1] = NodeStatus.connected
+    events = await supervisor.tick(now=31)
+    assert events[0].recovery_time == 30
+    stats = supervisor.stats(1)
+    assert stats.recoveries == 1
+    assert stats.reconnect_attempts == 2
+
+
+async def test_flapping_node_is_suppressed():
+    source = NodesSource()
+    supervisor = NodeSupervisor(source, base_backoff=0, flap_penalty=1000, suppress_limit=2500)
+    await supervisor.tick(now=0)
+
+    for now in range(1, 7):
+        source.statuses[2] = NodeStatus.error if now % 2 else NodeStatus.connected
+        await supervisor.tick(now=now)
+        await supervisor.wait_reconnects()
+
+    assert source.reconnected == [2, 2]
+    assert supervisor.stats(2).suppressed
+
+
+async def test_failing_reconnects_keep_backoff_and_are_not_flaps():
+    source = NodesSource()
+    supervisor = NodeSupervisor(source, base_backoff=10, jitter=0, flap_penalty=1000, suppress_limit=2500)
+    await supervisor.tick(now=0)
+    source.statuses[1] = NodeStatus.error
+    await supervisor.tick(now=1)
+    await supervisor.wait_reconnects()
+
+    # Every reconnect attempt goes through "connecting" and fails again
+    for now in (2, 11, 12, 31, 32, 71):
+        source.statuses[1] = NodeStatus.error if now % 2 else NodeStatus.connecting
+        await supervisor.tick(now=now)
+        await supervisor.wait_reconnects()
+
+    assert source.reconnected == [1, 1, 1, 1]
+    stats = supervisor.stats(1)
+    assert stats.failures == 4
+    assert stats.penalty <= 1000 and not stats.suppressed
+
+    source.statuses[1] = NodeStatus.connected
+    events = await supervisor.tick(now=80)
+    assert events[0].recovery_time == 79
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+import pytest
+
+from aiomarzban import SyncMarzbanAPI
+from aiomarzban.models import UserResponse
+from aiomarzban.testing import FakeMarzban
+
+
+def test_sync_client_from_many_threads():
+    panel = FakeMarzban()
+    address = panel.start_in_thread()
+    try:
+        with SyncMarzbanAPI(address, "admin", "admin") as api:
+            user = api.add_user("john", data_limit=1)
+            assert isinstance(user, UserResponse)
+            assert api.get_user.__doc__ == api.api.get_user.__doc__
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                users = list(executor.map(lambda i: api.get_user("john"), range(50)))
+            assert {item.username for item in users} == {"john"}
+            # One login and one connection pool for all calls
+            assert len(panel.tokens) == 1
+            assert api.api.session is not None
+
+            with pytest.raises(Exception, match="User not found"):
+                api.get_user("unknown")
+        with pytest.raises(RuntimeError):
+            api.get_user("john")
+    finally:
+        panel.stop_thread()
+
+
+def test_sync_client_cold_start_logs_in_once():
+    panel = FakeMarzban()
+    address = panel.start_in_thread()
+    try:
+        api = SyncMarzbanAPI(address, "admin", "admin")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: api.get_system_stats(), range(8)))
+        assert len(panel.tokens) == 1
+
+        # Calls racing with close either finish or fail, but never hang
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(api.get_system_stats) for _ in range(50)]
+            api.close()
+            for future in futures:
+                try:
+                    future.result(timeout=5)
+                except (RuntimeError, CancelledError):
+                    pass
+    finally:
+        panel.stop_thread()
@@ -1,9 +1,8 @@
 import copy
 import json
 import os
-import time
 
-from tests.conftest import get_api_client
+from tests.conftest import get_api_client, wait
 
 original_hosts = None
 
@@ -40,6 +39,6 @@ async def test_modify_hosts(get_api_client):
     assert updated_hosts != new_hosts, "Hosts were not modified."
 
     # Settings original hosts
-    time.sleep(0.5)
+    wait(0.5)
     restored_hosts = await api_client.modify_hosts(original_hosts)
     assert restored_hosts == original_hosts, "Hosts were not restored to original."
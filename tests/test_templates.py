@@ -0,0 +1,39 @@
+import pytest
+
+from aiomarzban import MarzbanAPI, MarzbanNotFoundException
+from aiomarzban.testing import FakeMarzban
+from aiomarzban.utils import current_unix_utc_time
+
+
+async def test_add_users_from_template():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        template = await api.add_user_template(
+            name="monthly", data_limit=30, expire_duration=30 * 86400, username_prefix="shop_", username_suffix="_m",
+        )
+
+        users = await api.add_users_from_template("monthly", ["alice", "bob"], note="batch 1")
+        assert [user.username for user in users] == ["shop_alice_m", "shop_bob_m"]
+        assert users[0].data_limit == 30 * 1024 ** 3
+        assert users[0].note == "batch 1"
+        assert abs(users[0].expire - current_unix_utc_time() - 30 * 86400) < 5
+
+        requests = panel.requests
+        users = await api.add_users_from_template(template.id, 50, concurrency=5, on_hold=True)
+        # The template is cached: only add_user requests are sent
+        assert panel.requests - requests == 50
+        assert len({user.username for user in users}) == 50
+        assert all(user.status == "on_hold" and user.expire is None for user in users)
+
+        with pytest.raises(Exception, match="User already exists"):
+            await api.add_users_from_template("monthly", ["alice", "carol"])
+        results = await api.add_users_from_template("monthly", ["alice", "dave"], return_exceptions=True)
+        assert isinstance(results[0], Exception) and results[1].username == "shop_dave_m"
+
+        await api.modify_user_template(template.id, username_prefix="vip_")
+        users = await api.add_users_from_template("monthly", ["erin"])
+        assert users[0].username == "vip_erin_m"
+
+        with pytest.raises(MarzbanNotFoundException):
+            await api.add_users_from_template("yearly", 1)
+        await api.close()
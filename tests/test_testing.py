@@ -0,0 +1,73 @@
+import base64
+
+import pytest
+
+from aiomarzban import MarzbanAPI
+from aiomarzban.testing import FakeMarzban
+from aiomarzban.utils import future_unix_time
+
+
+async def test_fake_panel_auth_and_errors():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "wrong")
+        with pytest.raises(Exception, match="Incorrect username or password"):
+            await api.get_current_admin()
+
+        api = MarzbanAPI(panel.address, panel.admin_username, panel.admin_password)
+        await api.add_user("expired", expire=future_unix_time(days=-1))
+        assert await api.get_expired_users() == ["expired"]
+        assert (await api.get_system_stats()).users_expired == 1
+
+        panel.expire_tokens()
+        user = await api.get_user("expired")
+        assert user.status == "expired"
+        with pytest.raises(Exception, match="User already exists"):
+            await api.add_user("expired")
+        await api.close()
+
+
+async def test_request_is_repeated_with_params_after_relogin():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, panel.admin_username, panel.admin_password)
+        for username in ("user_1", "user_2", "user_3"):
+            await api.add_user(username)
+
+        panel.expire_tokens()
+        page = await api.get_users(username=["user_2"])
+        assert [user.username for user in page.users] == ["user_2"]
+        await api.close()
+
+async def test_fake_panel_subscription():
+    async with FakeMarzban(links_per_user=2) as panel:
+        api = MarzbanAPI(panel.address, panel.admin_username, panel.admin_password)
+        user = await api.add_user("sub_user", data_limit=1)
+        panel.add_traffic("sub_user", 100, 200)
+        token = user.subscription_url.rsplit("/", 1)[-1]
+
+        content = await api.user_subscription(token)
+        assert base64.b64decode(content).decode().splitlines() == user.links
+        assert len(user.links) == 2
+        info = await api.user_subscription_info(token)
+        assert info.used_traffic == 300
+
+        revoked = await api.revoke_user_subscription("sub_user")
+        assert revoked.subscription_url != user.subscription_url
+        with pytest.raises(Exception):
+            await api.user_subscription_info(token)
+        await api.close()
+
+
+async def test_fake_panel_validates_on_hold_users():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, panel.admin_username, panel.admin_password)
+        with pytest.raises(Exception, match="without a valid on_hold_expire_duration"):
+            await api.add_user("held", status="on_hold")
+        with pytest.raises(Exception, match="on hold with specified expire"):
+            await api.add_user("held", status="on_hold", on_hold_expire_duration=60, expire=future_unix_time(days=1))
+        await api.add_user("held", status="on_hold", on_hold_expire_duration=60)
+        assert panel.users["held"]["on_hold_expire_duration"] == 60
+
+        await api.add_user("active_user")
+        with pytest.raises(Exception, match="without a valid on_hold_expire_duration"):
+            await api.modify_user("active_user", status="on_hold")
+        await api.close()
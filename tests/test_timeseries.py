@@ -0,0 +1,93 @@
+import datetime
+
+from aiomarzban import NodeTrafficCollector, TrafficRingBuffer
+from aiomarzban.models import NodesUsageResponse, NodeUsageResponse
+
+
+class UsageSource:
+    def __init__(self):
+        self.counters = {"Master": [0, 0], "Node 1": [0, 0]}
+        self.starts = []
+
+    async def get_nodes_usage(self, start: str = "", end: str = "") -> NodesUsageResponse:
+        self.starts.append(start)
+        return NodesUsageResponse(usages=[
+            NodeUsageResponse(node_name=name, uplink=up, downlink=down)
+            for name, (up, down) in self.counters.items()
+        ])
+
+
+class WindowedUsageSource:
+    """
+    Like the panel: hourly usage rows, without `start` only rows of the last `window` seconds are summed.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.now = 0
+        self.rows = []
+
+    async def get_nodes_usage(self, start: str = "", end: str = "") -> NodesUsageResponse:
+        since = self.now - self.window if not start else datetime.datetime.fromisoformat(start).timestamp()
+        used = sum(amount for timestamp, amount in self.rows if timestamp >= since)
+        return NodesUsageResponse(usages=[NodeUsageResponse(node_name="Node 1", uplink=used, downlink=used)])
+
+
+def test_ring_buffer_accumulates_and_wraps():
+    buffer = TrafficRingBuffer(resolution=60, capacity=3)
+    buffer.add(0, 1, 2)
+    buffer.add(30, 1, 2)
+    assert buffer.range(0, 59) == [(0, 2, 4)]
+
+    for minute in range(1, 5):
+        buffer.add(minute * 60, 10, 20)
+    assert [bucket[0] for bucket in buffer.range(0, 300)] == [120, 180, 240]
+    assert buffer.total(0, 300) == (30, 60)
+
+    nbytes = buffer.nbytes
+    buffer.add(10 ** 6, 1, 1)
+    assert buffer.nbytes == nbytes
+
+
+async def test_collector_deltas_and_rates():
+    source = UsageSource()
+    collector = NodeTrafficCollector(source, tiers={1: 30, 60: 10})
+
+    await collector.sample(timestamp=100)
+    source.counters["Node 1"] = [1000, 5000]
+    await collector.sample(timestamp=110)
+    source.counters["Node 1"] = [1500, 5500]
+    await collector.sample(timestamp=120)
+
+    assert collector.query("Node 1", 100, 120, resolution=1) == [(110, 1000, 5000), (120, 500, 500)]
+    assert collector.query("Node 1", 60, 120, resolution=60) == [(60, 1000, 5000), (120, 500, 500)]
+    assert collector.rate("Node 1") == (50.0, 50.0)
+    assert collector.query("Master", 100, 120) == [(110, 0, 0), (120, 0, 0)]
+
+    # Counter reset starts a new baseline instead of producing negative traffic
+    source.counters["Node 1"] = [100, 100]
+    await collector.sample(timestamp=121)
+    assert collector.query("Node 1", 121, 121, resolution=1) == []
+
+
+async def test_collector_requests_usage_from_fixed_start():
+    source = UsageSource()
+    collector = NodeTrafficCollector(source)
+    await collector.sample(timestamp=100)
+    await collector.sample(timestamp=110)
+    assert source.starts[0] and source.starts == [collector.usage_start] * 2
+    assert datetime.datetime.fromisoformat(collector.usage_start).minute == 0
+
+
+async def test_collector_is_not_affected_by_usage_window():
+    source = WindowedUsageSource(window=3 * 3600)
+    source.rows = [(0, 10 ** 6), (3600, 10 ** 6)]
+    collector = NodeTrafficCollector(source, tiers={3600: 10}, usage_start="1970-01-01T00:00:00+00:00")
+    for hour in range(2, 6):
+        source.now = hour * 3600
+        source.rows.append((source.now, 1000))
+        await collector.sample(timestamp=source.now)
+    # A rolling window would drop the old rows, shrinking the counter and losing these hours
+    assert collector.query("Node 1", 3 * 3600, 5 * 3600, resolution=3600) == [
+        (3 * 3600, 1000, 1000), (4 * 3600, 1000, 1000), (5 * 3600, 1000, 1000),
+    ]
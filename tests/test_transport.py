@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from aiomarzban import MarzbanAPI, AiohttpTransport, MetricsRegistry, Transport
+from aiomarzban.models import AdminCreate
+from aiomarzban.testing import FakeMarzban
+from aiomarzban.transport import Request, TransportConnectError
+
+
+class CountingTransport(AiohttpTransport):
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def send(self, request):
+        self.requests.append(request.route)
+        return await super().send(request)
+
+
+class Writer:
+    def __init__(self):
+        self.chunks = []
+
+    async def write(self, data: bytes):
+        self.chunks.append(data)
+
+
+class Unreachable(Transport):
+    def __init__(self):
+        self.attempts = 0
+
+    async def send(self, request):
+        self.attempts += 1
+        raise TransportConnectError("unreachable")
+
+
+async def test_custom_transport():
+    async with FakeMarzban(links_per_user=2) as panel, CountingTransport() as transport:
+        api = MarzbanAPI(panel.address, "admin", "admin", transport=transport)
+        user = await api.add_user("john")
+        token = user.subscription_url.rsplit("/", 1)[-1]
+        content = await api.user_subscription(token, raw=True)
+        assert content.headers["profile-update-interval"] == "12"
+        assert transport.requests == ["/admin/token", "/user", "/sub/{token}"]
+        session = transport.session
+    assert session.closed
+
+
+async def test_transport_connect_error_is_retried():
+    with pytest.raises(TypeError):
+        Transport()
+    transport = Unreachable()
+    api = MarzbanAPI("http://127.0.0.1/", "admin", "admin", transport=transport, retries=2)
+    api.headers = {"Authorization": "Bearer token"}
+    with pytest.raises(TransportConnectError):
+        await api.get_system_stats()
+    assert transport.attempts == 3
+
+
+async def test_httpx_transport():
+    pytest.importorskip("httpx")
+    from aiomarzban import HttpxTransport
+
+    async with FakeMarzban() as panel, HttpxTransport() as transport:
+        api = MarzbanAPI(panel.address, "admin", "admin", transport=transport)
+        await api.add_user("john")
+        user = await api.get_user("john")
+        assert user.username == "john"
+        token = user.subscription_url.rsplit("/", 1)[-1]
+        writer = Writer()
+        await api.stream_subscription(token, writer, chunk_size=16)
+        assert len(writer.chunks) > 1
+
+
+async def test_request_route_and_sent_size():
+    request = Request("GET", url="http://panel/sub/dG9rZW4/info", path="/sub/dG9rZW4/info", sub_path="sub")
+    assert request.route == "/sub/{token}/info"
+    assert Request("GET", url="http://panel/api/user/john", path="/user/john").route == "/user/{username}"
+
+    async with FakeMarzban() as panel:
+        metrics = MetricsRegistry()
+        api = MarzbanAPI(panel.address, "admin", "admin", metrics=metrics)
+        await api.create_admin("bob", "secret")
+        await api.close()
+    routes = {(item.method, item.route): item for item in metrics.routes()}
+    body = AdminCreate(username="bob", password="secret", is_sudo=False).model_dump()
+    assert routes[("POST", "/admin")].bytes_sent == len(json.dumps(body))
@@ -1,8 +1,6 @@
-import time
-
 from aiomarzban.enums import UserStatus, UserDataLimitResetStrategy
 from aiomarzban.utils import future_unix_time, gb_to_bytes
-from tests.conftest import get_api_client
+from tests.conftest import get_api_client, wait
 
 user_username = "Test_user"
 user_expire = future_unix_time(days=1)
@@ -118,12 +116,12 @@ async def test_set_owner(get_api_client):
     current_admin = await api_client.get_current_admin()
     assert user.admin.username == current_admin.username
 
-    time.sleep(0.5)
+    wait(0.5)
     new_admin = await api_client.create_admin(username="second", password="<PASSWORD>")
     user = await api_client.set_owner(username=user_username, admin_username=new_admin.username)
     assert user.admin.username == new_admin.username
 
-    time.sleep(0.5)
+    wait(0.5)
     await api_client.set_owner(username=user_username, admin_username=current_admin.username)
     await api_client.remove_admin(new_admin.username)
 
@@ -139,7 +137,7 @@ async def test_add_expired_user(get_api_client):
         expire=expired_user_expire,
         proxies=user_proxies,
     )
-    time.sleep(10)  # Delay between creating expired user and changing its status to expired
+    wait(10)  # Delay between creating expired user and changing its status to expired
 
 
 async def test_get_expired_users(get_api_client):
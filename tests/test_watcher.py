@@ -0,0 +1,55 @@
+from aiomarzban import MarzbanAPI, QuotaWatcher
+from aiomarzban.testing import FakeMarzban
+
+GB = 1024 ** 3
+
+
+async def test_watcher_polls_heavy_users_often():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        for i in range(50):
+            await api.add_user(f"user{i}", data_limit=10)
+        await api.add_user("unlimited")
+        panel.add_traffic("user1", 9 * GB, 0)
+
+        alerts = []
+        clock = 0
+        watcher = QuotaWatcher(
+            api, min_interval=30, full_scan_interval=600, batch_size=10,
+            on_alert=lambda alert: alerts.append((alert.username, alert.threshold, clock)),
+        )
+        await watcher.tick(now=clock)
+        assert alerts == []  # user1 was over 80% before the watcher started
+        assert watcher.next_poll("unlimited") is None
+
+        for clock in range(30, 3600, 30):
+            panel.add_traffic("user2", GB // 10, 0)  # crosses 8, 9 and 10 GB at 2400, 2700 and 3000 seconds
+            panel.add_traffic("user3", GB // 1000, 0)
+            await watcher.tick(now=clock)
+
+        assert [alert[:2] for alert in alerts] == [("user2", 0.8), ("user2", 0.9), ("user2", 1.0)]
+        # Detected within a tick or two of crossing
+        assert all(second - crossed <= 60 for (_, _, second), crossed in zip(alerts, (2400, 2700, 3000)))
+        assert abs(watcher.rate("user2") - GB / 10 / 30) < GB / 10 / 30 * 0.01
+        # Slow users are only checked by full scans (every 600 seconds)
+        assert watcher.next_poll("user3") == 3600
+        # 6 full scans and polls of user2 near its thresholds, instead of 119 full scans
+        assert watcher.requests < 40, watcher.requests
+        await api.close()
+
+
+async def test_watcher_rearms_after_reset():
+    async with FakeMarzban() as panel:
+        api = MarzbanAPI(panel.address, "admin", "admin")
+        await api.add_user("john", data_limit=1)
+        alerts = []
+        watcher = QuotaWatcher(api, thresholds=(0.5,), on_alert=alerts.append)
+        await watcher.tick(now=0)
+        panel.add_traffic("john", GB, 0)
+        await watcher.tick(now=2000)
+        await api.reset_user_usage_data("john")
+        await watcher.tick(now=4000)
+        panel.add_traffic("john", GB, 0)
+        await watcher.tick(now=6000)
+        assert [alert.username for alert in alerts] == ["john", "john"]
+        await api.close()